@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+"""
+基准测试的基线：每个测试项的耗时（秒）保存在baselines.json中，按测试脚本分组。
+基线和机器有关，换机器后先用--update重新生成
+"""
+
+import os
+import json
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# 比基线慢这个倍数，并且多用的时间超过MIN_DELTA（秒）才算退化：
+# 几毫秒的测试项受调度和缓存影响，倍数很容易超过TOLERANCE，只比倍数会误报
+TOLERANCE = 1.5
+MIN_DELTA = 0.005
+
+
+def loadBaselines(group):
+    if not os.path.exists(BASELINE_PATH):
+        return dict()
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f).get(group, dict())
+
+
+def saveBaselines(group, results):
+    data = dict()
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    data[group] = {name: round(seconds, 6) for name, seconds in results.items()}
+    with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, sort_keys=True, indent=4) + "\n")
+
+
+def isRegression(seconds, base, tolerance=TOLERANCE, minDelta=MIN_DELTA):
+    return seconds > base * tolerance and seconds - base > minDelta
+
+
+def findRegressions(group, results, tolerance=TOLERANCE, minDelta=MIN_DELTA):
+    """
+    比基线慢的测试项，不打印
+    """
+    baselines = loadBaselines(group)
+    return [
+        name for name, seconds in results.items()
+        if name in baselines and isRegression(seconds, baselines[name], tolerance, minDelta)
+    ]
+
+
+def report(group, results, update=False, tolerance=TOLERANCE, minDelta=MIN_DELTA):
+    """
+    打印结果和基线的对比，update为True时把结果保存为新的基线，返回退化的测试项
+    """
+    baselines = dict() if update else loadBaselines(group)
+    regressions = []
+    print("{:<40}{:>12}{:>12}{:>8}".format("benchmark", "time(ms)", "base(ms)", "ratio"))
+    for name, seconds in results.items():
+        base = baselines.get(name)
+        if base is None:
+            print("{:<40}{:>12.3f}{:>12}{:>8}".format(name, seconds * 1000, "-", "-"))
+            continue
+        ratio = seconds / base if base else float("inf")
+        slower = isRegression(seconds, base, tolerance, minDelta)
+        if slower:
+            regressions.append(name)
+        print("{:<40}{:>12.3f}{:>12.3f}{:>8.2f}{}".format(
+            name, seconds * 1000, base * 1000, ratio, "  REGRESSION" if slower else ""
+        ))
+    if update:
+        saveBaselines(group, results)
+        print("baselines saved to {}".format(BASELINE_PATH))
+    return regressions
+
+
+def addArguments(parser):
+    parser.add_argument("--update", action="store_true", help="save the results as new baselines")
+    parser.add_argument(
+        "--tolerance", type=float, default=TOLERANCE, help="fail when slower than baseline * tolerance"
+    )
+    parser.add_argument(
+        "--min-delta", type=float, default=MIN_DELTA,
+        help="and slower than baseline by more than MIN_DELTA seconds, smaller differences are noise"
+    )
@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+"""
+结果比较：和保存的结果（默认10MB）比较的耗时，包括结果相同（文本相同，rpc返回的key顺序不同时文本也相同），
+对象相同，分散的修改，key顺序不同（保存的结果按key排序）和数组中间插入，和逐个节点比较的对比。
+最慢的一种超过--budget（秒）时返回非0，结果相同的比较不能比保存的基准慢
+用法：python benchmarks/bench_diff.py [--mb 10] [--changes 100] [--repeat 3] [--budget 1.0] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import collections
+
+import workspace  # noqa: F401
+from baseline import report, addArguments
+
+import utils
+import constants as const
+from jsondiff import diff, diffResult
+
+GROUP = "diff"
+
+
+def generateRecord(i):
+    return {
+        "id": i, "name": "user_{}".format(i), "score": i * 1.5, "active": i % 2 == 0, "tags": ["a", "b", "c"],
+        "address": {"city": "city_{}".format(i % 100), "zip": "{:05d}".format(i), "lines": ["l1", "l2"]},
+        "orders": [{"no": j, "amount": j * 2.25} for j in range(3)],
+    }
+
+
+def generateResult(mb):
+    count = int(mb * 1000000 / len(utils.objectToJsonStr(generateRecord(0))))
+    return {"code": 0, "data": [generateRecord(i) for i in range(count)]}
+
+
+def walkDiff(old, new, path, differences):
+    """
+    不跳过相同子树的比较：逐个节点比较，作为对比
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old.keys() | new.keys():
+            if key not in old or key not in new:
+                differences.append(path + (key,))
+            else:
+                walkDiff(old[key], new[key], path + (key,), differences)
+    elif isinstance(old, list) and isinstance(new, list):
+        for i in range(max(len(old), len(new))):
+            if i >= len(old) or i >= len(new):
+                differences.append(path + (i,))
+            else:
+                walkDiff(old[i], new[i], path + (i,), differences)
+    elif type(old) is not type(new) or old != new:
+        differences.append(path)
+    return differences
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="result diff benchmark with stored baselines")
+    parser.add_argument("--mb", type=float, default=10, help="size of the formatted result")
+    parser.add_argument("--changes", type=int, default=100, help="changed records")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0, help="max seconds per diff")
+    addArguments(parser)
+    args = parser.parse_args()
+
+    # 保存的结果从格式化文本读取，key是排序的；rpc返回的结果保持服务端的key顺序
+    text = utils.objectToJsonStr(generateResult(args.mb))
+    ref = {const.BLOB_REF: hashlib.sha256(text.encode("utf-8")).hexdigest()}
+    stored = json.loads(text)
+    changed = generateResult(args.mb)
+    records = changed["data"]
+    for i in range(0, len(records), max(1, len(records) // max(1, args.changes))):
+        records[i]["address"]["city"] = "changed"
+    inserted = generateResult(args.mb)
+    inserted["data"].insert(len(records) // 2, generateRecord(-1))
+
+    def load(obj):
+        return json.loads(utils.objectToJsonStr(obj))
+
+    same, changedStored, inserted = json.loads(text), load(changed), load(inserted)
+    identical = generateResult(args.mb)
+    results = collections.OrderedDict()
+    results["same text"] = timed(lambda: diffResult(ref, None, text, same), args.repeat)
+    results["identical result, rpc key order"] = timed(lambda: diffResult(ref, None, text, identical), args.repeat)
+    results["same objects"] = timed(lambda: diff(stored, same), args.repeat)
+    results["{} changes".format(args.changes)] = timed(lambda: diff(stored, changedStored), args.repeat)
+    results["{} changes, rpc key order".format(args.changes)] = timed(lambda: diff(stored, changed), args.repeat)
+    results["insert into list"] = timed(lambda: diff(stored, inserted), args.repeat)
+    results["walk every node (before)"] = timed(lambda: walkDiff(stored, changedStored, (), []), args.repeat)
+
+    key = "{:g}MB".format(args.mb)
+    results = collections.OrderedDict(("{} {}".format(key, name), seconds) for name, seconds in results.items())
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    overBudget = [name for name, seconds in results.items() if "before" not in name and seconds > args.budget]
+    for name in overBudget:
+        print("Over budget ({:.1f}s): {}".format(args.budget, name))
+    sys.exit(1 if regressions or overBudget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+"""
+热点函数的微基准：utils.objectToJsonStr，utils.strToJsonStr，Storage.save/loadData，FolderWidget.loadFromFile，
+每项取多次执行的最小值，和baselines.json对比，有退化时返回非0
+用法：python benchmarks/bench_micro.py [--methods 10000] [--repeat 5] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import collections
+
+from workspace import generateWorkspace, writeWorkspace
+from baseline import report, addArguments
+
+import utils
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+GROUP = "micro"
+
+
+def best(func, repeat):
+    costs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        costs.append(time.perf_counter() - start)
+    return min(costs)
+
+
+def makeResult(size):
+    """
+    大约size字节的rpc结果，结构类似常见的列表接口
+    """
+    item = {"id": 1, "name": "user", "email": "user@example.com", "tags": ["a", "b", "c"], "score": 1.5}
+    count = max(1, size // len(json.dumps(item)))
+    return {"success": True, "total": count, "items": [dict(item, id=i) for i in range(count)]}
+
+
+def benchJson(results, repeat):
+    for label, size in (("1KB", 1024), ("1MB", 1024 * 1024)):
+        result = makeResult(size)
+        text = utils.objectToCompactJsonStr(result)
+        results["objectToJsonStr {}".format(label)] = best(lambda: utils.objectToJsonStr(result), repeat)
+        results["strToJsonStr {}".format(label)] = best(lambda: utils.strToJsonStr(text), repeat)
+    # 不是合法json时走字符替换
+    text = "{'id'： 1，'name'： “user”，'tags'： 【1, 2】}" * 1000
+    results["strToJsonStr invalid 40KB"] = best(lambda: utils.strToJsonStr(text), repeat)
+
+
+def benchStorage(results, repeat, methods, tmp):
+    from storage import Storage
+
+    path = os.path.join(tmp, "namekoman.json")
+    writeWorkspace(path, generateWorkspace(methods))
+    storage = Storage(path)
+    key = "{}k methods".format(methods // 1000)
+    results["Storage.loadData {}".format(key)] = best(storage.loadData, repeat)
+
+    def save():
+        storage.save()
+        storage.flush()
+    results["Storage.save {}".format(key)] = best(save, repeat)
+    storage.close()
+    return path
+
+
+def benchFolderWidget(results, repeat, methods, path):
+    from PyQt5.QtCore import QSettings
+    from PyQt5.QtWidgets import QApplication
+
+    import namekoman
+    import constants as const
+    from storage import createStorage
+
+    app = QApplication.instance() or QApplication([])
+    # 使用单独的设置，不影响真实的展开状态
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, os.path.dirname(path))
+    QSettings(const.SETTINGS_ORGANIZATION, const.SETTINGS_APPLICATION).remove(const.SETTINGS_EXPANDED)
+    namekoman.storage.close()
+    namekoman.storage = createStorage(path)
+    widget = namekoman.FolderWidget()
+
+    def load():
+        widget.treeView.setModel(namekoman.FolderTreeModel())
+        widget.loadFromFile()
+    results["FolderWidget.loadFromFile {}k methods".format(methods // 1000)] = best(load, repeat)
+    namekoman.storage.close()
+    app.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="micro benchmarks with stored baselines")
+    parser.add_argument("--methods", type=int, default=10000, help="methods in the generated workspace")
+    parser.add_argument("--repeat", type=int, default=5)
+    addArguments(parser)
+    args = parser.parse_args()
+
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        benchJson(results, args.repeat)
+        path = benchStorage(results, args.repeat, args.methods, tmp)
+        benchFolderWidget(results, args.repeat, args.methods, path)
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
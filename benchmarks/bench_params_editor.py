@@ -0,0 +1,101 @@
+# -*- coding:utf-8 -*-
+"""
+params编辑器：大params（默认5万行）每次按键，校验，格式化，发送取params时ui线程的耗时，
+和原来在ui线程中同步格式化，发送时重新解析的对比。后台线程的耗时单独列出，不计入ui线程
+用法：python benchmarks/bench_params_editor.py [--lines 50000] [--repeat 3] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+
+import workspace  # noqa: F401
+from baseline import report, addArguments
+
+import utils
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+GROUP = "params_editor"
+# 每条记录格式化后的行数
+RECORD_LINES = 8
+
+
+def generateParams(lines):
+    records = [
+        {"id": i, "name": "record_{}".format(i), "tags": ["a", "b"], "enabled": i % 2 == 0}
+        for i in range(lines // RECORD_LINES)
+    ]
+    return {"records": records}
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def runInBackground(app, editor, start):
+    """
+    返回(ui线程耗时, 总耗时)：ui线程耗时只包括发起解析和应用结果，不包括等待后台线程
+    """
+    begin = time.perf_counter()
+    ui = timed(start)
+    editor.parseThread.wait()
+    ui += timed(app.processEvents)
+    return ui, time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="params editor benchmark with stored baselines")
+    parser.add_argument("--lines", type=int, default=50000, help="lines of the formatted params")
+    parser.add_argument("--repeat", type=int, default=3)
+    addArguments(parser)
+    args = parser.parse_args()
+
+    from PyQt5.QtWidgets import QApplication
+    from paramseditor import NamekoManQsciScintilla
+
+    app = QApplication([])
+    editor = NamekoManQsciScintilla()
+    params = generateParams(args.lines)
+    compact = utils.objectToCompactJsonStr(params)
+    results = collections.OrderedDict()
+
+    def best(name, func):
+        results[name] = min(func() for _ in range(args.repeat))
+
+    editor.setParams(params)
+    best("keystroke", lambda: timed(lambda: editor.insertAt(" ", 0, 0)))
+    editor.parseTimer.stop()
+    best("validate ui thread", lambda: runInBackground(app, editor, editor.startParse)[0])
+    best("validate total", lambda: runInBackground(app, editor, editor.startParse)[1])
+
+    def reformat(index):
+        editor.setText(compact)
+        return runInBackground(app, editor, lambda: editor.startParse(reformat=True))[index]
+
+    best("reformat ui thread", lambda: reformat(0))
+    best("reformat total", lambda: reformat(1))
+
+    def reformatSync():
+        editor.setText(compact)
+        return timed(lambda: editor.setText(utils.strToJsonStr(editor.text())))
+
+    best("reformat sync (before)", reformatSync)
+    editor.parseTimer.stop()
+    best("send cached params", lambda: timed(editor.getParams))
+    best("send parse params (before)", lambda: timed(lambda: json.loads(editor.text())))
+
+    key = "{}k lines".format(args.lines // 1000)
+    results = collections.OrderedDict(("{} {}".format(key, name), seconds) for name, seconds in results.items())
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    app.quit()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
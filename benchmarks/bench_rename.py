@@ -0,0 +1,64 @@
+# -*- coding:utf-8 -*-
+"""
+重命名回归测试：一个project下有2万个方法，全部展开后分别重命名project，service，module，method
+重命名只修改一个节点和storage中的一个key，耗时不应随子树大小增长，超过阈值时返回非0
+用法：python benchmarks/bench_rename.py [methods] [threshold_ms]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from workspace import generateWorkspace, writeWorkspace
+
+import constants as const
+
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtWidgets import QApplication
+
+
+def fetchAll(model, parent=QModelIndex()):
+    model.fetchMore(parent)
+    for row in range(model.rowCount(parent)):
+        fetchAll(model, model.index(row, 0, parent))
+
+
+def main():
+    methods = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    app = QApplication([])
+
+    import namekoman
+    from storage import createStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "namekoman.json")
+        writeWorkspace(path, generateWorkspace(methods, projects=1))
+        namekoman.storage = createStorage(path)
+        widget = namekoman.FolderWidget()
+        model = widget.treeView.model()
+        fetchAll(model)
+
+        project = model.root.child(0)
+        service = project.child(0)
+        module = service.child(0)
+        method = module.child(0)
+        print("methods under project: {}".format(sum(1 for node in model.iterFetchedNodes(project)
+                                                     if node.getType() == const.NODE_METHOD)))
+        failed = False
+        for node in (project, service, module, method):
+            start = time.time()
+            ok = node.updateName(node.getName() + "_renamed")
+            model.nodeChanged(node)
+            cost = (time.time() - start) * 1000
+            failed = failed or not ok or cost > threshold
+            print("rename {:<8}{:>10.3f} ms  {}".format(node.getType(), cost, "ok" if ok else "failed"))
+        assert method.getPath() == (project.getName(), service.getName(), module.getName(), method.getName())
+        namekoman.storage.close()
+    app.quit()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+"""
+发送请求的完整路径：onSendRpc -> Dispatcher工作线程（rpc，格式化，保存结果）-> onSendRpcFinished -> showResult，
+服务端是进程内的FakeService（memory://），测到的是namekoman自身的开销，不包括网络和真实服务。
+每个workspace大小在单独的进程里运行，每种结果大小先发送一次预热，再发送多次取中位数，和baselines.json对比，有退化时返回非0。
+--update时默认发送UPDATE_REPEAT次，基线更稳定；比基线慢的workspace重新测量，最多--retries次，每项取最快的一次
+用法：python benchmarks/bench_request_path.py [--methods 1000 10000 100000] [--sizes 1024 1048576 52428800]
+      [--repeat 3] [--retries 2] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import collections
+
+from workspace import generateWorkspace, writeWorkspace
+from baseline import report, addArguments, findRegressions
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+GROUP = "request_path"
+SIZES = (1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024)
+STAGES = ("queue", "rpc", "serialize", "store", "render", "ui", "total")
+REPEAT = 3
+UPDATE_REPEAT = 9
+RETRIES = 2
+
+
+def formatSize(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return "{}{}".format(size, unit) if unit == "B" else "{:g}{}".format(size, unit)
+        size /= 1024
+
+
+def waitUntil(app, predicate, timeout=60):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise RuntimeError("Timeout")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def child(path, sizes, repeat):
+    from PyQt5.QtCore import QSettings
+    from PyQt5.QtWidgets import QApplication
+    from fakeservice import FakeService, BROKER
+
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, os.path.dirname(path))
+    app = QApplication([])
+
+    import namekoman
+    import constants as const
+    from storage import createStorage
+
+    service = FakeService().start()
+    namekoman.storage.close()
+    namekoman.storage = createStorage(path)
+    widget = namekoman.NamekoManWidget()
+    widget.brokerEdit.setText(BROKER)
+    widget.timeoutEdit.setText("600")
+    widget.initNameko()
+    waitUntil(app, lambda: widget.connectionState == "connected")
+
+    # 选中第一个method
+    treeView = widget.folderBar.treeView
+    model = treeView.model()
+    index = model.index(0, 0)
+    for _ in range(3):
+        model.fetchMore(index)
+        index = model.index(0, 0, index)
+    treeView.setCurrentIndex(index)
+
+    finished = []
+    # 在onSendRpcFinished之后执行，信号按连接顺序调用
+    widget.dispatchBridge.finishSignal.connect(lambda data: finished.append((time.perf_counter(), data)))
+
+    results = collections.OrderedDict()
+    for size in sizes:
+        samples = collections.defaultdict(list)
+        # 第一次发送包括这种大小第一次分配内存等开销，不计入
+        for i in range(repeat + 1):
+            widget.paramsEdit.setText(json.dumps({"size": size}))
+            finished.clear()
+            start = time.perf_counter()
+            widget.onSendRpc()
+            waitUntil(app, lambda: finished)
+            end, data = finished[0]
+            assert data[const.RESULT_OK], data[const.RESULT]
+            if i == 0:
+                continue
+            timings = data[const.RESULT_TIMINGS]
+            for stage in STAGES[:-2]:
+                samples[stage].append(timings.get(stage, 0.0))
+            # 除去各阶段之后的开销：信号转发，节点状态，结果引用更新等
+            samples["total"].append(end - start)
+            samples["ui"].append(end - start - sum(timings.get(stage, 0.0) for stage in STAGES[:-2]))
+        for stage in STAGES:
+            results["{} {}".format(formatSize(size), stage)] = statistics.median(samples[stage])
+
+    widget.shutdown()
+    widget.dispatcher.join(10)
+    namekoman.storage.close()
+    service.stop()
+    print(json.dumps(results))
+
+
+def getPrefix(methods):
+    return "{}k methods ".format(methods // 1000)
+
+
+def measure(methods, path, sizes, repeat):
+    """
+    在单独的进程里测量一个workspace，返回{测试项: 秒}
+    """
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", path, ",".join(map(str, sizes)), str(repeat)],
+        stderr=subprocess.DEVNULL
+    )
+    childResults = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    return collections.OrderedDict((getPrefix(methods) + name, seconds) for name, seconds in childResults.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end to end request path benchmark against an in-process service")
+    parser.add_argument("--methods", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="result payload sizes in bytes")
+    parser.add_argument(
+        "--repeat", type=int, default=None,
+        help="sends per result size, default: {}, {} with --update".format(REPEAT, UPDATE_REPEAT)
+    )
+    parser.add_argument(
+        "--retries", type=int, default=RETRIES, help="measure a workspace again when it looks slower than baseline"
+    )
+    addArguments(parser)
+    args = parser.parse_args()
+    repeat = args.repeat or (UPDATE_REPEAT if args.update else REPEAT)
+
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = collections.OrderedDict()
+        for methods in args.methods:
+            workspace = os.path.join(tmp, str(methods))
+            os.mkdir(workspace)
+            paths[methods] = os.path.join(workspace, "namekoman.json")
+            writeWorkspace(paths[methods], generateWorkspace(methods))
+            results.update(measure(methods, paths[methods], args.sizes, repeat))
+        # 整个进程偶尔整体变慢（调度，CPU频率），有退化的workspace重新测量，每项取最快的一次，多次都慢才算退化
+        for _ in range(0 if args.update else args.retries):
+            slower = findRegressions(GROUP, results, args.tolerance, args.min_delta)
+            if not slower:
+                break
+            for methods, path in paths.items():
+                if any(name.startswith(getPrefix(methods)) for name in slower):
+                    for name, seconds in measure(methods, path, args.sizes, repeat).items():
+                        results[name] = min(results[name], seconds)
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        child(sys.argv[2], [int(size) for size in sys.argv[3].split(",")], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,153 @@
+# -*- coding:utf-8 -*-
+"""
+树搜索：创建索引，逐个字符输入查询时每次按键的耗时（只查索引，以及查索引+过滤树+展开匹配），
+增量添加，重命名，删除的耗时。每次按键的耗时取所有查询里最慢的一次，超过--budget或者比基线退化时返回非0
+用法：python benchmarks/bench_search.py [--methods 100000] [--repeat 3] [--budget 0.01] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import collections
+
+from workspace import generateWorkspace, writeWorkspace
+from baseline import report, addArguments
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+GROUP = "search"
+# 名字搜索，多个词，params的key，没有匹配
+QUERIES = (
+    ("method_42", False),
+    ("project_3 module_7 method_1", False),
+    ("name", True),
+    ("nothing_here", False),
+)
+
+
+def keystrokes(query):
+    """
+    逐个字符输入时搜索框的每个状态
+    """
+    return [query[:i] for i in range(1, len(query) + 1) if query[:i].strip()]
+
+
+def slowest(func, texts, repeat):
+    costs = []
+    for text in texts:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(text)
+            cost = time.perf_counter() - start
+            best = cost if best is None else min(best, cost)
+        costs.append(best)
+    return max(costs)
+
+
+def benchIndex(results, storage, repeat):
+    start = time.perf_counter()
+    index = storage.getSearchIndex()
+    results["build index"] = time.perf_counter() - start
+    for query, withParams in QUERIES:
+        results["keystroke search '{}'".format(query)] = slowest(
+            lambda text: index.search(text, withParams), keystrokes(query), repeat
+        )
+    return index
+
+
+def benchUpdates(results, storage, repeat):
+    """
+    修改storage时增量更新索引的耗时，包括storage自己的修改
+    """
+    def add():
+        storage.addMethod("project_0", "service_0", "module_0", "bench_method", {"bench_key": 1})
+        storage.deleteMethod("project_0", "service_0", "module_0", "bench_method")
+
+    def rename():
+        storage.updateProjectName("project_0", "bench_project")
+        storage.updateProjectName("bench_project", "project_0")
+
+    def params():
+        storage.updateParams("project_0", "service_0", "module_0", "method_0", {"bench_key": 1})
+
+    for name, func in (("add+delete method", add), ("rename project twice", rename), ("update params", params)):
+        results[name] = min(timeOnce(func) for _ in range(repeat))
+
+
+def timeOnce(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def benchTree(results, path, repeat):
+    from PyQt5.QtCore import QSettings
+    from PyQt5.QtWidgets import QApplication
+
+    import namekoman
+    import constants as const
+    from storage import createStorage
+
+    app = QApplication.instance() or QApplication([])
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, os.path.dirname(path))
+    QSettings(const.SETTINGS_ORGANIZATION, const.SETTINGS_APPLICATION).remove(const.SETTINGS_EXPANDED)
+    namekoman.storage.close()
+    namekoman.storage = createStorage(path)
+    widget = namekoman.FolderWidget()
+    namekoman.storage.getSearchIndex()
+
+    def search(text, withParams=False):
+        # 重复设置相同的文字不会触发textChanged，屏蔽信号后直接调用onSearch
+        for edit, setter, value in ((widget.paramsCheck, widget.paramsCheck.setChecked, withParams),
+                                    (widget.searchEdit, widget.searchEdit.setText, text)):
+            edit.blockSignals(True)
+            setter(value)
+            edit.blockSignals(False)
+        widget.onSearch()
+
+    for query, withParams in QUERIES:
+        results["keystroke filter tree '{}'".format(query)] = slowest(
+            lambda text: search(text, withParams), keystrokes(query), repeat
+        )
+        search("")
+    results["clear search"] = min(timeOnce(lambda: (search("method_42"), search(""))) for _ in range(repeat))
+    namekoman.storage.close()
+    app.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tree search benchmark with stored baselines")
+    parser.add_argument("--methods", type=int, default=100000, help="methods in the generated workspace")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=0.01, help="max seconds per keystroke")
+    addArguments(parser)
+    args = parser.parse_args()
+
+    from storage import Storage
+
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "namekoman.json")
+        writeWorkspace(path, generateWorkspace(args.methods))
+        storage = Storage(path)
+        storage.loadData()
+        benchIndex(results, storage, args.repeat)
+        benchUpdates(results, storage, args.repeat)
+        storage.close()
+        benchTree(results, path, args.repeat)
+
+    key = "{}k methods".format(args.methods // 1000)
+    results = collections.OrderedDict(("{} {}".format(key, name), seconds) for name, seconds in results.items())
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    overBudget = [name for name, seconds in results.items() if "keystroke" in name and seconds > args.budget]
+    for name in overBudget:
+        print("Over budget ({:.1f}ms): {}".format(args.budget * 1000, name))
+    sys.exit(1 if regressions or overBudget else 0)
+
+
+if __name__ == "__main__":
+    main()
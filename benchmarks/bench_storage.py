@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+"""
+比较json存储和SQLite存储，默认5万个方法
+用法：python benchmarks/bench_storage.py [methods]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from workspace import generateWorkspace, writeWorkspace, methodPaths
+
+from storage import Storage
+from sqlitestorage import SqliteStorage, migrateFromJson
+
+
+def timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def bench(storage, paths, report):
+    report["load"], _ = timeit(storage.loadData)
+
+    sample = random.sample(paths, min(1000, len(paths)))
+    report["getParam x{}".format(len(sample))], _ = timeit(
+        lambda: [storage.getParam(*path) for path in sample]
+    )
+    report["getResult x{}".format(len(sample))], _ = timeit(
+        lambda: [storage.getResult(*path) for path in sample]
+    )
+
+    def updateParams():
+        for path in sample:
+            storage.updateParams(*path, {"id": 1})
+        storage.flush()
+    report["updateParams x{}".format(len(sample))], _ = timeit(updateParams)
+
+    def renameProject():
+        storage.updateProjectName(paths[0][0], "renamed_project")
+        storage.flush()
+    report["rename project"], _ = timeit(renameProject)
+
+    report["close"], _ = timeit(storage.close)
+
+
+def main():
+    methods = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(0)
+    data = generateWorkspace(methods)
+    paths = list(methodPaths(data))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonPath = os.path.join(tmp, "namekoman.json")
+        dbPath = os.path.join(tmp, "namekoman.db")
+        writeWorkspace(jsonPath, data)
+        migrateTime, _ = timeit(migrateFromJson, jsonPath, dbPath)
+
+        jsonReport, sqliteReport = dict(), dict()
+        bench(Storage(jsonPath), paths, jsonReport)
+        bench(SqliteStorage(dbPath), paths, sqliteReport)
+
+        print("methods: {}, migrate json -> sqlite: {:.3f}s".format(len(paths), migrateTime))
+        print("file size: json {:.1f} MB, sqlite {:.1f} MB".format(
+            os.path.getsize(jsonPath) / 1024 / 1024, os.path.getsize(dbPath) / 1024 / 1024
+        ))
+        print("{:<24}{:>12}{:>12}".format("operation", "json(s)", "sqlite(s)"))
+        for key in jsonReport:
+            print("{:<24}{:>12.4f}{:>12.4f}".format(key, jsonReport[key], sqliteReport[key]))
+
+
+if __name__ == "__main__":
+    main()
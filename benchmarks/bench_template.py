@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+"""
+params模板：编译一次，渲染--renders次的平均耗时，
+和每次遍历params用正则替换的渲染（不编译）对比，超过--budget（每次渲染的秒数）时返回非0
+用法：python benchmarks/bench_template.py [--renders 100000] [--budget 0.00002] [--update] [--tolerance 1.5] [--min-delta 0.005]
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import itertools
+import collections
+
+import workspace  # noqa: F401
+from baseline import report, addArguments
+
+from paramtemplate import compileTemplate
+
+GROUP = "template"
+ENV = {"tenant": "tenant_1", "region": "cn-north"}
+EXPRESSION = re.compile(r"{{\s*(.*?)\s*}}")
+
+
+def generateTemplate(fields):
+    """
+    fields个静态字段，加上变量，序列，uuid，随机数，csv列和字符串拼接
+    """
+    params = {"field_{}".format(i): {"value": i, "tags": ["a", "b"], "name": "name_{}".format(i)}
+              for i in range(fields)}
+    params.update({
+        "tenant": "{{tenant}}",
+        "order_id": "{{seq(1000)}}",
+        "request_id": "{{uuid()}}",
+        "amount": "{{randint(1, 10000)}}",
+        "user": {"id": "{{csv(\"users.csv\", \"id\")}}", "name": "{{csv(\"users.csv\", \"name\")}}"},
+        "key": "{{region}}-{{seq(1000)}}",
+    })
+    return params
+
+
+def writeUsers(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,name\n")
+        for i in range(rows):
+            f.write("{},user_{}\n".format(i, i))
+
+
+def naiveRenderer(baseDir):
+    """
+    不编译的渲染：每次遍历整个params，每个字符串用正则查找表达式
+    """
+    seq = itertools.count(1000)
+    rows = itertools.cycle(open(os.path.join(baseDir, "users.csv"), encoding="utf-8").read().split()[1:])
+    state = {}
+
+    def value(expr):
+        if expr in ENV:
+            return ENV[expr]
+        if expr not in state:
+            if expr.startswith("seq"):
+                state[expr] = next(seq)
+            elif expr.startswith("uuid"):
+                state[expr] = str(uuid.uuid4())
+            elif expr.startswith("randint"):
+                state[expr] = random.randint(1, 10000)
+            else:
+                if "row" not in state:
+                    state["row"] = next(rows).split(",")
+                state[expr] = state["row"][0 if '"id"' in expr else 1]
+        return state[expr]
+
+    def walk(obj):
+        if isinstance(obj, dict):
+            return {key: walk(child) for key, child in obj.items()}
+        if isinstance(obj, list):
+            return [walk(child) for child in obj]
+        if isinstance(obj, str) and "{{" in obj:
+            match = EXPRESSION.fullmatch(obj)
+            if match:
+                return value(match.group(1))
+            return EXPRESSION.sub(lambda m: str(value(m.group(1))), obj)
+        return obj
+
+    def render(params):
+        state.clear()
+        return walk(params)
+    return render
+
+
+def perRender(func, renders):
+    start = time.perf_counter()
+    for _ in range(renders):
+        func()
+    return (time.perf_counter() - start) / renders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="params template benchmark with stored baselines")
+    parser.add_argument("--renders", type=int, default=100000)
+    parser.add_argument("--fields", type=int, default=30, help="static fields in the template")
+    parser.add_argument("--budget", type=float, default=0.00002, help="max seconds per render")
+    addArguments(parser)
+    args = parser.parse_args()
+
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        writeUsers(os.path.join(tmp, "users.csv"), 10000)
+        params = generateTemplate(args.fields)
+        start = time.perf_counter()
+        template = compileTemplate(params, ENV, tmp)
+        results["compile"] = time.perf_counter() - start
+        results["render compiled"] = perRender(template.render, args.renders)
+        naive = naiveRenderer(tmp)
+        results["render naive (walk + regex)"] = perRender(lambda: naive(params), args.renders // 10)
+        static = compileTemplate({key: value for key, value in params.items() if key.startswith("field_")})
+        results["render without expressions"] = perRender(static.render, args.renders)
+
+    key = "{} fields".format(args.fields)
+    results = collections.OrderedDict(("{} {}".format(key, name), seconds) for name, seconds in results.items())
+    regressions = report(GROUP, results, args.update, args.tolerance, args.min_delta)
+    overBudget = results["{} render compiled".format(key)] > args.budget
+    if overBudget:
+        print("Over budget ({:.1f}us): {} render compiled".format(args.budget * 1000000, key))
+    sys.exit(1 if regressions or overBudget else 0)
+
+
+if __name__ == "__main__":
+    main()
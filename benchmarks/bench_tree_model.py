@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+"""
+比较文件夹树启动耗时和内存：一次性创建所有节点并expandAll的QStandardItemModel，
+和按需读取的FolderTreeModel（分别使用json和SQLite存储）
+每种情况在单独的进程里运行，耗时不包括import，内存为进程峰值RSS
+用法：python benchmarks/bench_tree_model.py [methods ...]，默认1000 10000 100000
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+from workspace import generateWorkspace, writeWorkspace
+
+from sqlitestorage import migrateFromJson
+
+KINDS = ("eager", "lazy-json", "lazy-sqlite")
+
+
+def peakRssMB():
+    # linux上ru_maxrss在exec后会继承父进程的值，优先读取VmHWM
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS单位是字节，linux是KB
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def runEager(path):
+    from PyQt5.QtGui import QStandardItem, QStandardItemModel
+    from PyQt5.QtWidgets import QTreeView
+    from storage import Storage
+
+    path = os.path.splitext(path)[0] + ".json"
+    data = Storage(path).loadData()
+    view = QTreeView()
+    model = QStandardItemModel()
+    view.setModel(model)
+    for project, projectDict in data.items():
+        projectNode = QStandardItem(project)
+        for service, serviceDict in projectDict.items():
+            serviceNode = QStandardItem(service)
+            projectNode.appendRow(serviceNode)
+            for module, moduleDict in serviceDict.items():
+                moduleNode = QStandardItem(module)
+                serviceNode.appendRow(moduleNode)
+                for method in moduleDict:
+                    moduleNode.appendRow(QStandardItem(method))
+        model.invisibleRootItem().appendRow(projectNode)
+    view.expandAll()
+    return view
+
+
+def runLazy(path):
+    import namekoman
+    from storage import createStorage
+
+    namekoman.storage = createStorage(path)
+    return namekoman.FolderWidget()
+
+
+def child(kind, path):
+    from PyQt5.QtWidgets import QApplication
+    import namekoman  # noqa: F401
+
+    app = QApplication([])
+    start = time.time()
+    if kind == "eager":
+        widget = runEager(path)
+    else:
+        suffix = ".db" if kind == "lazy-sqlite" else ".json"
+        widget = runLazy(os.path.splitext(path)[0] + suffix)
+    widget.show()
+    app.processEvents()
+    print(json.dumps({"time": time.time() - start, "rss": peakRssMB()}))
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print("{:>8}{:>14}{:>12}{:>10}".format("methods", "model", "time(s)", "rss(MB)"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, "namekoman_{}.json".format(size))
+            writeWorkspace(path, generateWorkspace(size))
+            migrateFromJson(path, os.path.splitext(path)[0] + ".db")
+            for kind in KINDS:
+                output = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), "--child", kind, path],
+                    stderr=subprocess.DEVNULL
+                )
+                report = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+                print("{:>8}{:>14}{:>12.3f}{:>10.1f}".format(size, kind, report["time"], report["rss"]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
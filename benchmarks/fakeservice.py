@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+"""
+进程内的假nameko服务，使用kombu的memory://传输，不需要rabbitmq，
+用来单独测量namekoman自身的开销。
+所有service的所有method都由它回复：参数里有size时返回size字节的payload，否则原样返回参数
+"""
+
+import time
+import socket
+import logging
+import threading
+
+from kombu import Connection, Exchange, Queue, Producer
+from kombu.transport import memory
+
+BROKER = "memory://"
+RPC_EXCHANGE = "nameko-rpc"
+POLLING_INTERVAL = 0.001
+
+
+class FakeService(object):
+
+    def __init__(self, broker=BROKER, delay=0.0):
+        # delay：每个请求的处理时间，秒
+        self.broker = broker
+        self.delay = delay
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._serve, name="FakeService", daemon=True)
+
+    def start(self):
+        # memory://默认每秒轮询一次，nameko的连接不能传transport_options，这里直接改默认值，
+        # 否则测到的rpc耗时主要是轮询等待
+        memory.Transport.polling_interval = POLLING_INTERVAL
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _serve(self):
+        exchange = Exchange(RPC_EXCHANGE, type="topic", durable=True)
+        queue = Queue("rpc-fake-service", exchange=exchange, routing_key="#")
+        with Connection(self.broker) as conn, \
+                Connection(self.broker) as out:
+            producer = Producer(out)
+
+            def reply(body, properties):
+                if self.delay:
+                    time.sleep(self.delay)
+                kwargs = body.get("kwargs", {})
+                result = {"payload": "x" * kwargs["size"]} if "size" in kwargs else kwargs
+                with self.lock:
+                    producer.publish(
+                        {"result": result, "error": None}, exchange=exchange, routing_key=properties["reply_to"],
+                        correlation_id=properties["correlation_id"], serializer="json"
+                    )
+
+            def onMessage(body, message):
+                message.ack()
+                # 回复也发到同一个exchange，按routing_key=#会收到，只处理请求
+                if "reply_to" not in message.properties:
+                    return
+                if self.delay:
+                    threading.Thread(target=reply, args=(body, message.properties), daemon=True).start()
+                else:
+                    reply(body, message.properties)
+
+            with conn.Consumer(queue, callbacks=[onMessage]):
+                self.ready.set()
+                while not self.stopped.is_set():
+                    try:
+                        conn.drain_events(timeout=0.1)
+                    except socket.timeout:
+                        pass
+                    except Exception as e:
+                        logging.exception(e)
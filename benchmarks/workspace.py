@@ -0,0 +1,50 @@
+# -*- coding:utf-8 -*-
+"""
+生成基准测试用的workspace数据
+"""
+
+import os
+import sys
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+import constants as const
+
+
+def generateWorkspace(methods, projects=10, services=10, modules=10, resultSize=64):
+    """
+    生成包含methods个方法的四级数据，方法均匀分布在projects*services*modules个module里
+    """
+    data = collections.OrderedDict()
+    perModule = max(1, methods // (projects * services * modules))
+    count = 0
+    for p in range(projects):
+        projectDict = data.setdefault("project_{}".format(p), dict())
+        for s in range(services):
+            serviceDict = projectDict.setdefault("service_{}".format(s), dict())
+            for m in range(modules):
+                moduleDict = serviceDict.setdefault("module_{}".format(m), dict())
+                for i in range(perModule):
+                    if count >= methods:
+                        return data
+                    moduleDict["method_{}".format(i)] = {
+                        const.PARAMS: {"id": count, "name": "user_{}".format(count), "token": "x" * 16},
+                        const.RESULT: {"success": True, "payload": "y" * resultSize},
+                    }
+                    count += 1
+    return data
+
+
+def writeWorkspace(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(utils.objectToJsonStr(data))
+
+
+def methodPaths(data):
+    for project, projectDict in data.items():
+        for service, serviceDict in projectDict.items():
+            for module, moduleDict in serviceDict.items():
+                for method in moduleDict:
+                    yield project, service, module, method
@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+
+import os
+import json
+import time
+import zlib
+import uuid
+import hashlib
+import utils
+import constants as const
+
+
+class BlobStore(object):
+    """
+    结果存储，每个结果压缩后单独存一个文件，文件名是内容的sha256，相同的结果只存一份。
+    数据树里只保存引用：{"ref": sha256, "size": 原始字节数, "time": 写入时间}。
+    内容是objectToJsonStr格式化后的文本，读取时可以直接用于显示和日志，不需要再格式化。
+    可以在多个线程中同时写入
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, ref):
+        return os.path.join(self.root, ref[:2], ref[2:] + const.BLOB_SUFFIX)
+
+    def put(self, obj) -> dict:
+        return self.putText(utils.objectToJsonStr(obj))
+
+    def putText(self, text: str) -> dict:
+        """
+        保存已经格式化好的结果文本
+        """
+        data = text.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        try:
+            # 已经存在时更新修改时间，清理时不会删除刚被重新引用的结果
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmpPath = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+            with open(tmpPath, "wb") as f:
+                f.write(zlib.compress(data))
+            os.replace(tmpPath, path)
+        return {const.BLOB_REF: ref, const.BLOB_SIZE: len(data), const.BLOB_TIME: time.time()}
+
+    def get(self, ref):
+        return json.loads(self.getText(ref))
+
+    def getText(self, ref) -> str:
+        with open(self._path(ref), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def has(self, ref):
+        return os.path.exists(self._path(ref))
+
+    def sweep(self, live, before) -> int:
+        """
+        删除live（sha256的集合）以外的结果文件和写了一半的临时文件，只删除修改时间早于before的，返回删除的文件数
+        """
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(const.BLOB_SUFFIX):
+                    if directory.name + entry.name[:-len(const.BLOB_SUFFIX)] in live:
+                        continue
+                elif not entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < before:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+def getBlobRoot(path):
+    """
+    结果文件目录，和数据文件放在一起，例如namekoman.json对应namekoman.results
+    """
+    return os.path.splitext(path)[0] + const.BLOB_DIR_SUFFIX
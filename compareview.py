@@ -0,0 +1,192 @@
+# -*- coding:utf-8 -*-
+
+import logging
+
+from PyQt5.QtCore import Qt as QtCoreQt, QThread, pyqtSignal
+from PyQt5.QtWidgets import (
+    QDialog, QLabel, QPushButton, QListWidget, QListWidgetItem, QTableWidget, QTableWidgetItem,
+    QPlainTextEdit, QBoxLayout, QHeaderView
+)
+
+import constants as const
+from dispatcher import RpcTask
+from jsondiff import diff, formatCount, formatDiff
+from loadtestview import formatLatency
+from paramtemplate import TemplateError, renderOnce
+
+
+class CompareDiffThread(QThread):
+    """
+    以第一个配置的结果为基准比较其它配置的结果，结果很大时比较和格式化都比较慢，不在界面线程执行
+    """
+    finishSignal = pyqtSignal(object, object)
+
+    def __init__(self, names, results):
+        super().__init__()
+        self.names, self.results = names, results
+
+    def run(self):
+        base = self.results[self.names[0]][const.RESULT]
+        rows = []
+        for name in self.names[1:]:
+            try:
+                differences = diff(base, self.results[name][const.RESULT])
+                rows.append((name, formatCount(differences), formatDiff(differences)))
+            except Exception as e:
+                logging.exception(e)
+                rows.append((name, "error", str(e)))
+        self.finishSignal.emit(self.names, rows)
+
+
+class CompareDialog(QDialog):
+    """
+    对比窗口：同一个method用保存的params同时发送到多个broker配置，
+    并排显示各自的延迟，以第一个配置的结果为基准显示结构化差异。
+    请求使用各个配置在池里的请求分发，结果不保存。params是模板时用各个配置自己的env渲染
+    """
+    COLUMNS = ("profile", "broker", "status", "rpc", "total", "size", "differences")
+    resultSignal = pyqtSignal(object, object)
+
+    def __init__(self, parent, dispatcherPool, profileStore, path, params, timeout, baseDir=""):
+        super().__init__(parent)
+        self.dispatcherPool = dispatcherPool
+        self.profileStore = profileStore
+        self.path = tuple(path)
+        self.params = params
+        self.timeout = timeout
+        # 模板里的文件相对的目录
+        self.baseDir = baseDir
+        self.names = []
+        self.results = {}
+        self.tasks = []
+        self.diffThreads = set()
+        self.setWindowTitle("Compare: {}".format("/".join(self.path)))
+        self.resize(900, 600)
+
+        self.profileList = QListWidget()
+        self.profileList.setMaximumHeight(120)
+        for name in profileStore.names():
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | QtCoreQt.ItemIsUserCheckable)
+            item.setCheckState(QtCoreQt.Checked)
+            item.setToolTip(profileStore.getBroker(name))
+            self.profileList.addItem(item)
+        self.startButton = QPushButton("Compare")
+        self.startButton.clicked.connect(self.onStart)
+        self.statsLabel = QLabel("Send {} to the checked profiles at the same time".format("/".join(self.path)))
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.diffText = QPlainTextEdit()
+        self.diffText.setReadOnly(True)
+
+        layout = QBoxLayout(QBoxLayout.TopToBottom)
+        layout.addWidget(self.profileList)
+        layout.addWidget(self.startButton)
+        layout.addWidget(self.statsLabel)
+        layout.addWidget(self.table)
+        layout.addWidget(self.diffText)
+        self.setLayout(layout)
+
+        self.resultSignal.connect(self.onResultArrived)
+
+    def checkedNames(self):
+        return [
+            self.profileList.item(i).text() for i in range(self.profileList.count())
+            if self.profileList.item(i).checkState() == QtCoreQt.Checked
+        ]
+
+    def onStart(self):
+        names = self.checkedNames()
+        if len(names) < 2:
+            self.statsLabel.setText("Please check at least two profiles!")
+            return
+        # 先渲染所有配置的params，有错误时一个请求也不发送
+        paramsList = []
+        for name in names:
+            try:
+                paramsList.append(renderOnce(self.params, self.profileStore.getEnv(name), self.baseDir))
+            except TemplateError as e:
+                self.statsLabel.setText("Invalid params template of {}: {}".format(name, e))
+                return
+        self.names = names
+        self.results = {}
+        self.tasks = []
+        self.diffText.clear()
+        self.table.setRowCount(len(names))
+        for row, (name, params) in enumerate(zip(names, paramsList)):
+            broker = self.profileStore.getBroker(name)
+            self.setRow(row, (name, broker, "running...", "", "", "", ""))
+            # 同一个broker的配置共用请求分发，不同broker的请求并行执行
+            dispatcher, _ = self.dispatcherPool.get(broker)
+            task = RpcTask(*self.path, params, timeout=self.timeout)
+            self.tasks.append(task)
+            dispatcher.submit(task).add_done_callback(
+                lambda future, name=name: future.cancelled() or self.resultSignal.emit(name, future.result())
+            )
+        logging.info("Compare start, method: {}, profiles: {}".format("/".join(self.path), ", ".join(names)))
+        self.startButton.setDisabled(True)
+        self.statsLabel.setText("Waiting for {} profiles......".format(len(names)))
+
+    def setRow(self, row, values):
+        for column, value in enumerate(values):
+            self.table.setItem(row, column, QTableWidgetItem(value))
+
+    def onResultArrived(self, name, data: dict):
+        if name not in self.names or name in self.results:
+            return
+        self.results[name] = data
+        row = self.names.index(name)
+        timings = data[const.RESULT_TIMINGS]
+        self.setRow(row, (
+            name, self.profileStore.getBroker(name) or "", "ok" if data[const.RESULT_OK] else "error",
+            formatLatency(timings[const.TIMING_RPC]),
+            formatLatency(timings[const.TIMING_QUEUE] + timings[const.TIMING_RPC]),
+            str(len(data[const.RESULT_TEXT])), ""
+        ))
+        self.statsLabel.setText("Finished {}/{}".format(len(self.results), len(self.names)))
+        if len(self.results) == len(self.names):
+            self.onFinished()
+
+    def onFinished(self):
+        """
+        全部返回后在后台以第一个配置为基准比较结果
+        """
+        self.tasks = []
+        base = self.names[0]
+        for row in range(1, len(self.names)):
+            self.table.setItem(row, len(self.COLUMNS) - 1, QTableWidgetItem("comparing..."))
+        self.table.setItem(0, len(self.COLUMNS) - 1, QTableWidgetItem("base"))
+        self.statsLabel.setText("Comparing results with {}......".format(base))
+        logging.info("Compare end, method: {}, rpc: {}".format("/".join(self.path), ", ".join(
+            "{}: {}".format(name, formatLatency(self.results[name][const.RESULT_TIMINGS][const.TIMING_RPC]))
+            for name in self.names
+        )))
+        thread = CompareDiffThread(self.names, self.results)
+        thread.finishSignal.connect(self.onDiffFinished)
+        thread.finished.connect(lambda: self.diffThreads.discard(thread))
+        self.diffThreads.add(thread)
+        thread.start()
+
+    def onDiffFinished(self, names, rows):
+        # 比较期间关闭了窗口
+        if names is not self.names:
+            return
+        self.startButton.setDisabled(False)
+        base = names[0]
+        sections = []
+        for row, (name, count, text) in enumerate(rows, 1):
+            self.table.setItem(row, len(self.COLUMNS) - 1, QTableWidgetItem(count))
+            sections.append("{} -> {}: {} differences\n{}".format(base, name, count, text))
+        self.diffText.setPlainText("\n\n".join(sections))
+        self.statsLabel.setText("Finished, results are compared with {}".format(base))
+
+    def closeEvent(self, event):
+        # 关闭窗口时放弃等待还没返回的请求
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.names = []
+        super().closeEvent(event)
@@ -0,0 +1,309 @@
+# -*- coding:utf-8 -*-
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+import utils
+import constants as const
+
+
+def createRpcClient(broker, timeout):
+    """
+    创建未启动的rpc客户端，nameko在第一次需要客户端时才导入，一般在工作线程中，不影响启动。
+    broker只传给这个客户端，不修改nameko的全局配置，多个配置可以同时在不同线程创建客户端
+    """
+    from rpcclient import RpcClient
+    return RpcClient(broker, timeout)
+
+
+class RpcCancelled(Exception):
+    pass
+
+
+class RpcTask(object):
+    """
+    一次rpc请求，在Dispatcher的工作线程中执行，结果通过future返回
+    结果只格式化一次，格式化后的文本同时用于日志，结果存储和结果缓存，
+    调用方拿到的是解析好的结果对象，不需要再解析和格式化
+    """
+    def __init__(self, project, service, module, method, params, store=None, timeout=None, compare=None):
+        self.project, self.service, self.module, self.method, self.params = project, service, module, method, params
+        # 保存格式化好的结果文本，返回引用，为None时不保存
+        self.store = store
+        # 这次请求的超时，为None时使用客户端的超时
+        self.timeout = timeout
+        # compare(格式化文本, 结果)返回和保存的结果的差异，在工作线程中比较，为None时不比较
+        self.compare = compare
+        self.cancelled = False
+        self.error = None
+        self.future = Future()
+        self.submitTime = time.time()
+
+    def getPath(self):
+        return self.project, self.service, self.module, self.method
+
+    def run(self, client):
+        start = time.time()
+        logging.info(
+            "Send rpc start, service: {}, method: {}, params: {}, waiting result......".format(
+                self.service, self.method, self.params
+            )
+        )
+        result = self.capture(client.call, self.service, self.method, self.params, self.timeout, self.isCancelled)
+        return self.finish(result, start)
+
+    def capture(self, fn, *args, **kwargs):
+        """
+        执行fn，出错时记录错误，返回错误信息
+        """
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+            logging.exception(e)
+            return utils.errorToDict(repr(e))
+
+    def cancel(self):
+        """
+        可以在任意线程调用，还没发送的请求不再发送，等待中的请求放弃等待，返回取消错误
+        """
+        self.cancelled = True
+
+    def isCancelled(self):
+        return self.cancelled
+
+    def finishCancelled(self):
+        """
+        发送前就取消的请求的结果
+        """
+        self.error = RpcCancelled()
+        return self.finish(utils.errorToDict(repr(self.error)), time.time())
+
+    def finish(self, result, start):
+        rpcEnd = time.time()
+        try:
+            text = utils.objectToJsonStr(result)
+        except Exception as e:
+            logging.exception(e)
+            result = utils.errorToDict(repr(e))
+            text = utils.objectToJsonStr(result)
+        serializeEnd = time.time()
+
+        # 出错的结果不保存
+        ref = None
+        if self.store and isinstance(result, (dict, list)) and "error" not in text.lower():
+            try:
+                ref = self.store(text)
+            except Exception as e:
+                logging.exception(e)
+        storeEnd = time.time()
+
+        ok = self.error is None and not (isinstance(result, dict) and "error" in result)
+        differences = None
+        if self.compare and ok:
+            try:
+                differences = self.compare(text, result)
+            except Exception as e:
+                logging.exception(e)
+        diffEnd = time.time()
+
+        logging.info(
+            "Send rpc end, calling time: {}, project: {}, service: {}, method: {}, params:{}, result: {}".format(
+                rpcEnd-start, self.project, self.service, self.method, utils.objectToCompactJsonStr(self.params), text
+            )
+        )
+
+        return {
+            const.NODE_PROJECT: self.project,
+            const.NODE_SERVICE: self.service,
+            const.NODE_MODULE: self.module,
+            const.NODE_METHOD: self.method,
+            const.PARAMS: self.params,
+            const.RESULT: result,
+            const.RESULT_TEXT: text,
+            const.RESULT_REF: ref,
+            const.RESULT_OK: ok,
+            const.RESULT_DIFF: differences,
+            const.RESULT_SUBMIT_TIME: self.submitTime,
+            const.RESULT_TIMINGS: {
+                const.TIMING_QUEUE: start - self.submitTime,
+                const.TIMING_RPC: rpcEnd - start,
+                const.TIMING_SERIALIZE: serializeEnd - rpcEnd,
+                const.TIMING_STORE: storeEnd - serializeEnd,
+                const.TIMING_DIFF: diffEnd - storeEnd,
+            },
+        }
+
+
+def createDispatcher(clientFactory, size, pipelined=False):
+    """
+    pipelined为True时所有请求通过一个连接流水线发送，不需要每个并发一个线程和客户端
+    """
+    if pipelined:
+        from pipeline import PipelineDispatcher
+        return PipelineDispatcher(clientFactory, size)
+    return Dispatcher(clientFactory, size)
+
+
+class ConnectTask(RpcTask):
+    """
+    不发送请求，只让工作线程提前创建并启动客户端，连接成功返回None，失败返回错误信息
+    """
+    def __init__(self):
+        super().__init__("", "", "", "", {})
+
+    def run(self, client):
+        return None
+
+    def finish(self, result, start):
+        return repr(self.error)
+
+
+class PingTask(ConnectTask):
+    """
+    用工作线程的客户端检查连接，连接正常返回None，失败返回错误信息，连接出错的客户端会被丢弃
+    """
+    def run(self, client):
+        try:
+            client.ping()
+            return None
+        except Exception as e:
+            self.error = e
+            logging.exception(e)
+            return repr(e)
+
+
+class Dispatcher(object):
+    """
+    请求分发：size个工作线程从队列中取请求执行，可以同时执行多个请求。
+    rpc客户端不能跨线程共享，所以每个工作线程持有自己的客户端，第一次执行请求时才创建并启动，
+    连接出错后丢弃，下次执行请求时重新创建
+    """
+    def __init__(self, clientFactory, size=const.RPC_POOL_SIZE):
+        # clientFactory返回未启动的客户端，例如RpcClient，start()返回用于调用的客户端
+        self.clientFactory = clientFactory
+        self.size = size
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.clients = 0
+        self.stopped = False
+        # 工作线程全部退出时设置。在工作线程中导入eventlet后Thread.join可能一直不返回，所以不用join等待
+        self.running = size
+        self.finished = threading.Event()
+        self.workers = []
+        for i in range(size):
+            worker = threading.Thread(target=self._work, name="RpcWorker-{}".format(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, task: RpcTask) -> Future:
+        if self.stopped:
+            raise RuntimeError("Dispatcher is stopped")
+        self.tasks.put(task)
+        return task.future
+
+    def connect(self) -> Future:
+        """
+        在后台提前连接，不用等到第一个请求
+        """
+        return self.submit(ConnectTask())
+
+    def ping(self) -> Future:
+        """
+        检查一个工作线程的连接，还没有客户端时先创建
+        """
+        return self.submit(PingTask())
+
+    def _work(self):
+        handle, client = None, None
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            with self.lock:
+                self.busy += 1
+            try:
+                if task.isCancelled():
+                    task.future.set_result(task.finishCancelled())
+                    continue
+                if client is None:
+                    try:
+                        handle = self.clientFactory()
+                        client = handle.start()
+                        with self.lock:
+                            self.clients += 1
+                    except Exception as e:
+                        logging.exception(e)
+                        handle = None
+                        task.error = e
+                        task.future.set_result(task.finish(utils.errorToDict(repr(e)), time.time()))
+                        continue
+                task.future.set_result(task.run(client))
+                # 连接出错的客户端不再使用
+                if isinstance(task.error, (IOError, OSError)):
+                    self._stopClient(handle)
+                    handle, client = None, None
+            finally:
+                with self.lock:
+                    self.busy -= 1
+        self._stopClient(handle)
+        with self.lock:
+            self.running -= 1
+            if self.running == 0:
+                self.finished.set()
+
+    def _stopClient(self, handle):
+        if handle is None:
+            return
+        with self.lock:
+            self.clients -= 1
+        try:
+            handle.stop()
+        except Exception as e:
+            logging.exception(e)
+
+    def stop(self):
+        """
+        不再接受新请求，已经提交的请求执行完后工作线程停止客户端并退出，不阻塞调用方
+        """
+        if self.stopped:
+            return
+        self.stopped = True
+        for _ in self.workers:
+            self.tasks.put(None)
+
+    def cancel(self):
+        """
+        丢弃排队中的请求，future变为cancelled，正在执行的请求不受影响
+        """
+        stops = 0
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                stops += 1
+            else:
+                task.future.cancel()
+        for _ in range(stops):
+            self.tasks.put(None)
+
+    def join(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def getStats(self):
+        """
+        busy：正在执行的请求数，queued：排队等待的请求数，clients：已经启动的客户端数
+        """
+        with self.lock:
+            return {
+                "size": self.size,
+                "busy": self.busy,
+                "queued": self.tasks.qsize(),
+                "clients": self.clients,
+            }
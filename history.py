@@ -0,0 +1,162 @@
+# -*- coding:utf-8 -*-
+
+import sys
+import array
+import base64
+import struct
+import statistics
+
+import constants as const
+
+# 格式版本，容量，记录数
+HEADER = struct.Struct("<BHH")
+VERSION = 1
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+class LatencyHistory(object):
+    """
+    一个method最近capacity次调用的记录：时间，延迟（秒），结果大小，是否成功。
+    按列存在定长的array里，写满后覆盖最早的记录；
+    保存时序列化成base64的二进制（每条17字节），而不是json列表
+    """
+    def __init__(self, capacity=const.LATENCY_HISTORY_SIZE):
+        self.capacity = capacity
+        self.times = array.array("d", bytes(8 * capacity))
+        self.latencies = array.array("f", bytes(4 * capacity))
+        self.sizes = array.array("I", bytes(4 * capacity))
+        self.oks = array.array("B", bytes(capacity))
+        self.count = 0
+        self.start = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, latency, size, ok):
+        if self.count < self.capacity:
+            i = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[i] = timestamp
+        self.latencies[i] = latency
+        self.sizes[i] = min(size, 0xFFFFFFFF)
+        self.oks[i] = 1 if ok else 0
+
+    def _ordered(self, column):
+        """
+        按时间顺序返回一列
+        """
+        end = self.start + self.count
+        if end <= self.capacity:
+            return column[self.start:end]
+        return column[self.start:] + column[:end - self.capacity]
+
+    def records(self):
+        """
+        按时间顺序返回(时间, 延迟, 大小, 是否成功)
+        """
+        return list(zip(
+            self._ordered(self.times), self._ordered(self.latencies),
+            self._ordered(self.sizes), map(bool, self._ordered(self.oks))
+        ))
+
+    def okLatencies(self):
+        """
+        成功调用的延迟，失败和超时的延迟不代表服务的速度，不参与统计
+        """
+        return [latency for latency, ok in zip(self._ordered(self.latencies), self._ordered(self.oks)) if ok]
+
+    def stats(self):
+        latencies = self.okLatencies()
+        recent, before = latencies[-const.LATENCY_RECENT_CALLS:], latencies[:-const.LATENCY_RECENT_CALLS]
+        usual = statistics.median(before) if len(before) >= const.LATENCY_MIN_BASELINE else None
+        return {
+            "calls": self.count,
+            "errors": self.count - len(latencies),
+            "last": latencies[-1] if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "usual": usual,
+            "slower": bool(usual and recent and statistics.median(recent) > usual * const.LATENCY_SLOWER_FACTOR),
+        }
+
+    def toText(self) -> str:
+        columns = [self._ordered(column) for column in (self.times, self.latencies, self.sizes, self.oks)]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+        data = HEADER.pack(VERSION, self.capacity, self.count) + b"".join(column.tobytes() for column in columns)
+        return base64.b64encode(data).decode("ascii")
+
+    @classmethod
+    def fromText(cls, text, capacity=const.LATENCY_HISTORY_SIZE):
+        """
+        text为空时返回空的记录，容量变小时只保留最近的记录
+        """
+        history = cls(capacity)
+        if not text:
+            return history
+        data = base64.b64decode(text)
+        version, _, count = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError("Unknown latency history version: {}".format(version))
+        offset = HEADER.size
+        keep = min(count, capacity)
+        for column in (history.times, history.latencies, history.sizes, history.oks):
+            saved = array.array(column.typecode)
+            saved.frombytes(data[offset:offset + saved.itemsize * count])
+            if sys.byteorder != "little":
+                saved.byteswap()
+            offset += saved.itemsize * count
+            column[:keep] = saved[count - keep:]
+        history.count = keep
+        return history
+
+
+def toSample(data):
+    """
+    请求结果对应的一条调用记录
+    """
+    return (
+        data[const.RESULT_SUBMIT_TIME], data[const.RESULT_TIMINGS][const.TIMING_RPC],
+        len(data[const.RESULT_TEXT]), data[const.RESULT_OK]
+    )
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def sparkline(values, width=const.LATENCY_SPARKLINE_WIDTH) -> str:
+    """
+    用方块字符画最近width个值的趋势，按最小值到最大值缩放
+    """
+    values = values[-width:]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low) if high > low else 0
+    return "".join(SPARK_CHARS[int((value - low) * scale)] for value in values)
+
+
+def formatStats(stats) -> str:
+    """
+    method下方显示的一行统计
+    """
+    if not stats["calls"]:
+        return "no calls yet"
+
+    def ms(seconds):
+        return "-" if seconds is None else "{:.1f}ms".format(seconds * 1000)
+
+    text = "calls: {}, errors: {}, last: {}, p50: {}, p95: {}".format(
+        stats["calls"], stats["errors"], ms(stats["last"]), ms(stats["p50"]), ms(stats["p95"])
+    )
+    if stats["slower"]:
+        text += ", slower than usual ({})".format(ms(stats["usual"]))
+    return text
@@ -0,0 +1,284 @@
+# -*- coding:utf-8 -*-
+
+import re
+import gc
+import hashlib
+import marshal
+import operator
+import itertools
+
+import utils
+import constants as const
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+
+def _sortedKeys(value) -> tuple:
+    try:
+        return tuple(sorted(value))
+    except TypeError:
+        return tuple(sorted(value, key=repr))
+
+
+def _dumps(rows) -> list:
+    try:
+        return list(map(marshal.dumps, rows, itertools.repeat(2)))
+    except ValueError:
+        pass
+    # 有不是json的类型，只有这些行用repr
+    data = []
+    for row in rows:
+        try:
+            data.append(marshal.dumps(row, 2))
+        except ValueError:
+            data.append(repr(row).encode("utf-8"))
+    return data
+
+
+class Digests(object):
+    """
+    一次比较中每个dict和list的摘要：从叶子开始计算，每个节点只计算一次，按id缓存，比较两个子树只比较摘要，不再用==。
+    摘要是marshal（版本2）序列化后的64位hash，子节点是dict或list时用它的摘要，标量区分1，1.0和True；
+    dict按排序后的key序列化，和key的顺序无关（例如一个来自rpc，一个来自保存的结果）。
+    同一层的节点一起计算：所有节点的子节点排成一列向下计算，取值，序列化和hash用map在C里执行。
+    只在一次比较中使用，比较期间两个结果都不能修改
+    """
+    def __init__(self):
+        self.digests = {}
+
+    def same(self, old, new) -> bool:
+        if type(old) is not type(new):
+            return False
+        if type(old) is dict or type(old) is list:
+            return old is new or self.digest(old) == self.digest(new)
+        return old == new
+
+    def digest(self, value) -> int:
+        digest = self.digests.get(id(value))
+        if digest is None:
+            digest = self._parts([value])[0]
+            if type(digest) is not int:
+                # 只有标量的节点返回的是序列化前的内容
+                digest = hash(_dumps([digest])[0])
+        return digest
+
+    def listKeys(self, value) -> list:
+        """
+        list每个元素的比较键：dict和list是摘要，float和bool带上类型，其它标量是本身，一段元素可以直接用==比较
+        """
+        self.digest(value)
+        digest = self.digest
+        return [
+            digest(child) if type(child) is dict or type(child) is list
+            else ("f", child) if type(child) is float else ("b", child) if type(child) is bool else child
+            for child in value
+        ]
+
+    def _parts(self, column) -> list:
+        """
+        一组值各自的序列化部分：标量是本身，dict和list是摘要，只有标量的dict和list是排序后的key和值
+        """
+        types = set(map(type, column))
+        if dict not in types and list not in types:
+            return column
+        if len(types) > 1:
+            # 类型不同的值分开计算
+            parts = list(column)
+            for kind in (dict, list):
+                indexes = [i for i, value in enumerate(column) if type(value) is kind]
+                for i, part in zip(indexes, self._parts([column[i] for i in indexes])):
+                    parts[i] = part
+            return parts
+        # 同一层所有节点的子节点排成一列一起向下计算，再按节点分组
+        if dict in types:
+            keys = column[0].keys()
+            if all(map(keys.__eq__, map(dict.keys, column))):
+                keys = _sortedKeys(column[0])
+                if len(keys) == 1:
+                    values = list(map(operator.itemgetter(*keys), column))
+                else:
+                    values = list(itertools.chain.from_iterable(map(operator.itemgetter(*keys), column))) if keys else []
+                parts = self._parts(values)
+                rows = list(zip(itertools.repeat(keys, len(column)), *[iter(parts)] * len(keys)))
+            else:
+                keysList = list(map(_sortedKeys, column))
+                values = [value[key] for value, keys in zip(column, keysList) for key in keys]
+                parts = self._parts(values)
+                rows, start = [], 0
+                for keys in keysList:
+                    rows.append((keys,) + tuple(parts[start:start + len(keys)]))
+                    start += len(keys)
+            leaf = parts is values
+        else:
+            values = list(itertools.chain.from_iterable(column))
+            parts = self._parts(values)
+            leaf = parts is values
+            lengths = set(map(len, column))
+            if leaf:
+                # 元素都是标量，直接序列化
+                rows = column
+            elif len(lengths) == 1:
+                rows = list(map(list, zip(*[iter(parts)] * lengths.pop())))
+            else:
+                rows, start = [], 0
+                for value in column:
+                    rows.append(parts[start:start + len(value)])
+                    start += len(value)
+        # 只有标量的节点很小，直接作为父节点序列化的一部分，不单独计算摘要
+        if leaf:
+            return rows
+        # dict序列化成tuple，list序列化成list，结构相同的dict和list摘要不同
+        digests = list(map(hash, _dumps(rows)))
+        self.digests.update(zip(map(id, column), digests))
+        return digests
+
+
+def compileIgnore(patterns):
+    """
+    忽略的路径，例如$.data[*].update_time，*匹配一个key或者下标，匹配的节点和它的子节点都不比较
+    """
+    if not patterns:
+        return None
+    regex = "|".join(re.escape(pattern).replace(r"\*", r"[^.\[\]]*") for pattern in patterns)
+    return re.compile("(?:{})".format(regex)).fullmatch
+
+
+def diff(old, new, limit=const.DIFF_MAX_ITEMS, ignore=None):
+    """
+    两个json结果的结构化差异，返回[(路径, 类型, 旧值, 新值)]，路径是key和下标组成的tuple。
+    dict按key比较，list去掉相同的开头和结尾后按下标比较（下标是新结果的下标），类型不同时整个节点算作changed，最多返回limit条。
+    每个子树的摘要只计算一次，摘要相同的子树直接跳过；ignore是compileIgnore的返回值
+    """
+    differences = []
+    digests = Digests()
+    # 计算摘要时创建大量小对象，期间触发的gc会反复遍历两个结果，比较完再恢复
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if not digests.same(old, new):
+            _diff(digests, old, new, (), differences, limit, ignore)
+    finally:
+        if enabled:
+            gc.enable()
+    return differences
+
+
+def _add(differences, path, kind, old, new, ignore):
+    if ignore is None or not ignore(formatPath(path)):
+        differences.append((path, kind, old, new))
+
+
+def _diff(digests, old, new, path, differences, limit, ignore):
+    if ignore is not None and path and ignore(formatPath(path)):
+        return
+    if type(old) is dict and type(new) is dict:
+        for key, value in old.items():
+            if len(differences) >= limit:
+                return
+            if key not in new:
+                _add(differences, path + (key,), REMOVED, value, None, ignore)
+            elif not digests.same(value, new[key]):
+                _diff(digests, value, new[key], path + (key,), differences, limit, ignore)
+        for key, value in new.items():
+            if len(differences) >= limit:
+                return
+            if key not in old:
+                _add(differences, path + (key,), ADDED, None, value, ignore)
+    elif type(old) is list and type(new) is list:
+        # 中间插入或者删除元素时，后面的元素不会都算作changed
+        oldKeys, newKeys = digests.listKeys(old), digests.listKeys(new)
+        prefix = _commonLength(oldKeys, newKeys, False)
+        suffix = _commonLength(oldKeys[prefix:], newKeys[prefix:], True)
+        oldEnd, newEnd = len(old) - suffix, len(new) - suffix
+        common = min(oldEnd, newEnd) - prefix
+        for i in range(prefix, prefix + common):
+            if len(differences) >= limit:
+                return
+            if oldKeys[i] != newKeys[i]:
+                _diff(digests, old[i], new[i], path + (i,), differences, limit, ignore)
+        for i in range(prefix + common, oldEnd):
+            _add(differences, path + (i,), REMOVED, old[i], None, ignore)
+        for i in range(prefix + common, newEnd):
+            _add(differences, path + (i,), ADDED, None, new[i], ignore)
+        del differences[limit:]
+    # 1和1.0，True和1在json里不同
+    elif type(old) is not type(new) or old != new:
+        _add(differences, path, CHANGED, old, new, ignore)
+
+
+def _commonLength(old, new, fromEnd):
+    """
+    开头（fromEnd时结尾）相同的元素个数，old和new是元素的比较键，二分查找，只比较还没确定的一半，每次比较在C里执行
+    """
+    if fromEnd:
+        old, new = old[::-1], new[::-1]
+    # [0, low)已经相等，第一个不同的元素在[low, high]中
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[low:middle] == new[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def diffResult(baseRef, loadBase, text, result, limit=const.DIFF_MAX_ITEMS, ignore=None):
+    """
+    和保存的结果比较，baseRef是保存的结果的引用，loadBase(baseRef)读取保存的结果。
+    引用是格式化文本的sha256，和这次结果的文本相同时不需要读取和比较；没有保存的结果时返回None
+    """
+    if not baseRef:
+        return None
+    # 结果相同时文本相同，不需要计算摘要
+    if hashlib.sha256(text.encode("utf-8")).hexdigest() == baseRef[const.BLOB_REF]:
+        return []
+    return diff(loadBase(baseRef), result, limit, ignore)
+
+
+def changedPaths(differences) -> set:
+    """
+    有变化的节点和它们的所有祖先，删除的节点在新结果里不存在，标记它的父节点
+    """
+    paths = set()
+    for path, kind, _, _ in differences:
+        if kind == REMOVED:
+            path = path[:-1]
+        for i in range(len(path) + 1):
+            paths.add(path[:i])
+    return paths
+
+
+def formatPath(path) -> str:
+    """
+    ("items", 3, "name") -> $.items[3].name
+    """
+    return "$" + "".join("[{}]".format(part) if isinstance(part, int) else ".{}".format(part) for part in path)
+
+
+def formatValue(value) -> str:
+    text = utils.objectToCompactJsonStr(value)
+    if len(text) > const.DIFF_VALUE_WIDTH:
+        text = text[:const.DIFF_VALUE_WIDTH] + "..."
+    return text
+
+
+def formatCount(differences, limit=const.DIFF_MAX_ITEMS) -> str:
+    return "{}+".format(len(differences)) if len(differences) >= limit else str(len(differences))
+
+
+def formatDiff(differences) -> str:
+    """
+    每条差异一行：+ 新增，- 删除，~ 修改
+    """
+    lines = []
+    for path, kind, old, new in differences:
+        if kind == ADDED:
+            lines.append("+ {}: {}".format(formatPath(path), formatValue(new)))
+        elif kind == REMOVED:
+            lines.append("- {}: {}".format(formatPath(path), formatValue(old)))
+        else:
+            lines.append("~ {}: {} -> {}".format(formatPath(path), formatValue(old), formatValue(new)))
+    return "\n".join(lines)
@@ -0,0 +1,430 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import array
+import pickle
+import logging
+import threading
+import subprocess
+import collections
+
+import constants as const
+from dispatcher import RpcTask, createDispatcher
+from paramtemplate import compileTemplate
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadworker.py")
+
+
+def getWorkerCommand():
+    """
+    启动工作进程的命令，PyInstaller打包后sys.executable是namekoman本身，没有loadworker.py，用load-worker参数启动
+    """
+    if getattr(sys, "frozen", False):
+        return [sys.executable, const.LOAD_WORKER_COMMAND]
+    return [sys.executable, WORKER_PATH]
+
+
+class LatencyHistogram(object):
+    """
+    HDR风格的延迟直方图，按微秒记录，相对误差小于1/HISTOGRAM_SUB_BUCKETS_HALF。
+    小于HISTOGRAM_SUB_BUCKETS的值每个值一个桶，更大的值每翻一倍分HISTOGRAM_SUB_BUCKETS_HALF个桶，
+    记录和合并都是O(1)，内存固定，不保存原始样本
+    """
+    SUB_BITS = const.HISTOGRAM_SUB_BUCKET_BITS
+    SUB_COUNT = 1 << SUB_BITS
+    HALF = SUB_COUNT >> 1
+
+    def __init__(self):
+        self.counts = array.array("Q", bytes(8 * self._index(const.HISTOGRAM_MAX_VALUE) + 8))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.SUB_COUNT:
+            return value
+        exp = value.bit_length() - self.SUB_BITS
+        return (exp + 1) * self.HALF + (value >> exp) - self.HALF
+
+    def _value(self, index):
+        """
+        桶的中间值
+        """
+        if index < self.SUB_COUNT:
+            return index
+        exp = index // self.HALF - 1
+        low = (index % self.HALF + self.HALF) << exp
+        return low + ((1 << exp) >> 1)
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1000000), 0), const.HISTOGRAM_MAX_VALUE)
+        self.counts[self._index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        if other.count:
+            self.min = min(self.min, other.min) if self.count else other.min
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, p):
+        """
+        第p百分位的延迟，单位秒
+        """
+        if self.count == 0:
+            return 0.0
+        if p >= 100:
+            return self.max / 1000000
+        target = max(1, int(self.count * p / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.max) / 1000000
+        return self.max / 1000000
+
+    def mean(self):
+        return self.total / self.count / 1000000 if self.count else 0.0
+
+    def toDict(self):
+        """
+        只保存非空的桶，用于保存和跨进程传输
+        """
+        return {
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        histogram = cls()
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count, histogram.total = data["count"], data["total"]
+        histogram.min, histogram.max = data["min"], data["max"]
+        return histogram
+
+
+class LoadTask(RpcTask):
+    """
+    压测请求，只计时，不格式化、不保存、不打印结果
+    """
+    def __init__(self, loadTest, scheduledTime=None):
+        # 每个请求渲染一次params模板，不是模板时直接使用原来的params
+        super().__init__(*loadTest.path, loadTest.template.render())
+        self.loadTest = loadTest
+        self.scheduledTime = scheduledTime
+
+    def run(self, client):
+        if self.isCancelled():
+            return None
+        start = time.time()
+        self.capture(client.call, self.service, self.method, self.params)
+        return self.finish(None, start)
+
+    def capture(self, fn, *args, **kwargs):
+        # 压测中的错误只计数，不打印
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+            return None
+
+    def isCancelled(self):
+        return self.loadTest.stopped
+
+    def finishCancelled(self):
+        # 停止后排队的请求直接丢弃，不计入统计
+        return None
+
+    def finish(self, result, start):
+        # 固定速率时从计划发送时间开始计算，排队等待也算进延迟，避免协调遗漏
+        latency = time.time() - (self.scheduledTime or start)
+        self.loadTest.record(latency, self.error is not None)
+        return latency
+
+
+class LoadTest(object):
+    """
+    压测：用concurrency个rpc客户端发送total次请求。
+    rate为0时尽快发送，每个客户端收到结果后立即发送下一个请求；
+    rate大于0时按固定速率（每秒请求数）发送，不等待结果。
+    pipelined为True时只用一个客户端，concurrency是最多同时等待的回复数。
+    params是模板时用env渲染，每个请求的params都不同，模板有错误时抛出TemplateError
+    """
+    def __init__(self, clientFactory, path, params, total=const.LOAD_TEST_TOTAL,
+                 concurrency=const.LOAD_TEST_CONCURRENCY, rate=0, pipelined=False, env=None, baseDir="",
+                 shard=(0, 1)):
+        self.clientFactory = clientFactory
+        self.path = tuple(path)
+        self.params = params
+        self.env = env
+        self.baseDir = baseDir
+        self.template = compileTemplate(params, env, baseDir, shard)
+        self.total = total
+        self.concurrency = concurrency
+        self.rate = rate
+        self.pipelined = pipelined
+        self.processes = 1
+        self.lock = threading.Lock()
+        self.histogram = LatencyHistogram()
+        # 上次取快照之后的延迟，用于实时图表
+        self.window = LatencyHistogram()
+        self.windowStart = 0.0
+        self.sent = 0
+        self.errors = 0
+        # 每秒完成的请求数
+        self.timeline = []
+        self.startTime = 0.0
+        self.endTime = 0.0
+        self.stopped = False
+        # 压测失败的原因，例如工作进程异常退出，失败的压测不保存
+        self.error = None
+        self.finished = threading.Event()
+        self.dispatcher = None
+
+    def start(self):
+        self.startTime = self.windowStart = time.time()
+        self.dispatcher = createDispatcher(self.clientFactory, self.concurrency, self.pipelined)
+        threading.Thread(target=self._send, name="LoadTest", daemon=True).start()
+
+    def _send(self):
+        try:
+            for i in range(self.total):
+                if self.stopped:
+                    break
+                scheduledTime = None
+                if self.rate > 0:
+                    scheduledTime = self.startTime + i / self.rate
+                    delay = scheduledTime - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.dispatcher.submit(LoadTask(self, scheduledTime))
+                with self.lock:
+                    self.sent += 1
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            self.dispatcher.stop()
+            threading.Thread(target=self._wait, name="LoadTestWait", daemon=True).start()
+
+    def _wait(self):
+        self.dispatcher.join()
+        self.endTime = time.time()
+        self.finished.set()
+
+    def record(self, latency, error):
+        with self.lock:
+            self.histogram.record(latency)
+            self.window.record(latency)
+            self._addTimeline(1)
+            if error:
+                self.errors += 1
+
+    def _addTimeline(self, count):
+        second = max(int(time.time() - self.startTime), 0)
+        if second >= len(self.timeline):
+            self.timeline.extend([0] * (second + 1 - len(self.timeline)))
+        self.timeline[second] += count
+
+    def takeWindow(self):
+        """
+        取出上次调用之后的延迟直方图，和目前为止的发送数，错误数，不影响总的统计
+        """
+        with self.lock:
+            window, self.window = self.window, LatencyHistogram()
+            self.windowStart = time.time()
+            return window, self.sent, self.errors
+
+    def stop(self):
+        """
+        停止发送，已经在执行的请求执行完，排队的请求直接丢弃
+        """
+        self.stopped = True
+
+    def isFinished(self):
+        return self.finished.is_set()
+
+    def snapshot(self):
+        """
+        当前统计，window开头的字段是上次调用之后的数据
+        """
+        now = time.time()
+        with self.lock:
+            window, self.window = self.window, LatencyHistogram()
+            windowSeconds, self.windowStart = now - self.windowStart, now
+            done, errors, sent = self.histogram.count, self.errors, self.sent
+            percentiles = {"p{}".format(p): self.histogram.percentile(p) for p in const.LOAD_TEST_PERCENTILES}
+            maxLatency, meanLatency = self.histogram.percentile(100), self.histogram.mean()
+        duration = (self.endTime or now) - self.startTime
+        stats = {
+            "time": self.startTime,
+            "total": self.total,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "pipelined": self.pipelined,
+            "processes": self.processes,
+            "sent": sent,
+            "done": done,
+            "errors": errors,
+            "duration": duration,
+            "throughput": done / duration if duration > 0 else 0.0,
+            "error_rate": errors / done if done else 0.0,
+            "mean": meanLatency,
+            "max": maxLatency,
+            "window_throughput": window.count / windowSeconds if windowSeconds > 0 else 0.0,
+            "window_p99": window.percentile(99),
+        }
+        stats.update(percentiles)
+        return stats
+
+    def summary(self):
+        """
+        保存到method下的结果，不包括实时数据
+        """
+        stats = self.snapshot()
+        for key in ("window_throughput", "window_p99"):
+            stats.pop(key)
+        with self.lock:
+            stats["timeline"] = list(self.timeline)
+        return stats
+
+
+def split(value, parts):
+    """
+    把value尽量平均地分成parts份
+    """
+    return [value // parts + (1 if i < value % parts else 0) for i in range(parts)]
+
+
+class ProcessLoadTest(LoadTest):
+    """
+    多进程压测：processes个工作进程（loadworker.py）各自用clientFactory创建rpc客户端，平分请求数，并发数和速率，
+    每隔LOAD_WORKER_REPORT_INTERVAL把这段时间的延迟直方图发回主进程合并成总的直方图和吞吐时间线，
+    发送请求不受主进程GIL的限制。所有工作进程准备好后同时开始，启动进程和导入的时间不计入压测。
+    每个工作进程自己编译params模板，序列和文件的行按进程错开。
+    工作进程异常退出或者没有停止就少发了请求时，停止所有工作进程，error是这个进程stderr的最后几行
+    """
+    def __init__(self, clientFactory, path, params, total=const.LOAD_TEST_TOTAL,
+                 concurrency=const.LOAD_TEST_CONCURRENCY, rate=0, pipelined=False, processes=1, env=None, baseDir=""):
+        super().__init__(clientFactory, path, params, total, concurrency, rate, pipelined, env, baseDir)
+        self.processes = max(1, min(processes, total))
+        self.workers = []
+        self.ready = set()
+        self.exited = 0
+        self.commandLock = threading.Lock()
+        # 每个工作进程的请求数，已发送数和stderr的最后几行
+        self.workerTotals = {}
+        self.workerSent = {}
+        self.workerErrors = {}
+
+    def start(self):
+        self.startTime = self.windowStart = time.time()
+        totals = split(self.total, self.processes)
+        concurrencies = split(max(self.concurrency, self.processes), self.processes)
+        for i, (total, concurrency) in enumerate(zip(totals, concurrencies)):
+            worker = subprocess.Popen(
+                getWorkerCommand(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            self.workerTotals[worker], self.workerSent[worker] = total, 0
+            self.workerErrors[worker] = collections.deque(maxlen=const.LOAD_WORKER_STDERR_LINES)
+            self.workers.append(worker)
+            try:
+                pickle.dump((
+                    self.clientFactory, self.path, self.params, total, concurrency, self.rate / self.processes,
+                    self.pipelined, self.env, self.baseDir, (i, self.processes)
+                ), worker.stdin)
+                worker.stdin.flush()
+            except OSError:
+                # 进程启动后立即退出，原因从stderr读取
+                pass
+        for i, worker in enumerate(self.workers):
+            threading.Thread(target=self._read, args=(worker, i), name="LoadWorker-{}".format(i), daemon=True).start()
+
+    def _readErrors(self, worker):
+        for line in worker.stderr:
+            self.workerErrors[worker].append(line.decode("utf-8", "replace").rstrip())
+
+    def _read(self, worker, i):
+        errorReader = threading.Thread(target=self._readErrors, args=(worker,), daemon=True)
+        errorReader.start()
+        for line in worker.stdout:
+            try:
+                data = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            if data.get("ready"):
+                self._setReady(worker)
+            else:
+                self._merge(worker, data)
+        code = worker.wait()
+        errorReader.join()
+        unsent = self.workerTotals[worker] - self.workerSent[worker]
+        if code != 0 or (unsent > 0 and not self.stopped):
+            stderr = "\n".join(self.workerErrors[worker])
+            logging.error("Load worker {} exited with code {}, unsent: {}, stderr:\n{}".format(i, code, unsent, stderr))
+            with self.lock:
+                if self.error is None:
+                    self.error = "Load worker {} exited with code {}, unsent requests: {}, {}".format(
+                        i, code, unsent, stderr.strip().splitlines()[-1] if stderr.strip() else "no output"
+                    )
+            self.stop()
+        # 没有准备好就退出的进程不再等待
+        self._setReady(worker)
+        with self.lock:
+            self.exited += 1
+            if self.exited < len(self.workers):
+                return
+        self.endTime = time.time()
+        self.finished.set()
+
+    def _setReady(self, worker):
+        with self.lock:
+            if worker in self.ready:
+                return
+            self.ready.add(worker)
+            if len(self.ready) < len(self.workers):
+                return
+            self.startTime = self.windowStart = time.time()
+        for other in self.workers:
+            self._command(other, "stop" if self.stopped else "start")
+
+    def _command(self, worker, command):
+        with self.commandLock:
+            try:
+                worker.stdin.write(command.encode("utf-8") + b"\n")
+                worker.stdin.flush()
+            except (OSError, ValueError):
+                # 进程已经退出
+                pass
+
+    def _merge(self, worker, data):
+        histogram = LatencyHistogram.fromDict(data["histogram"])
+        with self.lock:
+            self.workerSent[worker] += data["sent"]
+            self.histogram.merge(histogram)
+            self.window.merge(histogram)
+            self._addTimeline(histogram.count)
+            self.sent += data["sent"]
+            self.errors += data["errors"]
+
+    def stop(self):
+        self.stopped = True
+        for worker in self.workers:
+            self._command(worker, "stop")
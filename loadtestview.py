@@ -0,0 +1,272 @@
+# -*- coding:utf-8 -*-
+
+import os
+import time
+import logging
+import collections
+
+from PyQt5.QtCore import Qt as QtCoreQt, QTimer, QPointF
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF, QIntValidator
+from PyQt5.QtWidgets import (
+    QWidget, QDialog, QLabel, QLineEdit, QPushButton, QCheckBox, QTableWidget, QTableWidgetItem,
+    QBoxLayout, QFormLayout, QHeaderView
+)
+
+import constants as const
+from loadtest import LoadTest, ProcessLoadTest
+from paramtemplate import TemplateError
+
+
+def formatLatency(seconds):
+    return "{:.1f}ms".format(seconds * 1000)
+
+
+def getScalings(runs):
+    """
+    每次压测的吞吐相对于之前最近一次同样设置（请求数，并发数，速率，流水线）的单进程压测的倍数，没有时为None
+    """
+    singles = {}
+    scalings = []
+    for run in runs:
+        key = tuple(run.get(name) for name in ("total", "concurrency", "rate", "pipelined"))
+        base = singles.get(key)
+        scalings.append(run["throughput"] / base if base else None)
+        if (run.get("processes") or 1) == 1:
+            singles[key] = run["throughput"]
+    return scalings
+
+
+class LineChart(QWidget):
+    """
+    简单的实时折线图，每条线按自己的最大值缩放，图例显示当前值
+    """
+    COLORS = (QColor(30, 120, 220), QColor(220, 80, 40))
+
+    def __init__(self, names):
+        super().__init__()
+        self.names = names
+        self.series = [collections.deque(maxlen=const.LOAD_TEST_CHART_POINTS) for _ in names]
+        self.labels = ["" for _ in names]
+        self.setMinimumHeight(160)
+
+    def clear(self):
+        for points in self.series:
+            points.clear()
+        self.update()
+
+    def append(self, values, labels):
+        for points, value in zip(self.series, values):
+            points.append(value)
+        self.labels = labels
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        rect = self.rect().adjusted(5, 20, -5, -5)
+        painter.fillRect(self.rect(), QtCoreQt.white)
+        painter.setPen(QtCoreQt.lightGray)
+        painter.drawRect(rect)
+        step = rect.width() / max(const.LOAD_TEST_CHART_POINTS - 1, 1)
+        for i, (name, points) in enumerate(zip(self.names, self.series)):
+            pen = QPen(self.COLORS[i % len(self.COLORS)])
+            pen.setWidth(2)
+            painter.setPen(pen)
+            painter.drawText(5 + i * 220, 15, "{}: {}".format(name, self.labels[i]))
+            if len(points) < 2:
+                continue
+            top = max(points) or 1
+            painter.drawPolyline(QPolygonF([
+                QPointF(rect.left() + j * step, rect.bottom() - value / top * rect.height())
+                for j, value in enumerate(points)
+            ]))
+
+
+class LoadTestDialog(QDialog):
+    """
+    压测窗口：设置请求数，并发数，速率和进程数，实时显示吞吐和延迟，结束后结果保存到method下，
+    表格中列出最近几次压测结果，方便对比，scaling是吞吐相对于同样设置的单进程压测的倍数。
+    params是模板时每个请求用env渲染一次
+    """
+    COLUMNS = (
+        "time", "total", "concurrency", "rate", "pipelined", "processes", "throughput", "scaling", "error_rate",
+        "p50", "p90", "p99", "max"
+    )
+
+    def __init__(self, parent, storage, clientFactory, path, params, env=None, baseDir=""):
+        super().__init__(parent)
+        self.storage = storage
+        self.clientFactory = clientFactory
+        self.path = tuple(path)
+        self.params = params
+        self.env = env
+        self.baseDir = baseDir
+        self.loadTest = None
+        # 扩展测试中还没执行的进程数
+        self.pendingProcesses = []
+        self.setWindowTitle("Load test: {}".format("/".join(self.path)))
+        self.resize(900, 600)
+
+        self.totalEdit = QLineEdit(str(const.LOAD_TEST_TOTAL))
+        self.totalEdit.setValidator(QIntValidator(1, 10000000))
+        self.concurrencyEdit = QLineEdit(str(const.LOAD_TEST_CONCURRENCY))
+        self.concurrencyEdit.setValidator(QIntValidator(1, const.PIPELINE_SIZE * 4))
+        self.rateEdit = QLineEdit("0")
+        self.rateEdit.setValidator(QIntValidator(0, 100000))
+        self.rateEdit.setToolTip("Requests per second, 0 means as fast as possible")
+        self.pipelineCheck = QCheckBox("pipeline over one connection")
+        self.pipelineCheck.setToolTip("Send all requests through one client, concurrency is the max replies waited for")
+        self.processesEdit = QLineEdit("1")
+        self.processesEdit.setValidator(QIntValidator(1, (os.cpu_count() or 1) * 4))
+        self.processesEdit.setToolTip(
+            "Worker processes, each with its own rpc clients, requests, concurrency and rate are split between them"
+        )
+        self.scaleCheck = QCheckBox("scale from 1 to N processes")
+        self.scaleCheck.setToolTip("Run once with 1, 2, 4 ... N processes to show how throughput scales")
+        self.startButton = QPushButton("Start")
+        self.startButton.clicked.connect(self.onStartOrStop)
+        self.statsLabel = QLabel("")
+        self.statsLabel.setTextInteractionFlags(QtCoreQt.TextSelectableByMouse)
+        self.chart = LineChart(("throughput", "p99"))
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        form = QFormLayout()
+        form.addRow("requests", self.totalEdit)
+        form.addRow("concurrency", self.concurrencyEdit)
+        form.addRow("rate (req/s)", self.rateEdit)
+        form.addRow("processes", self.processesEdit)
+        form.addRow(self.pipelineCheck)
+        form.addRow(self.scaleCheck)
+        form.addRow(self.startButton)
+        layout = QBoxLayout(QBoxLayout.TopToBottom)
+        layout.addLayout(form)
+        layout.addWidget(self.statsLabel)
+        layout.addWidget(self.chart)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.loadHistory()
+
+    def onStartOrStop(self):
+        if self.loadTest is not None:
+            self.pendingProcesses = []
+            self.loadTest.stop()
+            self.startButton.setDisabled(True)
+            return
+        try:
+            processes = int(self.processesEdit.text() or 1)
+        except Exception as e:
+            logging.exception(e)
+            self.statsLabel.setText("Invalid processes: {!r}".format(e))
+            return
+        if self.scaleCheck.isChecked():
+            # 1, 2, 4 ... N
+            self.pendingProcesses = [1 << i for i in range(processes.bit_length()) if 1 << i < processes] + [processes]
+        else:
+            self.pendingProcesses = [processes]
+        self.startNext()
+
+    def startNext(self):
+        processes = self.pendingProcesses.pop(0)
+        try:
+            total, concurrency, rate = (
+                int(self.totalEdit.text()), int(self.concurrencyEdit.text()), int(self.rateEdit.text() or 0)
+            )
+        except Exception as e:
+            logging.exception(e)
+            self.statsLabel.setText("Invalid requests or concurrency: {!r}".format(e))
+            self.pendingProcesses = []
+            return
+        self.chart.clear()
+        args = (self.clientFactory, self.path, self.params, total, concurrency, rate, self.pipelineCheck.isChecked())
+        try:
+            # 扩展测试的单进程也用工作进程，和多进程的开销一致
+            if processes > 1 or self.scaleCheck.isChecked():
+                self.loadTest = ProcessLoadTest(*args, processes=processes, env=self.env, baseDir=self.baseDir)
+            else:
+                self.loadTest = LoadTest(*args, env=self.env, baseDir=self.baseDir)
+        except TemplateError as e:
+            self.statsLabel.setText("Invalid params template: {}".format(e))
+            self.pendingProcesses = []
+            return
+        self.loadTest.start()
+        logging.info(
+            "Load test start, method: {}, requests: {}, concurrency: {}, rate: {}, processes: {}".format(
+                "/".join(self.path), total, concurrency, rate, processes
+            )
+        )
+        self.startButton.setText("Stop")
+        self.timer.start(const.LOAD_TEST_REFRESH_INTERVAL)
+
+    def refresh(self):
+        stats = self.loadTest.snapshot()
+        self.statsLabel.setText(
+            "sent: {sent}/{total}, done: {done}, errors: {errors} ({error_rate:.1%}), "
+            "throughput: {throughput:.1f}/s, ".format(**stats)
+            + ", ".join("{}: {}".format(key, formatLatency(stats[key])) for key in ("p50", "p90", "p99", "max"))
+        )
+        self.chart.append(
+            (stats["window_throughput"], stats["window_p99"]),
+            ("{:.1f}/s".format(stats["window_throughput"]), formatLatency(stats["window_p99"]))
+        )
+        if self.loadTest.isFinished():
+            self.onFinished()
+
+    def onFinished(self):
+        self.timer.stop()
+        if self.loadTest.error:
+            # 工作进程异常退出，统计不完整，不保存
+            self.statsLabel.setText("Load test failed: {}".format(self.loadTest.error))
+            self.loadTest = None
+            self.pendingProcesses = []
+            self.startButton.setText("Start")
+            self.startButton.setDisabled(False)
+            return
+        summary = self.loadTest.summary()
+        self.loadTest = None
+        self.storage.addLoadTestResult(*self.path, summary)
+        logging.info("Load test end, method: {}, summary: {}".format("/".join(self.path), summary))
+        self.loadHistory()
+        if self.pendingProcesses:
+            self.startNext()
+            return
+        self.startButton.setText("Start")
+        self.startButton.setDisabled(False)
+
+    def loadHistory(self):
+        runs = self.storage.getLoadTestResults(*self.path)
+        scalings = getScalings(runs)
+        self.table.setRowCount(len(runs))
+        for row, (run, scaling) in enumerate(zip(reversed(runs), reversed(scalings))):
+            for column, key in enumerate(self.COLUMNS):
+                value = run.get(key, "")
+                if key == "processes":
+                    text = str(value or 1)
+                elif key == "scaling":
+                    text = "" if scaling is None else "x{:.2f}".format(scaling)
+                elif key == "time":
+                    text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+                elif key == "throughput":
+                    text = "{:.1f}/s".format(value)
+                elif key == "error_rate":
+                    text = "{:.1%}".format(value)
+                elif key in ("p50", "p90", "p99", "max"):
+                    text = formatLatency(value)
+                else:
+                    text = str(value)
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    def closeEvent(self, event):
+        # 关闭窗口时停止压测，等待中的结果不再保存
+        self.pendingProcesses = []
+        if self.loadTest is not None:
+            self.loadTest.stop()
+            self.loadTest = None
+        self.timer.stop()
+        super().closeEvent(event)
@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+"""
+多进程压测的工作进程，由ProcessLoadTest启动，不单独使用。
+stdin先读取pickle的(clientFactory, path, params, total, concurrency, rate, pipelined, env, baseDir, shard)，
+之后每行一个命令：start，stop；
+stdout每行一个json：准备好后输出{"ready": true}，开始后每隔LOAD_WORKER_REPORT_INTERVAL秒输出这段时间的
+{"histogram": ..., "sent": ..., "errors": ...}，压测结束后退出
+"""
+
+import os
+import sys
+import json
+import pickle
+import threading
+
+import constants as const
+from loadtest import LoadTest
+
+
+def write(data):
+    sys.stdout.write(json.dumps(data, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+def waitStop(loadTest):
+    for line in sys.stdin.buffer:
+        if line.strip() == b"stop":
+            break
+    # 收到stop，或者主进程退出stdin关闭
+    loadTest.stop()
+
+
+def main():
+    clientFactory, path, params, total, concurrency, rate, pipelined, env, baseDir, shard = pickle.load(
+        sys.stdin.buffer
+    )
+    loadTest = LoadTest(clientFactory, path, params, total, concurrency, rate, pipelined, env, baseDir, shard)
+    # 提前导入nameko，不计入压测时间
+    import rpcclient  # noqa: F401
+    write({"ready": True})
+    if sys.stdin.buffer.readline().strip() != b"start":
+        return
+    threading.Thread(target=waitStop, args=(loadTest,), name="LoadWorkerStop", daemon=True).start()
+    loadTest.start()
+    sent, errors = 0, 0
+    while True:
+        finished = loadTest.finished.wait(const.LOAD_WORKER_REPORT_INTERVAL)
+        window, totalSent, totalErrors = loadTest.takeWindow()
+        write({"histogram": window.toDict(), "sent": totalSent - sent, "errors": totalErrors - errors})
+        sent, errors = totalSent, totalErrors
+        if finished:
+            break
+    # 等待stop的线程还在读stdin，正常退出时解释器关闭stdin会异常终止，直接退出
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,56 @@ import os
 import sys
 import json
 import time
+
+# 启动时间，需要在导入其它模块之前记录，用于启动耗时统计
+START_TIME = time.time()
+
+# python -m namekoman run ...：命令行执行保存的请求，不导入PyQt5
+if __name__ == "__main__" and sys.argv[1:2] == ["run"]:
+    import runner
+    sys.exit(runner.main(sys.argv[2:]))
+
+# python -m namekoman gc：删除没有被引用的结果文件
+if __name__ == "__main__" and sys.argv[1:2] == ["gc"]:
+    import runner
+    sys.exit(runner.gcMain(sys.argv[2:]))
+
+# 打包后的程序启动多进程压测的工作进程：namekoman load-worker
+if __name__ == "__main__" and sys.argv[1:2] == ["load-worker"]:
+    import loadworker
+    sys.exit(loadworker.main())
+
+import queue
 import logging
+import functools
+import threading
 import traceback
 import collections
+import logging.handlers
 
-from nameko.cli.utils.config import setup_config
-from nameko.standalone.rpc import ClusterRpcClient
-from PyQt5.Qt import QStandardItem, QStandardItemModel, QPoint, QCursor, QIntValidator
-from PyQt5.QtCore import Qt as QtCoreQt, pyqtSignal, QThread, QObject
-from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtCore import (
+    Qt as QtCoreQt, pyqtSignal, QObject, QAbstractItemModel, QModelIndex, QSettings, QTimer, QPoint
+)
+from PyQt5.QtGui import QMouseEvent, QCursor, QIntValidator
 from PyQt5.Qsci import QsciScintilla, QsciLexerJSON
 from PyQt5.QtWidgets import (
     QWidget, QTreeView, QPushButton, QLineEdit, QPlainTextEdit,
-    QLabel, QGridLayout, QApplication, QBoxLayout,
-    QInputDialog, QMessageBox, QMenu, QScrollArea
+    QGridLayout, QApplication, QBoxLayout, QComboBox, QCheckBox,
+    QInputDialog, QMessageBox, QMenu, QLabel
 )
 import utils
 import constants as const
-from storage import Storage
+from storage import createStorage, NODE_COLUMNS
+from resultview import ResultViewer, LoadThread
+from paramseditor import NamekoManQsciScintilla
+from dispatcher import RpcTask, createRpcClient
+from profiles import ProfileStore, DispatcherPool, getProfilesPath
+from paramtemplate import TemplateError, compileTemplate, isTemplate, getBaseDir
+from jsondiff import diffResult
+from loadtestview import LoadTestDialog
+from runnerview import BatchRunDialog
+from compareview import CompareDialog
+from history import toSample, formatStats, sparkline
 
 
 def getFilePath(filepath):
@@ -30,13 +62,27 @@ def getFilePath(filepath):
 
 
 DATA_FILE_PATH = getFilePath("namekoman.json")
+LOG_FILE_PATH = getFilePath(const.LOG_FILE)
+SQLITE_FILE_PATH = getFilePath("namekoman.db")
+
+# 存在namekoman.db时使用SQLite存储，可以用sqlitestorage.py从namekoman.json迁移
+storage = createStorage(SQLITE_FILE_PATH if os.path.exists(SQLITE_FILE_PATH) else DATA_FILE_PATH)
 
-storage = Storage(DATA_FILE_PATH)
+# 最近显示过的结果，key为方法路径和结果的sha256，value为(结果对象, 格式化文本)
+resultCache = utils.LRUCache(const.RESULT_CACHE_SIZE)
 
 
+def getResultCacheKey(path, ref):
+    return tuple(path) + (ref[const.BLOB_REF] if ref else None,)
+
+
+def loadResultEntry(path):
+    """
+    读取并解析保存的结果，返回(结果对象, 格式化文本)，可以在工作线程中调用
+    """
+    text = storage.getResultText(*path)
+    return json.loads(text), text
 
-def getAMQPConfig(broker):
-    return {const.AMQP_URI_CONFIG_KEY: broker}
 
 
 def alert(text: str):
@@ -46,38 +92,109 @@ def alert(text: str):
     box.exec_()
 
 
+def setupFileLogging(path):
+    """
+    完整日志写入按大小滚动的文件，由后台线程QueueListener写入，返回listener，退出时需要stop
+    """
+    fileHandler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=const.LOG_FILE_MAX_BYTES, backupCount=const.LOG_FILE_BACKUP_COUNT, encoding="utf-8"
+    )
+    fileHandler.setFormatter(logging.Formatter(const.LOG_FORMAT))
+    logQueue = queue.Queue()
+    listener = logging.handlers.QueueListener(logQueue, fileHandler)
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(logQueue))
+    listener.start()
+    return listener
+
+
 class QTextEditLogger(logging.Handler, QObject):
-    logSignal = pyqtSignal(str)
+    """
+    日志显示控件，日志先放入缓冲区，由定时器批量追加到控件，控件最多保留LOG_MAX_BLOCKS行，
+    过长的日志截断显示，完整日志见namekoman.log
+    """
 
     def __init__(self, parent):
         super().__init__()
         QObject.__init__(self)
         self.widget = QPlainTextEdit(parent)
         self.widget.setReadOnly(True)
-        self.logSignal.connect(self.widget.appendPlainText)
+        self.widget.setMaximumBlockCount(const.LOG_MAX_BLOCKS)
+        self.buffer = collections.deque(maxlen=const.LOG_MAX_BLOCKS)
+        self.bufferLock = threading.Lock()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flushBuffer)
+        self.timer.start(const.LOG_FLUSH_INTERVAL)
 
     def emit(self, record):
         msg = self.format(record)
-        self.logSignal.emit(msg)
+        if len(msg) > const.LOG_MAX_MESSAGE_LENGTH:
+            msg = "{}...... ({} characters, see {} for the whole log)".format(
+                msg[:const.LOG_MAX_MESSAGE_LENGTH], len(msg), const.LOG_FILE
+            )
+        with self.bufferLock:
+            self.buffer.append(msg)
+
+    def flushBuffer(self):
+        with self.bufferLock:
+            if not self.buffer:
+                return
+            lines = list(self.buffer)
+            self.buffer.clear()
+        self.widget.appendPlainText("\n".join(lines))
 
 
-class TreeNode(QStandardItem):
+class TreeNode(object):
     """
     节点类型
     project节点：项目
     service节点：服务，service节点service，module，method相同
     module节点：模块，一个service可以根据业务分为模块，模块的module和method相同
     method节点：方法，一个module下有对个rpc方法
+    子节点在展开时才从storage读取，children为None表示还没有读取。
+    节点只保存自己的名字，project，service，module，method都沿父节点向上得到，
+    所以重命名只需要修改当前节点和storage中的一个key
     """
-    def __init__(self, *args, nodeType, project, service, module, method, **kwargs):
+    def __init__(self, text, nodeType):
 
         self.setType(nodeType)
-        self.setProjectName(project)
-        self.setServiceName(service)
-        self.setModuleName(module)
-        self.setMethodName(method)
 
-        super().__init__(*args, **kwargs)
+        self.text = text
+        self.parentNode = None
+        self.rowNumber = 0
+        self.children = [] if nodeType == const.NODE_METHOD else None
+        # 未展开时缓存子节点名字，避免每次绘制都查询storage
+        self.childNames = None
+        # 搜索时路径上还没有匹配的token，为空时子树全部显示
+        self.searchRemaining = ()
+
+    def setText(self, text):
+        self.text = text
+
+    def child(self, index):
+        if self.children is not None and index < len(self.children):
+            return self.children[index]
+        return None
+
+    def row(self):
+        return self.rowNumber
+
+    def getPath(self):
+        """
+        从project到当前节点的名字，最多向上查找4层
+        """
+        path = []
+        node = self
+        while node is not None and node.getType() != const.NODE_ROOT:
+            path.append(node.text)
+            node = node.parentNode
+        return tuple(reversed(path))
+
+    def _getNames(self):
+        """
+        (project, service, module, method)，比当前节点层级低的名字用当前节点名字填充
+        """
+        path = self.getPath()
+        return path + (path[-1],) * (len(NODE_COLUMNS) - len(path))
 
     def setType(self, nodeType):
         self.nodeType = nodeType
@@ -85,130 +202,100 @@ class TreeNode(QStandardItem):
     def getType(self):
         return self.nodeType
 
-    def setProjectName(self, project):
-        self.project = project
-
     def getProjectName(self):
-        return self.project
+        return self._getNames()[0]
 
     def getServiceName(self):
-        return self.service
-
-    def setServiceName(self, service):
-        self.service = service
+        return self._getNames()[1]
 
     def getModuleName(self):
-        return self.module
-
-    def setModuleName(self, module):
-        self.module = module
+        return self._getNames()[2]
 
     def getMethodName(self):
-        return self.method
-
-    def setMethodName(self, method):
-        self.method = method
+        return self._getNames()[3]
 
     def updateParams(self, params):
-        storage.updateParams(self.project, self.service, self.module, self.method, params)
+        storage.updateParams(*self._getNames(), params)
 
     def getParams(self):
         if self.getType() == const.NODE_METHOD:
-            return storage.getParam(self.project, self.service, self.module, self.method)
+            return storage.getParam(*self._getNames())
         else:
             return collections.OrderedDict()
 
     def getResult(self):
-        if self.getType() == const.NODE_METHOD:
-            return storage.getResult(self.project, self.service, self.module, self.method)
-        else:
-            return collections.OrderedDict()
+        return self.getResultEntry()[0]
+
+    def getResultEntry(self):
+        """
+        (结果对象, 格式化文本)，同一个结果只读取和解析一次
+        """
+        entry = self.getCachedResultEntry()
+        if entry is None:
+            names = self._getNames()
+            entry = loadResultEntry(names)
+            resultCache.put(getResultCacheKey(names, storage.getResultRef(*names)), entry)
+        return entry
+
+    def getCachedResultEntry(self):
+        """
+        缓存中的(结果对象, 格式化文本)，没有缓存时返回None，不读取文件
+        """
+        if self.getType() != const.NODE_METHOD:
+            return collections.OrderedDict(), ""
+        names = self._getNames()
+        return resultCache.get(getResultCacheKey(names, storage.getResultRef(*names)))
 
     def getNodeInfo(self):
+        """
+        节点数据，method的结果没有缓存时result为None，由界面在工作线程中读取
+        """
+        project, service, module, method = self._getNames()
+        params = self.getParams()
+        result = (self.getCachedResultEntry() or (None, ""))[0]
         info = {
-            const.NODE_PROJECT: self.project,
-            const.NODE_SERVICE: self.service,
-            const.NODE_MODULE: self.module,
-            const.NODE_METHOD: self.method,
-            const.PARAMS: self.getParams(),
-            const.RESULT: self.getResult(),
+            const.NODE_PROJECT: project,
+            const.NODE_SERVICE: service,
+            const.NODE_MODULE: module,
+            const.NODE_METHOD: method,
+            const.PARAMS: params,
+            const.RESULT: result,
             const.NODE_TYPE: self.getType()
         }
-        logging.info("TreeNode info: {}".format(utils.objectToJsonStr(info)))
+        # 只记录结果的引用和大小，大结果每次点击都格式化和写日志很慢，也会很快把日志文件滚动掉
+        ref = storage.getResultRef(project, service, module, method) if self.getType() == const.NODE_METHOD else None
+        logging.info(
+            "TreeNode info: type: {}, path: {}, params: {}, result: {}".format(
+                self.getType(), "/".join(self.getPath()), utils.objectToCompactJsonStr(params),
+                "{}, {} bytes".format(ref[const.BLOB_REF], ref[const.BLOB_SIZE]) if ref else None
+            )
+        )
         return info
 
     def getName(self):
-        return self.getNodeInfo()[self.getType()]
+        return self.text
 
     def updateName(self, name):
+        path = self.getPath()
         if self.getType() == const.NODE_PROJECT:
-            flag = storage.updateProjectName(self.project, name)
-            if not flag:
-                return False
-            self.setProjectName(name)
-            self.setServiceName(name)
-            self.setModuleName(name)
-            self.setMethodName(name)
-
-            index = 0
-            while self.child(index):
-                serviceNode = self.child(index)
-                serviceNode.setProjectName(name)
-                index2 = 0
-                while serviceNode.child(index2):
-                    moduleNode = serviceNode.child(index2)
-                    moduleNode.setProjectName(name)
-                    index3 = 0
-                    while moduleNode.child(index3):
-                        methodNode = moduleNode.child(index3)
-                        methodNode.setServiceName(name)
-                        index3 += 1
-                    index2 += 1
-                index += 1
+            flag = storage.updateProjectName(*path, name)
         elif self.getType() == const.NODE_SERVICE:
-            flag = storage.updateServiceName(self.project, self.service, name)
-            if not flag:
-                return False
-            self.setServiceName(name)
-            self.setModuleName(name)
-            self.setMethodName(name)
-
-            # 更新所有子节点service，包括module，和module的method
-            index = 0
-            while self.child(index):
-                moduleNode = self.child(index)
-                moduleNode.setServiceName(name)
-                index2 = 0
-                while moduleNode.child(index2):
-                    methodNode = moduleNode.child(index2)
-                    methodNode.setServiceName(name)
-                    index2 += 1
-                index += 1
+            flag = storage.updateServiceName(*path, name)
         elif self.getType() == const.NODE_MODULE:
-            flag = storage.updateModuleName(self.project, self.service, self.module, name)
-            if not flag:
-                return False
-            self.setModuleName(name)
-            self.setMethodName(name)
-
-            # 更新所有子节点module
-            index = 0
-            while self.child(index):
-                childNode = self.child(index)
-                childNode.setModuleName(name)
-                index += 1
+            flag = storage.updateModuleName(*path, name)
         else:
-            flag = storage.updateMethodName(self.project, self.service, self.module, self.method, name)
-            if not flag:
-                return False
-            self.setMethodName(name)
+            flag = storage.updateMethodName(*path, name)
+        if not flag:
+            return False
 
         self.setText(name)
         self.loggingInfo()
         return True
 
     def getParent(self):
-        return self.parent()
+        if self.parentNode is None or self.parentNode.getType() == const.NODE_ROOT:
+            return None
+        return self.parentNode
 
     def loggingInfo(self):
         logging.info(
@@ -218,12 +305,207 @@ class TreeNode(QStandardItem):
         )
 
 
+def newNode(path) -> TreeNode:
+    """
+    根据从project开始的路径创建节点，路径长度决定节点类型，节点加入模型后才能得到完整路径
+    """
+    return TreeNode(path[-1], nodeType=NODE_COLUMNS[len(path) - 1])
+
+
+class FolderTreeModel(QAbstractItemModel):
+    """
+    文件夹树的数据模型，直接从storage读取，节点展开时才创建子节点
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.root = TreeNode("", nodeType=const.NODE_ROOT)
+        # 正在执行请求的method路径和请求数
+        self.running = collections.Counter()
+        # 最近调用比平时慢的method路径
+        self.slower = set()
+        # 当前的搜索结果，为None时显示所有节点
+        self.search = None
+
+    def nodeFromIndex(self, index: QModelIndex) -> TreeNode:
+        if index.isValid():
+            return index.internalPointer()
+        return None
+
+    def indexFromNode(self, node: TreeNode) -> QModelIndex:
+        if node is None or node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row(), 0, node)
+
+    def _node(self, index: QModelIndex) -> TreeNode:
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        child = node.child(row)
+        if column != 0 or child is None:
+            return QModelIndex()
+        return self.createIndex(row, column, child)
+
+    def parent(self, index=QModelIndex()):
+        node = self.nodeFromIndex(index)
+        if node is None:
+            return QModelIndex()
+        return self.indexFromNode(node.parentNode)
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self._node(parent)
+        return len(node.children) if node.children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=QtCoreQt.DisplayRole):
+        if role == QtCoreQt.DisplayRole and index.isValid():
+            node = index.internalPointer()
+            if node.getType() != const.NODE_METHOD:
+                return node.text
+            path = node.getPath()
+            text = node.text + const.NODE_SLOWER_SUFFIX if path in self.slower else node.text
+            return text + const.NODE_RUNNING_SUFFIX if self.running[path] > 0 else text
+        return None
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.children is None:
+            if node.childNames is None:
+                node.childNames = self._listChildren(node)
+            return len(node.childNames) > 0
+        return len(node.children) > 0
+
+    def _listChildren(self, node: TreeNode):
+        """
+        [(子节点名字, 搜索时还没有匹配的token)]，搜索时只返回自己或者下面有匹配的子节点
+        """
+        path = node.getPath()
+        names = storage.listChildren(*path)
+        if self.search is None:
+            return [(name, ()) for name in names]
+        remaining = self.search.rootRemaining() if node is self.root else node.searchRemaining
+        return self.search.filterChildren(path, remaining, names)
+
+    def setSearch(self, search):
+        """
+        设置搜索结果后重新读取所有节点，为None时取消搜索
+        """
+        self.beginResetModel()
+        self.search = search
+        self.root.children = None
+        self.root.childNames = None
+        self.endResetModel()
+
+    def canFetchMore(self, parent):
+        return self._node(parent).children is None
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if node.children is not None:
+            return
+        path = node.getPath()
+        children = []
+        for name, remaining in self._listChildren(node):
+            child = newNode(path + (name,))
+            child.searchRemaining = remaining
+            children.append(child)
+        node.childNames = None
+        if not children:
+            node.children = []
+            return
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        node.children = []
+        for child in children:
+            self._attach(node, child)
+        self.endInsertRows()
+
+    def _attach(self, parent: TreeNode, child: TreeNode):
+        child.parentNode = parent
+        child.rowNumber = len(parent.children)
+        parent.children.append(child)
+
+    def appendNode(self, parent: TreeNode, node: TreeNode):
+        """
+        添加子节点，调用前storage中已经添加了该节点。父节点还没展开过时直接从storage读取
+        """
+        parent = parent or self.root
+        parentIndex = self.indexFromNode(parent)
+        if parent.children is None:
+            self.fetchMore(parentIndex)
+            return
+        self.beginInsertRows(parentIndex, len(parent.children), len(parent.children))
+        self._attach(parent, node)
+        self.endInsertRows()
+
+    def removeNode(self, node: TreeNode):
+        parent = node.parentNode
+        row = node.row()
+        self.beginRemoveRows(self.indexFromNode(parent), row, row)
+        del parent.children[row]
+        for sibling in parent.children[row:]:
+            sibling.rowNumber -= 1
+        self.endRemoveRows()
+
+    def nodeChanged(self, node: TreeNode):
+        index = self.indexFromNode(node)
+        self.dataChanged.emit(index, index)
+
+    def findNode(self, path) -> TreeNode:
+        """
+        按路径查找已经读取的节点，没有读取过返回None
+        """
+        node = self.root
+        for name in path:
+            node = next((child for child in node.children or [] if child.text == name), None)
+            if node is None:
+                return None
+        return node
+
+    def setRunning(self, path, delta):
+        """
+        增减method正在执行的请求数，刷新节点显示
+        """
+        path = tuple(path)
+        self.running[path] += delta
+        if self.running[path] <= 0:
+            del self.running[path]
+        node = self.findNode(path)
+        if node is not None:
+            self.nodeChanged(node)
+
+    def setSlower(self, path, slower):
+        """
+        标记method最近的调用是否比平时慢，刷新节点显示
+        """
+        path = tuple(path)
+        if slower == (path in self.slower):
+            return
+        if slower:
+            self.slower.add(path)
+        else:
+            self.slower.discard(path)
+        node = self.findNode(path)
+        if node is not None:
+            self.nodeChanged(node)
+
+    def iterFetchedNodes(self, node: TreeNode = None):
+        """
+        遍历所有已经读取的节点
+        """
+        for child in (node or self.root).children or []:
+            yield child
+            yield from self.iterFetchedNodes(child)
+
+
 class FolderTreeView(QTreeView):
 
     def __init__(self):
         super().__init__()
         self.setContextMenuPolicy(QtCoreQt.CustomContextMenu)
-        self.setModel(QStandardItemModel())
+        self.setModel(FolderTreeModel())
         self.setHeaderHidden(True)
         # self.setDragDropMode(self.InternalMove)
         # self.setDragEnabled(False)
@@ -241,15 +523,18 @@ class FolderTreeView(QTreeView):
             super().keyPressEvent(event)
 
     def addRootItem(self, item):
-        self.model().invisibleRootItem().appendRow(item)
+        self.model().appendNode(None, item)
 
     def getNodeByPos(self, pos: QPoint) -> TreeNode:
-        return self.model().itemFromIndex(self.indexAt(pos))
+        return self.model().nodeFromIndex(self.indexAt(pos))
 
 
 class FolderWidget(QWidget):
 
     clickNodeSingal = pyqtSignal(dict)
+    loadTestSignal = pyqtSignal(object)
+    runAllSignal = pyqtSignal(object)
+    compareSignal = pyqtSignal(object)
 
     def __init__(self):
         super().__init__()
@@ -257,12 +542,27 @@ class FolderWidget(QWidget):
         self.setMaximumSize(400, 2000)
         layout = QBoxLayout(QBoxLayout.TopToBottom)
         layout.setContentsMargins(0, 0, 0, 0)  # 取消组件间间隙
+        # 搜索框：空格分隔的每个词都要匹配method路径上的名字，输入时过滤树
+        self.searchEdit = QLineEdit()
+        self.searchEdit.setPlaceholderText("Search project, service, module, method")
+        self.searchEdit.setClearButtonEnabled(True)
+        self.paramsCheck = QCheckBox("params")
+        self.paramsCheck.setToolTip("Also match the keys of saved params")
+        self.searchBar = QBoxLayout(QBoxLayout.LeftToRight)
+        self.searchBar.addWidget(self.searchEdit)
+        self.searchBar.addWidget(self.paramsCheck)
+        layout.addLayout(self.searchBar)
         self.treeView = FolderTreeView()
         layout.addWidget(self.treeView)
+        # 开始搜索前展开的节点，取消搜索时恢复
+        self.expandedBeforeSearch = None
         self.loadFromFile()
         self.setLayout(layout)
+        self.searchEdit.textChanged.connect(self.onSearch)
+        self.paramsCheck.toggled.connect(self.onSearch)
         self.treeView.clicked.connect(self.onTreeNodeClicked)
         self.treeView.customContextMenuRequested.connect(self.showContextMenu)
+        QApplication.instance().aboutToQuit.connect(self.saveExpandedPaths)
 
         # 鼠标选中的item
         self.clickedItem = None
@@ -271,39 +571,93 @@ class FolderWidget(QWidget):
         """
         获取鼠标当前点击节点
         """
-        return self.treeView.model().itemFromIndex(self.treeView.currentIndex())
+        return self.treeView.model().nodeFromIndex(self.treeView.currentIndex())
 
     def loadFromFile(self):
         """
-        从文件读取数据，初始化文件夹树
-        """
-        data = storage.loadData()
-        if data:
-            for project, projectDict in data.items():
-                projectNode = self.newProjectNode(project)
-                for service, serviceDict in projectDict.items():
-                    serviceNode = self.newServiceNode(project, service)
-                    projectNode.appendRow(serviceNode)
-                    for module, moduleDict in serviceDict.items():
-                        moduleNode = self.newModuleNode(project, service, module)
-                        serviceNode.appendRow(moduleNode)
-                        for method, methodDict in moduleDict.items():
-                            methodNode = self.newMethodNode(project, service, module, method)
-                            moduleNode.appendRow(methodNode)
-                self.treeView.addRootItem(projectNode)
-            self.treeView.expandAll()
-
-        # if data:
-        #     for service, serviceDict in data.items():
-        #         serviceNode = self.newServiceNode(service)
-        #         for module, moduleDict in serviceDict.items():
-        #             moduleNode = self.newModuleNode(service, module)
-        #             serviceNode.appendRow(moduleNode)
-        #             for method, methodDict in moduleDict.items():
-        #                 methodNode = self.newMethodNode(service, module, method)
-        #                 moduleNode.appendRow(methodNode)
-        #         self.treeView.addRootItem(serviceNode)
-        #     self.treeView.expandAll()
+        从文件读取数据，初始化文件夹树，子节点在展开时才创建，恢复上次退出时展开的节点
+        """
+        storage.loadData()
+        model = self.treeView.model()
+        model.fetchMore(QModelIndex())
+        expanded = self.loadExpandedPaths()
+        if expanded is None:
+            # 第一次打开，只展开project
+            expanded = {node.getPath() for node in model.root.children}
+        self.restoreExpanded(QModelIndex(), expanded)
+
+    def loadExpandedPaths(self):
+        value = QSettings(const.SETTINGS_ORGANIZATION, const.SETTINGS_APPLICATION).value(const.SETTINGS_EXPANDED)
+        if value is None:
+            return None
+        try:
+            return {tuple(path) for path in json.loads(value)}
+        except Exception as e:
+            logging.exception(e)
+            return None
+
+    def getExpandedPaths(self):
+        model = self.treeView.model()
+        return {
+            node.getPath() for node in model.iterFetchedNodes()
+            if self.treeView.isExpanded(model.indexFromNode(node))
+        }
+
+    def saveExpandedPaths(self):
+        """
+        保存展开的节点，下次打开时恢复，搜索中保存搜索前展开的节点
+        """
+        expanded = self.expandedBeforeSearch if self.expandedBeforeSearch is not None else self.getExpandedPaths()
+        settings = QSettings(const.SETTINGS_ORGANIZATION, const.SETTINGS_APPLICATION)
+        settings.setValue(const.SETTINGS_EXPANDED, utils.objectToCompactJsonStr([list(path) for path in expanded]))
+
+    def onSearch(self):
+        """
+        按搜索框过滤树，展开匹配所在的节点；清空搜索框时恢复搜索前展开的节点
+        """
+        text = self.searchEdit.text().strip()
+        model = self.treeView.model()
+        if not text:
+            if model.search is None:
+                return
+            model.setSearch(None)
+            model.fetchMore(QModelIndex())
+            self.restoreExpanded(QModelIndex(), self.expandedBeforeSearch or set())
+            self.expandedBeforeSearch = None
+            return
+        if model.search is None:
+            self.expandedBeforeSearch = self.getExpandedPaths()
+        model.setSearch(storage.getSearchIndex().search(text, self.paramsCheck.isChecked()))
+        model.fetchMore(QModelIndex())
+        self.expandMatches()
+
+    def expandMatches(self):
+        """
+        按树的顺序展开下面还有匹配的节点，先把前面的匹配展开到method，
+        自己已经完全匹配的节点不展开，展开SEARCH_EXPAND_LIMIT个节点或者SEARCH_EXPAND_ROWS行后停止，剩下的由用户展开
+        """
+        model = self.treeView.model()
+        pending = list(reversed(model.root.children))
+        rows, expanded = len(pending), 0
+        while pending and rows < const.SEARCH_EXPAND_ROWS and expanded < const.SEARCH_EXPAND_LIMIT:
+            node = pending.pop()
+            if not node.searchRemaining:
+                continue
+            index = model.indexFromNode(node)
+            model.fetchMore(index)
+            self.treeView.expand(index)
+            rows += len(node.children)
+            expanded += 1
+            pending.extend(reversed(node.children))
+
+    def restoreExpanded(self, parentIndex: QModelIndex, expanded: set):
+        model = self.treeView.model()
+        for row in range(model.rowCount(parentIndex)):
+            index = model.index(row, 0, parentIndex)
+            if model.nodeFromIndex(index).getPath() in expanded:
+                model.fetchMore(index)
+                self.treeView.expand(index)
+                self.restoreExpanded(index, expanded)
 
     def showContextMenu(self, pos: QPoint):
         self.clickedItem = self.treeView.getNodeByPos(pos)
@@ -316,19 +670,29 @@ class FolderWidget(QWidget):
         elif self.clickedItem.getType() == const.NODE_PROJECT:
             action = menu.addAction("add service")
             action.triggered.connect(self.onAddService)
+            action = menu.addAction("run all")
+            action.triggered.connect(lambda: self.runAllSignal.emit(self.clickedItem))
             action = menu.addAction("rename")
             action.triggered.connect(self.onRename)
         elif self.clickedItem.getType() == const.NODE_SERVICE:
             action = menu.addAction("add module")
             action.triggered.connect(self.onAddModule)
+            action = menu.addAction("run all")
+            action.triggered.connect(lambda: self.runAllSignal.emit(self.clickedItem))
             action = menu.addAction("rename")
             action.triggered.connect(self.onRename)
         elif self.clickedItem.getType() == const.NODE_MODULE:
             action = menu.addAction("add method")
             action.triggered.connect(self.onAddMethod)
+            action = menu.addAction("run all")
+            action.triggered.connect(lambda: self.runAllSignal.emit(self.clickedItem))
             action = menu.addAction("rename")
             action.triggered.connect(self.onRename)
         else:
+            action = menu.addAction("load test")
+            action.triggered.connect(lambda: self.loadTestSignal.emit(self.clickedItem))
+            action = menu.addAction("compare brokers")
+            action.triggered.connect(lambda: self.compareSignal.emit(self.clickedItem))
             action = menu.addAction("rename")
             action.triggered.connect(self.onRename)
             action = menu.addAction("delete")
@@ -336,26 +700,22 @@ class FolderWidget(QWidget):
         menu.exec_(QCursor.pos())
 
     def newProjectNode(self, project) -> TreeNode:
-        node = TreeNode(project, nodeType=const.NODE_PROJECT, project=project, service=project, module=project, method=project)
-        return node
+        return newNode((project,))
 
     def newServiceNode(self, project, service) -> TreeNode:
-        node = TreeNode(service, nodeType=const.NODE_SERVICE, project=project, service=service, module=service, method=service)
-        return node
+        return newNode((project, service))
 
     def newModuleNode(self, project, service, module) -> TreeNode:
-        node = TreeNode(module, nodeType=const.NODE_MODULE, project=project, service=service, module=module, method=module)
-        return node
+        return newNode((project, service, module))
 
     def newMethodNode(self, project, service, module, method) -> TreeNode:
-        node = TreeNode(method, nodeType=const.NODE_METHOD, project=project, service=service, module=module, method=method)
-        return node
+        return newNode((project, service, module, method))
 
     def onTreeNodeClicked(self, modelIndex):
         """
         根据index找到鼠标点击的节点，发送节点数据到其他控件，用于显示
         """
-        node = self.treeView.model().itemFromIndex(modelIndex)
+        node = self.treeView.model().nodeFromIndex(modelIndex)
         self.clickNodeSingal.emit(node.getNodeInfo())
 
     def onAddProject(self):
@@ -382,7 +742,7 @@ class FolderWidget(QWidget):
                 alert("Input has one, please change one!")
                 return
             node = self.newServiceNode(project, name)
-            self.clickedItem.appendRow(node)
+            self.treeView.model().appendNode(self.clickedItem, node)
             logging.info(f"Add service {name} success")
 
     def onAddModule(self):
@@ -398,7 +758,7 @@ class FolderWidget(QWidget):
                 alert("Input has one, please change one!")
                 return
             node = self.newModuleNode(project, service, name)
-            self.clickedItem.appendRow(node)
+            self.treeView.model().appendNode(self.clickedItem, node)
             logging.info(f"Add module {name} success")
 
     def onAddMethod(self):
@@ -416,7 +776,7 @@ class FolderWidget(QWidget):
                 return
 
             node = self.newMethodNode(project, service, module, name)
-            self.clickedItem.appendRow(node)
+            self.treeView.model().appendNode(self.clickedItem, node)
             logging.info(f"Add method {name} success")
 
     def onRename(self):
@@ -430,6 +790,7 @@ class FolderWidget(QWidget):
             if not self.clickedItem.updateName(name):
                 alert("Input has one, please change one!")
                 return
+            self.treeView.model().nodeChanged(self.clickedItem)
             info = {
                 const.NODE_SERVICE: self.clickedItem.getServiceName(),
                 const.NODE_METHOD: name,
@@ -439,76 +800,39 @@ class FolderWidget(QWidget):
 
     def onDeleteMethod(self):
         node = self.getCurrentClickedNode()
-        parent = node.getParent()
-        self.treeView.model().removeRow(node.row(), parent.index())
-        storage.deleteMethod(node.getServiceName(), node.getModuleName(), node.getMethodName())
+        self.treeView.model().removeNode(node)
+        storage.deleteMethod(node.getProjectName(), node.getServiceName(), node.getModuleName(), node.getMethodName())
         logging.info(f"Delete method {node.getMethodName()} success")
 
 
-class NamekoManQsciScintilla(QsciScintilla):
-
-    def __init__(self):
-        super().__init__()
-
-    def keyPressEvent(self, event):
-        """
-        监听cmd + r 按键事件
-        """
-        if event.modifiers() == QtCoreQt.ControlModifier and event.key() == QtCoreQt.Key_R:
-            self.setText(utils.strToJsonStr(self.text()))
-        else:
-            super().keyPressEvent(event)
-
-
-class SendRpcThread(QThread):
+class DispatchBridge(QObject):
     """
-    发送rpc用线程处理，防止阻塞主线程
+    请求在Dispatcher的工作线程中完成，通过信号转到ui线程处理
     """
-    finishSignal = pyqtSignal(str)
-
-    def __init__(self, client: ClusterRpcClient, project: str, service: str, module: str, method: str, params: dict):
-        self.client = client
-        self.project, self.service, self.module, self.method, self.params = project, service, module, method, params
-        super().__init__()
-
-    def run(self):
-        start = time.time()
-        logging.info(
-            "Send rpc start, service: {}, method: {}, params: {}, waiting result......".format(
-                self.service, self.method, self.params
-            )
-        )
-        try:
-            result = getattr(getattr(self.client, self.service), self.method)(**self.params)
-        except Exception as e:
-            result = utils.errorToDict(repr(e))
-            logging.exception(e)
-
-        data = {
-            const.NODE_PROJECT: self.project,
-            const.NODE_SERVICE: self.service,
-            const.NODE_MODULE: self.module,
-            const.NODE_METHOD: self.method,
-            const.PARAMS: self.params,
-            const.RESULT: result,
-        }
-        end = time.time()
-        data = utils.objectToJsonStr(data)
-        logging.info(
-            "Send rpc end, calling time: {}, project: {}, service: {}, method: {}, params:{}, result: {}".format(
-                end-start, self.project, self.service, self.method, utils.objectToJsonStr(self.params), utils.objectToJsonStr(result)
-            )
-        )
+    finishSignal = pyqtSignal(object)
 
-        self.finishSignal.emit(data)
+    def watch(self, future):
+        future.add_done_callback(lambda f: f.cancelled() or self.finishSignal.emit(f.result()))
 
 
 class NamekoManWidget(QWidget):
-    RPC = "rpc"
+    connectSignal = pyqtSignal(object, object)
 
     def __init__(self):
         super().__init__()
-        self.broker = const.BROKER
+        # 命名的broker配置，保存在workspace旁边
+        self.profileStore = ProfileStore(getProfilesPath(storage.path)).load()
+        self.profileBox = QComboBox()
+        self.profileBox.addItems(self.profileStore.names())
+        self.profileBox.setCurrentText(self.profileStore.current)
+        self.profileBox.setToolTip("Broker profile, switching reuses the profile's connected clients")
+        self.saveProfileButton = QPushButton("Save")
+        self.saveProfileButton.setToolTip("Save the broker as a profile")
+        self.deleteProfileButton = QPushButton("Delete")
+        self.deleteProfileButton.setToolTip("Delete the selected profile")
+        self.envButton = QPushButton("Env")
+        self.envButton.setToolTip("Variables of the selected profile used by params templates, e.g. {{tenant_id}}")
+        self.broker = self.profileStore.getBroker(self.profileStore.current)
         self.brokerEdit = QLineEdit(self.broker)
         self.brokerEdit.setPlaceholderText("Input mq broker, for example: {}".format(const.BROKER))
         self.timeout = const.TIMEOUT
@@ -517,6 +841,10 @@ class NamekoManWidget(QWidget):
         self.timeoutEdit.setMaximumWidth(100)
         self.timeoutEdit.setValidator(QIntValidator(1, 1000))
         self.sendButton = QPushButton(const.SEND_BUTTON_SEND_TEXT)
+        self.cancelButton = QPushButton(const.CANCEL_BUTTON_TEXT)
+        self.cancelButton.setToolTip("Stop waiting for the running requests of the selected method")
+        self.cancelButton.setEnabled(False)
+        self.poolLabel = QLabel("")
         self.serviceEdit = QLineEdit()
         self.serviceEdit.setFocusPolicy(QtCoreQt.NoFocus)
         self.serviceEdit.setPlaceholderText("Input service name, for example: {}".format(const.SERVICE_INPUT))
@@ -524,12 +852,17 @@ class NamekoManWidget(QWidget):
         self.methodEdit.setFocusPolicy(QtCoreQt.NoFocus)
         self.methodEdit.setMinimumWidth(400)
         self.methodEdit.setPlaceholderText("Input method name, for example: {}".format(const.METHOD_INPUT))
+        # 选中method最近调用的延迟统计和趋势
+        self.historyLabel = QLabel("")
+        self.historyLabel.setTextInteractionFlags(QtCoreQt.TextSelectableByMouse)
 
         # 初始化输出日志组件
         self.logTextBox = QTextEditLogger(self)
         self.logTextBox.widget.setMinimumHeight(150)
         self.logTextBox.widget.setMaximumHeight(300)
-        self.logTextBox.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        self.logTextBox.setFormatter(logging.Formatter(const.LOG_FORMAT))
+        # 界面只显示INFO及以上，kombu等的DEBUG日志只写入文件
+        self.logTextBox.setLevel(logging.INFO)
         logging.getLogger().addHandler(self.logTextBox)
         logging.getLogger().setLevel(logging.DEBUG)
 
@@ -548,18 +881,11 @@ class NamekoManWidget(QWidget):
         self.paramsEdit.setBraceMatching(QsciScintilla.SloppyBraceMatch)
         self.paramsEdit.setIndentationGuides(QsciScintilla.SC_IV_LOOKBOTH)
 
-        # 初始化结果显示控件，支持滚动
-        self.scrollArea = QScrollArea()
-        self.scrollArea.setWidgetResizable(True)
-        self.resultLabel = QLabel("")
-        self.resultLabel.setAlignment(QtCoreQt.AlignCenter)
-        self.resultLabel.adjustSize()
-        self.resultLabel.setWordWrap(True)
-        self.resultLabel.setAlignment(QtCoreQt.AlignLeft)
-        self.resultLabel.setTextInteractionFlags(QtCoreQt.TextSelectableByMouse)
-        self.resultLabel.setText(const.README)
-        self.scrollArea.setWidget(self.resultLabel)
-        self.scrollArea.setMinimumSize(500, 600)
+        # 初始化结果显示控件，按需展开，支持查找
+        self.resultView = ResultViewer()
+        self.resultView.setResultLoader(lambda ref: storage.loadResult(ref))
+        self.resultView.showResult(const.README)
+        self.resultView.setMinimumSize(500, 600)
 
         # 初始化文件夹树
         self.folderBar = FolderWidget()
@@ -568,30 +894,111 @@ class NamekoManWidget(QWidget):
         self.layout = QGridLayout()
         self.layout.setContentsMargins(10, 0, 10, 0)
         self.layout.addWidget(self.folderBar, 0, 0, 25, 1)
-        self.layout.addWidget(self.brokerEdit, 0, 1, 1, 1)
-        self.layout.addWidget(self.timeoutEdit, 0, 2, 1, 1)
+        self.brokerBar = QBoxLayout(QBoxLayout.LeftToRight)
+        self.brokerBar.addWidget(self.profileBox)
+        self.brokerBar.addWidget(self.brokerEdit)
+        self.brokerBar.addWidget(self.saveProfileButton)
+        self.brokerBar.addWidget(self.deleteProfileButton)
+        self.brokerBar.addWidget(self.envButton)
+        self.brokerBar.addWidget(self.timeoutEdit)
+        self.brokerBar.addWidget(self.poolLabel)
+        self.layout.addLayout(self.brokerBar, 0, 1, 1, 2)
         self.layout.addWidget(self.serviceEdit, 1, 1, 1, 2)
         self.layout.addWidget(self.methodEdit, 2, 1, 1, 2)
-        self.layout.addWidget(self.paramsEdit, 3, 1, 22, 2)
-        self.layout.addWidget(self.sendButton, 0, 3, 1, 1)
-        self.layout.addWidget(self.scrollArea, 1, 3, 24, 1)
+        self.layout.addWidget(self.historyLabel, 3, 1, 1, 2)
+        self.layout.addWidget(self.paramsEdit, 4, 1, 21, 2)
+        self.sendBar = QBoxLayout(QBoxLayout.LeftToRight)
+        self.sendBar.addWidget(self.sendButton)
+        self.sendBar.addWidget(self.cancelButton)
+        self.layout.addLayout(self.sendBar, 0, 3, 1, 1)
+        self.layout.addWidget(self.resultView, 1, 3, 24, 1)
         self.layout.addWidget(self.logTextBox.widget, 25, 0, 1, 4)
         self.setLayout(self.layout)
 
         self.sendButton.clicked.connect(self.onSendRpc)
+        self.cancelButton.clicked.connect(self.onCancelRpc)
         self.folderBar.clickNodeSingal.connect(self.onClickedNode)
-
-        # 初始化nameko client
-        self.initNameko()
-
-        self.rpcThread = None
+        self.folderBar.loadTestSignal.connect(self.onLoadTest)
+        self.folderBar.runAllSignal.connect(self.onRunAll)
+        self.folderBar.compareSignal.connect(self.onCompare)
+
+        # 请求分发在第一次绘制之后才创建，在后台连接，不阻塞窗口显示。
+        # 可以同时执行多个请求，结果按路径回到发起请求的节点。
+        # 每个broker的请求分发连接后保留在池里，切换broker时直接使用，长时间不用时停止
+        self.dispatcherPool = DispatcherPool(
+            lambda broker: functools.partial(createRpcClient, broker, self.timeout)
+        )
+        self.dispatcher = None
+        self.connectionState = ""
+        self.connectSignal.connect(self.onConnected)
+        self.brokerEdit.editingFinished.connect(self.initNameko)
+        self.profileBox.activated[str].connect(self.onProfileChanged)
+        self.saveProfileButton.clicked.connect(self.onSaveProfile)
+        self.deleteProfileButton.clicked.connect(self.onDeleteProfile)
+        self.envButton.clicked.connect(self.onEditEnv)
+        self.timeoutEdit.editingFinished.connect(self.initNameko)
+        self.dispatchBridge = DispatchBridge()
+        self.dispatchBridge.finishSignal.connect(self.onSendRpcFinished)
+        # 每个method最后保存的结果的提交时间
+        self.resultSubmitTimes = dict()
+        # 每个method编译好的params模板，模板和环境变量不变时继续使用，序列接着上次
+        self.templates = dict()
+        # 每个method正在执行的请求，用于取消
+        self.runningTasks = collections.defaultdict(list)
+        # 启动耗时：从启动到第一次绘制，到客户端连接成功
+        self.startupTimings = collections.OrderedDict()
+        self.poolTimer = QTimer(self)
+        self.poolTimer.timeout.connect(self.updatePoolStatus)
+        self.poolTimer.start(const.POOL_STATUS_INTERVAL)
+        self.healthTimer = QTimer(self)
+        self.healthTimer.timeout.connect(self.checkProfiles)
+        self.healthTimer.start(const.PROFILE_HEALTH_INTERVAL)
 
         self.nodeInfo = None
-
-    def showResult(self, result: str):
-        # 为了显示居中，用2个空格替换1个空格
-        self.resultLabel.setText(result.replace(" ", "  "))
-        self.resultLabel.repaint()
+        # 正在后台读取的结果的缓存key，显示其它结果后清空，读取完成时不再显示
+        self.loadingResultKey = None
+        self.loadThreads = set()
+        # 打开的压测和批量执行窗口
+        self.dialogs = set()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if "first_paint" not in self.startupTimings:
+            self.startupTimings["first_paint"] = time.time() - START_TIME
+            QTimer.singleShot(0, self.initNameko)
+
+    def reportStartupTimings(self):
+        text = ", ".join("{}: {:.3f}s".format(stage, cost) for stage, cost in self.startupTimings.items())
+        logging.info("Startup timings, {}".format(text))
+        if const.STARTUP_TIMING_FLAG in sys.argv:
+            print("Startup timings, {}".format(text))
+
+    def showResult(self, result, differences=None, baselines=()):
+        self.loadingResultKey = None
+        self.resultView.showResult(result, differences, baselines)
+
+    def loadResult(self, path):
+        """
+        在工作线程中读取并解析保存的结果，完成前显示占位文本
+        """
+        key = getResultCacheKey(path, storage.getResultRef(*path))
+        self.showResult(const.RESULT_LOADING)
+        self.loadingResultKey = key
+        thread = LoadThread(functools.partial(loadResultEntry, path), key)
+        thread.finishSignal.connect(self.onResultLoaded)
+        thread.finished.connect(lambda: self.loadThreads.discard(thread))
+        self.loadThreads.add(thread)
+        thread.start()
+
+    def onResultLoaded(self, key, entry):
+        if entry is not None:
+            resultCache.put(key, entry)
+        # 读取期间选中了其它节点或者显示了新的结果，丢弃
+        if key != self.loadingResultKey:
+            return
+        path = key[:len(NODE_COLUMNS)]
+        result = entry[0] if entry is not None else utils.errorToDict("Failed to load the stored result")
+        self.showResult(result, baselines=storage.getResultHistory(*path))
 
     def getBrokerInput(self):
         return self.brokerEdit.text()
@@ -604,49 +1011,167 @@ class NamekoManWidget(QWidget):
             logging.exception(e)
             return const.TIMEOUT
 
-    def hasNamekoClient(self):
-        return hasattr(self, self.RPC)
+    def getClientFactory(self):
+        """
+        按当前broker和timeout创建rpc客户端，每次调用返回一个新的未启动的客户端
+        """
+        return functools.partial(createRpcClient, self.broker, self.timeout)
 
-    def setNamekoClient(self):
+    def setDispatcher(self):
         """
-        更新配置，再设置一个新的rpc客户端
+        从池里取当前broker的请求分发，其它broker的请求分发保持连接，
+        第一次使用的broker新建请求分发并在后台连接
         """
-        setup_config(None, define=getAMQPConfig(self.broker))
-        client = ClusterRpcClient(timeout=self.getTimeoutInput())
-        setattr(self, self.RPC, client.start())
-        logging.info(
-            "Set new nameko, broker:{}, timeout:{}".format(self.getBrokerInput(), self.getTimeoutInput())
-        )
+        dispatcher, created = self.dispatcherPool.get(self.broker)
+        self.dispatcher = dispatcher
+        entry = self.dispatcherPool.getEntry(self.broker)
+        self.connectionState = entry.state
+        self.poolLabel.setToolTip(entry.error or "")
+        self.updatePoolStatus()
+        if created:
+            dispatcher.connect().add_done_callback(lambda f: self.connectSignal.emit(dispatcher, f.result()))
+            logging.info(
+                "Set new nameko, broker:{}, timeout:{}, pool size:{}".format(self.broker, self.timeout, dispatcher.size)
+            )
+        else:
+            logging.info("Switch to broker: {}, {}".format(self.broker, self.connectionState))
+
+    def onConnected(self, dispatcher, error):
+        """
+        连接或者定期检查的结果，记录到对应的broker，只显示当前broker的状态
+        """
+        broker = self.dispatcherPool.setState(dispatcher, error)
+        if dispatcher is not self.dispatcher:
+            if broker is not None and error is not None:
+                logging.warning("Broker is unavailable: {}, error: {}".format(broker, error))
+            return
+        state = "connected" if error is None else "disconnected"
+        if error is None and state != self.connectionState:
+            logging.info("Connected to broker: {}".format(self.broker))
+        elif error is not None:
+            logging.error("Can't connect to broker: {}, error: {}".format(self.broker, error))
+        self.connectionState = state
+        self.poolLabel.setToolTip(error or "")
+        self.updatePoolStatus()
+        if "client_ready" not in self.startupTimings and "client_failed" not in self.startupTimings:
+            self.startupTimings["client_ready" if error is None else "client_failed"] = time.time() - START_TIME
+            self.reportStartupTimings()
 
     def initNameko(self):
         """
-        如果没有构建好rpc客户端，新建一个，如果已经构建好删除再使用新的配置新建
+        如果没有请求分发，新建一个，broker变了使用新的配置新建。
+        超时是每个请求自己的，修改超时不需要重新连接
         """
         broker = self.getBrokerInput()
-        timeout = self.getTimeoutInput()
+        self.timeout = self.getTimeoutInput()
         try:
-            if not self.hasNamekoClient():
+            if self.dispatcher is None or broker != self.broker:
                 self.broker = broker
-                self.setNamekoClient()
+                self.setDispatcher()
             else:
-                if broker != self.broker or timeout != self.timeout:
-                    self.broker = broker
-                    self.timeout = timeout
-                    delattr(self, self.RPC)
-                    self.setNamekoClient()
+                # 记录使用时间，正在使用的broker不会被停止
+                self.dispatcherPool.get(broker)
         except Exception as e:
-            self.showResult(utils.errorToJsonStr(repr(e)))
+            self.showResult(utils.errorToDict(repr(e)))
             logging.exception(e)
 
-    def lockSendButton(self):
-        self.sendButton.setDisabled(True)
-        self.sendButton.setText(const.SEND_BUTTON_WAIT_TEXT)
-        self.sendButton.repaint()
+    def updatePoolStatus(self):
+        if self.dispatcher is None:
+            self.poolLabel.setText("")
+            return
+        stats = self.dispatcher.getStats()
+        self.poolLabel.setText("{}, busy: {}/{}, queued: {}".format(
+            self.connectionState, stats["busy"], stats["size"], stats["queued"]
+        ))
 
-    def unlockSendButton(self):
-        self.sendButton.setDisabled(False)
-        self.sendButton.setText(const.SEND_BUTTON_SEND_TEXT)
-        self.sendButton.repaint()
+    def checkProfiles(self):
+        """
+        定期检查池里每个broker的连接，停止长时间没有使用的broker的请求分发
+        """
+        for broker in self.dispatcherPool.evictIdle(keep=self.broker):
+            logging.info("Release idle broker connections: {}".format(broker))
+        self.dispatcherPool.ping(self.connectSignal.emit)
+
+    def onProfileChanged(self, name):
+        broker = self.profileStore.getBroker(name)
+        if broker is None:
+            return
+        self.profileStore.setCurrent(name)
+        self.brokerEdit.setText(broker)
+        self.initNameko()
+
+    def onSaveProfile(self):
+        name, ok = QInputDialog.getText(
+            self, "⌨️", "Please enter profile name for {}".format(self.getBrokerInput()),
+            text=self.profileBox.currentText()
+        )
+        name = name.strip()
+        if not ok or not name:
+            return
+        self.profileStore.setProfile(name, self.getBrokerInput())
+        self.profileStore.setCurrent(name)
+        self.resetProfileBox()
+        self.initNameko()
+
+    def onDeleteProfile(self):
+        name = self.profileBox.currentText()
+        if not self.profileStore.deleteProfile(name):
+            alert("Can't delete the last profile!")
+            return
+        self.resetProfileBox()
+        self.onProfileChanged(self.profileStore.current)
+
+    def onEditEnv(self):
+        """
+        编辑选中配置的模板变量，json对象
+        """
+        name = self.profileBox.currentText()
+        if name not in self.profileStore.profiles:
+            alert("Please save the profile first!")
+            return
+        text, ok = QInputDialog.getMultiLineText(
+            self, "Env", "Params template variables of {} (JSON object):".format(name),
+            utils.objectToJsonStr(self.profileStore.getEnv(name))
+        )
+        if not ok:
+            return
+        try:
+            env = json.loads(text or "{}")
+        except Exception as e:
+            alert("Invalid JSON: {!r}".format(e))
+            return
+        if not isinstance(env, dict):
+            alert("Env must be a JSON object!")
+            return
+        self.profileStore.setEnv(name, env)
+        logging.info("Save env of profile {}: {} variables".format(name, len(env)))
+
+    def getEnv(self):
+        return self.profileStore.getEnv(self.profileStore.current)
+
+    def renderParams(self, path, params):
+        """
+        params是模板时渲染后发送。同一个method的模板和环境变量不变时继续使用编译好的模板，序列接着上次
+        """
+        if not isTemplate(params):
+            self.templates.pop(path, None)
+            return params
+        env = self.getEnv()
+        template = self.templates.get(path)
+        if template is None or template.params != params or template.env != env:
+            template = self.templates[path] = compileTemplate(params, env, getBaseDir(storage.path))
+        return template.render()
+
+    def resetProfileBox(self):
+        self.profileBox.clear()
+        self.profileBox.addItems(self.profileStore.names())
+        self.profileBox.setCurrentText(self.profileStore.current)
+
+    def shutdown(self):
+        self.healthTimer.stop()
+        self.dispatcherPool.stopAll()
+        for dialog in list(self.dialogs):
+            dialog.close()
 
     def onClickedNode(self, info):
         """
@@ -657,58 +1182,186 @@ class NamekoManWidget(QWidget):
         params = info.get(const.PARAMS, {})
         result = info.get(const.RESULT, {})
         if params is not None:
-            self.paramsEdit.setText(utils.objectToJsonStr(params))
+            self.paramsEdit.setParams(params)
+        isMethod = info.get(const.NODE_TYPE) == const.NODE_METHOD
+        if isMethod:
+            path = (info[const.NODE_PROJECT], info[const.NODE_SERVICE], info[const.NODE_MODULE], info[const.NODE_METHOD])
         if result is not None:
-            self.showResult(utils.objectToJsonStr(result))
+            self.showResult(result, baselines=storage.getResultHistory(*path) if isMethod else ())
+        elif isMethod:
+            self.loadResult(path)
+        self.updateCancelButton()
+        if isMethod:
+            self.showLatencyHistory(path)
+        else:
+            self.historyLabel.setText("")
 
         self.nodeInfo = info
 
+    def showLatencyHistory(self, path):
+        """
+        显示method最近调用的p50，p95和延迟趋势，最近几次明显变慢时在树上标记
+        """
+        history = storage.getLatencyHistory(*path)
+        stats = history.stats()
+        self.folderBar.treeView.model().setSlower(path, stats["slower"])
+        self.historyLabel.setText("{}  {}".format(formatStats(stats), sparkline(history.okLatencies())))
+        self.historyLabel.setStyleSheet("color: red" if stats["slower"] else "")
+
+    def recordLatency(self, path, data: dict):
+        """
+        保存一次调用的时间，延迟，结果大小和是否成功，更新变慢标记
+        """
+        storage.addLatencySample(*path, toSample(data))
+        node = self.folderBar.getCurrentClickedNode()
+        if node is not None and node.getPath() == path:
+            self.showLatencyHistory(path)
+        else:
+            self.folderBar.treeView.model().setSlower(path, storage.getLatencyHistory(*path).stats()["slower"])
+
     def onSendRpc(self):
         self.initNameko()
 
-        if not self.hasNamekoClient():
-            self.showResult(utils.errorToJsonStr("Can't connect to mq, please check mq or broker!"))
+        if self.dispatcher is None:
+            self.showResult(utils.errorToDict("Can't connect to mq, please check mq or broker!"))
             return
         node = self.folderBar.getCurrentClickedNode()
         if not node or node.getType() != const.NODE_METHOD:
             alert("Please choose one method!")
             return
-        service, method, params = self.serviceEdit.text(), self.methodEdit.text(), self.paramsEdit.text()
 
+        # 编辑时已经在后台解析过，直接使用缓存的结果
+        parsed = self.paramsEdit.getParams()
+        if not parsed.isOk():
+            self.showResult(utils.errorToDict(parsed.error))
+            return
+        params = parsed.value
+        node.updateParams(params)
+
+        path = node.getPath()
         try:
-            params = json.loads(params)
-            self.lockSendButton()
-            self.rpcThread = SendRpcThread(
-                getattr(self, self.RPC),
-                self.nodeInfo.get(const.NODE_PROJECT, ""),
-                service,
-                self.nodeInfo.get(const.NODE_MODULE, ""),
-                method,
-                params
-            )
-            self.rpcThread.finishSignal.connect(self.onSendRpcFinished)
-            self.rpcThread.start()
-        except Exception as e:
-            self.showResult(utils.errorToJsonStr(repr(e)))
+            params = self.renderParams(path, params)
+        except TemplateError as e:
+            self.showResult(utils.errorToDict("Invalid params template: {}".format(e)))
+            return
+        task = RpcTask(
+            *path, params, store=storage.storeResultText, timeout=self.timeout, compare=self.getBaseline(path)
+        )
+        self.dispatchBridge.watch(self.dispatcher.submit(task))
+        self.runningTasks[path].append(task)
+        self.folderBar.treeView.model().setRunning(path, 1)
+        self.updatePoolStatus()
+        self.updateCancelButton()
 
-        node.updateParams(params)
+    def getBaseline(self, path):
+        """
+        和发送前保存的结果比较，在工作线程中调用；保存的结果已经显示过时直接使用解析好的对象
+        """
+        ref = storage.getResultRef(*path)
+        entry = resultCache.get(getResultCacheKey(path, ref)) if ref else None
+        if entry is not None:
+            return functools.partial(diffResult, ref, lambda _: entry[0])
+        return functools.partial(diffResult, ref, storage.loadResult)
 
-    def onSendRpcFinished(self, data: str):
-        data = json.loads(data)
-        result = utils.objectToJsonStr(data["result"])
-        if len(result) > const.MAX_LENGTH:
-            result = result[:const.MAX_LENGTH]
-            result += "...... Sorry, the result is too long. Please check the log for whole result."
-        self.showResult(result)
-        self.unlockSendButton()
-        if "error" not in result.lower() and len(result) < const.MAX_LENGTH:
-            storage.updateResut(
-                data[const.NODE_PROJECT],
-                data[const.NODE_SERVICE],
-                data[const.NODE_MODULE],
-                data[const.NODE_METHOD],
-                data["result"]
-            )
+    def onCancelRpc(self):
+        """
+        取消选中method正在执行的请求，工作线程立即放弃等待，迟到的回复直接丢弃
+        """
+        node = self.folderBar.getCurrentClickedNode()
+        if node is None:
+            return
+        tasks = self.runningTasks.get(node.getPath(), [])
+        for task in tasks:
+            task.cancel()
+        logging.info("Cancel {} running requests, method: {}".format(len(tasks), "/".join(node.getPath())))
+        self.cancelButton.setEnabled(False)
+
+    def updateCancelButton(self):
+        node = self.folderBar.getCurrentClickedNode()
+        tasks = self.runningTasks.get(node.getPath(), []) if node is not None else []
+        self.cancelButton.setEnabled(any(not task.isCancelled() for task in tasks))
+
+    def onLoadTest(self, node: TreeNode):
+        """
+        用method保存的params压测，每个窗口使用自己的rpc客户端，不占用发送请求的客户端
+        """
+        self.initNameko()
+        self.showDialog(LoadTestDialog(
+            self, storage, self.getClientFactory(), node.getPath(), node.getParams(), self.getEnv(),
+            getBaseDir(storage.path)
+        ))
+
+    def onRunAll(self, node: TreeNode):
+        """
+        执行节点下所有method，使用自己的rpc客户端，结果和单独发送一样保存到对应的method
+        """
+        self.initNameko()
+        self.showDialog(BatchRunDialog(
+            self, storage, self.getClientFactory(), node.getPath(), self.applyResult, self.getEnv(),
+            getBaseDir(storage.path)
+        ))
+
+    def onCompare(self, node: TreeNode):
+        """
+        用method保存的params同时请求多个broker配置，对比延迟和结果，使用各个配置在池里的请求分发
+        """
+        self.initNameko()
+        path = node.getPath()
+        self.showDialog(CompareDialog(
+            self, self.dispatcherPool, self.profileStore, path, storage.getParam(*path), self.timeout,
+            getBaseDir(storage.path)
+        ))
+
+    def showDialog(self, dialog):
+        dialog.finished.connect(lambda: self.dialogs.discard(dialog))
+        self.dialogs.add(dialog)
+        dialog.show()
+
+    def applyResult(self, data: dict) -> bool:
+        """
+        记录这次调用的延迟，更新method的结果引用，结果已经在工作线程中保存。
+        同一个method的多个请求完成顺序不确定，只保留最后提交的结果，过期的结果返回False
+        """
+        path = (data[const.NODE_PROJECT], data[const.NODE_SERVICE], data[const.NODE_MODULE], data[const.NODE_METHOD])
+        self.recordLatency(path, data)
+        submitTime = data[const.RESULT_SUBMIT_TIME]
+        if submitTime < self.resultSubmitTimes.get(path, 0):
+            logging.info("Discard outdated result, method: {}".format("/".join(path)))
+            return False
+        self.resultSubmitTimes[path] = submitTime
+
+        ref = data[const.RESULT_REF]
+        if ref:
+            storage.updateResultRef(*path, ref)
+            resultCache.put(getResultCacheKey(path, ref), (data[const.RESULT], data[const.RESULT_TEXT]))
+        return True
+
+    def onSendRpcFinished(self, data: dict):
+        path = (data[const.NODE_PROJECT], data[const.NODE_SERVICE], data[const.NODE_MODULE], data[const.NODE_METHOD])
+        self.folderBar.treeView.model().setRunning(path, -1)
+        tasks = [task for task in self.runningTasks.pop(path, []) if not task.future.done()]
+        if tasks:
+            self.runningTasks[path] = tasks
+        if data[const.RESULT_OK]:
+            self.connectionState = "connected"
+        self.updatePoolStatus()
+        self.updateCancelButton()
+        if not self.applyResult(data):
+            return
+
+        # 只有当前选中的还是发起请求的method时才显示结果，否则结果留在对应节点上，点击时显示
+        node = self.folderBar.getCurrentClickedNode()
+        if node is None or node.getPath() != path:
+            logging.info("Send rpc finished in background, method: {}".format("/".join(path)))
+            return
+
+        start = time.time()
+        self.showResult(data[const.RESULT], data[const.RESULT_DIFF], storage.getResultHistory(*path))
+        timings = data[const.RESULT_TIMINGS]
+        timings[const.TIMING_RENDER] = time.time() - start
+        timingsText = ", ".join("{}: {:.3f}s".format(stage, cost) for stage, cost in timings.items())
+        self.resultView.setStatus(timingsText)
+        logging.info("Send rpc timings, {}".format(timingsText))
 
 
 def error_handler(etype, value, tb):
@@ -718,10 +1371,14 @@ def error_handler(etype, value, tb):
 
 if __name__ == "__main__":
     sys.excepthook = error_handler
+    logListener = setupFileLogging(LOG_FILE_PATH)
 
     app = QApplication([])
     widget = NamekoManWidget()
     widget.resize(1200, 800)
     widget.setMaximumSize(5000, 2500)
     widget.show()
+    app.aboutToQuit.connect(widget.shutdown)
+    app.aboutToQuit.connect(storage.close)
+    app.aboutToQuit.connect(logListener.stop)
     sys.exit(app.exec_())
@@ -22,6 +22,7 @@ a = Analysis(['namekoman.py'],
                 'dns.zone',
                 'kombu',
                 'kombu.transport.pyamqp',
+                'loadworker',
              ],
              hookspath=[],
              runtime_hooks=[],
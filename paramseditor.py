@@ -0,0 +1,193 @@
+# -*- coding:utf-8 -*-
+
+import json
+import logging
+
+from PyQt5.QtCore import Qt as QtCoreQt, pyqtSignal, QThread, QTimer
+from PyQt5.QtGui import QColor
+from PyQt5.Qsci import QsciScintilla, QsciStyle
+
+import utils
+import constants as const
+
+
+class ParseResult(object):
+    """
+    params编辑器某个版本的解析结果。
+    出错时error是错误信息，line是出错的行，position是出错位置在utf-8文本中的字节偏移（Scintilla的位置）；
+    格式化后文本有变化时text是格式化后的文本
+    """
+    def __init__(self, revision, value=None, error=None, line=0, position=0, text=None):
+        self.revision = revision
+        self.value = value
+        self.error = error
+        self.line = line
+        self.position = position
+        self.text = text
+
+    def isOk(self):
+        return self.error is None
+
+
+def parseParams(revision, text, reformat=False) -> ParseResult:
+    """
+    解析params文本（str或者utf-8的bytes），reformat为True时同时格式化，解析失败时替换中文标点后再试一次
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    try:
+        value = json.loads(text)
+    except ValueError as e:
+        if not reformat:
+            return errorResult(revision, text, e)
+        text = utils.fixJsonPunctuation(text)
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            # 和原来一样，格式化失败时也保留替换后的文本
+            return errorResult(revision, text, e, text)
+    if not reformat:
+        return ParseResult(revision, value)
+    formatted = utils.objectToJsonStr(value)
+    # 已经是格式化好的文本时不需要替换
+    return ParseResult(revision, value, text=formatted if formatted != text else None)
+
+
+def errorResult(revision, text, error, newText=None) -> ParseResult:
+    pos = getattr(error, "pos", 0)
+    line = getattr(error, "lineno", 1) - 1
+    return ParseResult(
+        revision, error=str(error), line=line, position=len(text[:pos].encode("utf-8")), text=newText
+    )
+
+
+class ParseThread(QThread):
+    """
+    在后台解析或者格式化params，大文本不阻塞编辑
+    """
+    finishSignal = pyqtSignal(object)
+
+    def __init__(self, revision, data, reformat):
+        super().__init__()
+        self.revision, self.data, self.reformat = revision, data, reformat
+
+    def run(self):
+        try:
+            result = parseParams(self.revision, self.data, self.reformat)
+        except Exception as e:
+            logging.exception(e)
+            result = ParseResult(self.revision, error=repr(e))
+        self.finishSignal.emit(result)
+
+
+class NamekoManQsciScintilla(QsciScintilla):
+    """
+    params编辑器：停止输入PARAMS_PARSE_DELAY毫秒后在后台线程解析，出错位置标上波浪线，错误信息显示在出错行下面；
+    cmd + r也在后台格式化。每次修改版本号加一，最新版本的解析结果缓存在parsed中，发送时直接使用，不再重新解析
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.revision = 0
+        self.parsed = None
+        # 同时只有一个解析线程，解析期间的修改等它结束后再解析最新版本
+        self.parseThread = None
+        self.pendingParse = False
+        self.pendingReformat = False
+        # 显示错误信息的行，没有错误时为None
+        self.errorLine = None
+        self.parseTimer = QTimer(self)
+        self.parseTimer.setSingleShot(True)
+        self.parseTimer.setInterval(const.PARAMS_PARSE_DELAY)
+        self.parseTimer.timeout.connect(self.startParse)
+        self.textChanged.connect(self.onTextChanged)
+
+        self.indicatorDefine(QsciScintilla.SquiggleIndicator, const.PARAMS_ERROR_INDICATOR)
+        self.setIndicatorForegroundColor(QColor(QtCoreQt.red), const.PARAMS_ERROR_INDICATOR)
+        self.setAnnotationDisplay(QsciScintilla.AnnotationBoxed)
+        self.errorStyle = QsciStyle(-1, "params error", QColor(QtCoreQt.red), QColor("#fff0f0"), self.font())
+
+    def keyPressEvent(self, event):
+        """
+        监听cmd + r 按键事件
+        """
+        if event.modifiers() == QtCoreQt.ControlModifier and event.key() == QtCoreQt.Key_R:
+            self.parseTimer.stop()
+            self.startParse(reformat=True)
+        else:
+            super().keyPressEvent(event)
+
+    def onTextChanged(self):
+        self.revision += 1
+        self.parseTimer.start()
+
+    def setParams(self, params):
+        """
+        显示method保存的params，已经是解析好的对象，直接作为这个版本的解析结果
+        """
+        self.setText(utils.objectToJsonStr(params))
+        self.parseTimer.stop()
+        self.showParsed(ParseResult(self.revision, params))
+
+    def getParams(self) -> ParseResult:
+        """
+        发送时使用的解析结果，当前版本还没有解析（刚修改完还在延迟中）时立即解析
+        """
+        if self.parsed is None or self.parsed.revision != self.revision:
+            self.parseTimer.stop()
+            self.showParsed(parseParams(self.revision, self.text()))
+        return self.parsed
+
+    def startParse(self, reformat=False):
+        if self.parseThread is not None:
+            self.pendingParse = True
+            self.pendingReformat = self.pendingReformat or reformat
+            return
+        self.parseThread = ParseThread(self.revision, self.getBytes(), reformat)
+        self.parseThread.finishSignal.connect(self.onParsed)
+        self.parseThread.start()
+
+    def getBytes(self) -> bytes:
+        """
+        文档的utf-8内容，比text()快很多，解码放到后台线程
+        """
+        # 末尾有一个\0
+        return bytes(self.bytes(0, self.length()))[:-1]
+
+    def onParsed(self, result: ParseResult):
+        self.parseThread.wait()
+        self.parseThread = None
+        if self.pendingParse:
+            reformat, self.pendingParse, self.pendingReformat = self.pendingReformat, False, False
+            self.startParse(reformat)
+            return
+        # 解析期间又修改了，丢弃，等停止输入后再解析
+        if result.revision != self.revision:
+            return
+        if result.text is not None:
+            line, _ = self.getCursorPosition()
+            self.setText(result.text)
+            self.setCursorPosition(min(line, self.lines() - 1), 0)
+            self.parseTimer.stop()
+            result.revision = self.revision
+        self.showParsed(result)
+
+    def showParsed(self, result: ParseResult):
+        """
+        缓存解析结果，更新错误标记
+        """
+        self.parsed = result
+        self.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, const.PARAMS_ERROR_INDICATOR)
+        self.SendScintilla(QsciScintilla.SCI_INDICATORCLEARRANGE, 0, self.length())
+        # clearAnnotations()要遍历所有行，只清除显示错误的行
+        if self.errorLine is not None:
+            self.clearAnnotations(self.errorLine)
+            self.errorLine = None
+        if result.isOk():
+            return
+        # 从出错位置标到行尾，在文本末尾出错时标最后一个字符
+        end = self.SendScintilla(QsciScintilla.SCI_GETLINEENDPOSITION, result.line)
+        start = min(result.position, max(end - 1, 0))
+        self.SendScintilla(QsciScintilla.SCI_INDICATORFILLRANGE, start, max(end - start, 1))
+        self.annotate(result.line, result.error, self.errorStyle)
+        self.errorLine = result.line
@@ -0,0 +1,286 @@
+# -*- coding:utf-8 -*-
+"""
+params模板：params里的字符串可以包含{{表达式}}，发送前渲染成实际的params。
+表达式是变量名，或者生成器调用，参数是json字面量：
+    {{user_id}} {{user.id}}         当前broker配置的环境变量，可以用.取嵌套的key
+    {{seq()}} {{seq(1000, 2)}}      递增序列，默认从1开始
+    {{uuid()}}                      随机uuid
+    {{randint(1, 100)}}             闭区间内的随机整数
+    {{csv("users.csv", "id")}}      csv文件（第一行是列名）的一列，每个请求取下一行，取完后从头开始
+    {{jsonl("users.jsonl", "id")}}  jsonl文件每行一个对象，取一个key，不写key时取整个对象
+整个字符串只有一个表达式时保留值的类型，否则转成字符串拼接。
+同一个表达式在一次渲染中只求值一次，同一个文件的多个列取同一行。
+模板只编译一次：变量在编译时替换成常量，不含表达式的部分渲染时直接复用，不会复制，渲染结果不要修改
+"""
+
+import os
+import csv
+import json
+import uuid
+import random
+import itertools
+
+import utils
+
+MARK = "{{"
+
+
+class TemplateError(Exception):
+    pass
+
+
+def isTemplate(params):
+    """
+    params里有没有包含表达式的字符串
+    """
+    if isinstance(params, str):
+        return MARK in params
+    if isinstance(params, dict):
+        return any(isTemplate(value) for value in params.values())
+    if isinstance(params, list):
+        return any(isTemplate(value) for value in params)
+    return False
+
+
+def toText(value):
+    if isinstance(value, str):
+        return value
+    return utils.objectToCompactJsonStr(value)
+
+
+def splitTemplate(text):
+    """
+    把字符串分成[(是否表达式, 内容)]
+    """
+    parts = []
+    pos = 0
+    while True:
+        start = text.find(MARK, pos)
+        if start < 0:
+            break
+        end = text.find("}}", start + len(MARK))
+        if end < 0:
+            raise TemplateError("Missing }}}} in {!r}".format(text))
+        if start > pos:
+            parts.append((False, text[pos:start]))
+        expr = text[start + len(MARK):end].strip()
+        if not expr:
+            raise TemplateError("Empty expression in {!r}".format(text))
+        parts.append((True, expr))
+        pos = end + 2
+    if pos < len(text):
+        parts.append((False, text[pos:]))
+    return parts
+
+
+def parseExpression(expr):
+    """
+    返回(名字, 参数)，变量的参数是None
+    """
+    if not expr.endswith(")"):
+        if not expr.replace("_", "a").replace(".", "a").isalnum():
+            raise TemplateError("Invalid expression: {}".format(expr))
+        return expr, None
+    name, _, args = expr[:-1].partition("(")
+    name = name.strip()
+    try:
+        args = json.loads("[{}]".format(args))
+    except ValueError:
+        raise TemplateError("Invalid arguments: {}".format(expr))
+    return name, args
+
+
+class RowSource(object):
+    """
+    csv或者jsonl文件的行，每次渲染前advance一次，取完后从头开始
+    """
+    def __init__(self, rows, shard):
+        if not rows:
+            raise TemplateError("Empty file")
+        index, count = shard
+        # 多进程压测时第index个进程取第index，index+count，...行，和其它进程错开
+        self.first = rows[0]
+        offset = index % len(rows)
+        self.rows = itertools.cycle(rows[offset:] + rows[:offset])
+        self.skip = count - 1
+        self.current = None
+
+    def advance(self):
+        self.current = next(self.rows)
+        for _ in range(self.skip):
+            next(self.rows)
+
+
+def readCsv(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def readJsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Template(object):
+    """
+    编译好的params模板，render()返回一个请求的params。
+    shard=(index, count)：多进程时第index个进程的序列和文件的行错开，不会和其它进程重复。
+    生成器有状态，只在一个线程中渲染
+    """
+    def __init__(self, params, env=None, baseDir="", shard=(0, 1)):
+        self.params = params
+        self.env = env or {}
+        self.baseDir = baseDir
+        self.shard = shard
+        self.random = random.Random()
+        # 表达式 -> 在每次渲染的值列表中的下标
+        self.exprs = {}
+        self.funcs = []
+        self.sources = {}
+        self.consts = []
+        source = self._emit(params)
+        if not self.funcs:
+            # 没有生成器时渲染结果不变
+            value = params if source is None else eval("lambda c, s: " + source)(self.consts, toText)
+            self.render = lambda: value
+            return
+        build = eval("lambda c, s: lambda v: " + source)(self.consts, toText)
+        funcs = self.funcs
+        advances = [rows.advance for rows in self.sources.values()]
+
+        def render():
+            for advance in advances:
+                advance()
+            return build([func() for func in funcs])
+        self.render = render
+
+    def _const(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def _emit(self, value):
+        """
+        生成渲染value的python表达式，value里没有模板时返回None，直接使用原来的对象
+        """
+        if isinstance(value, str):
+            if MARK not in value:
+                return None
+            parts = splitTemplate(value)
+            items = [self._expr(content) if isExpr else "c[{}]".format(self._const(content))
+                     for isExpr, content in parts]
+            if len(parts) == 1 and parts[0][0]:
+                return items[0]
+            return "''.join(({},))".format(", ".join(
+                item if not isExpr else "s({})".format(item) for (isExpr, _), item in zip(parts, items)
+            ))
+        if isinstance(value, dict):
+            items = [(key, self._emit(child)) for key, child in value.items()]
+            if all(source is None for _, source in items):
+                return None
+            return "{{{}}}".format(", ".join(
+                "c[{}]: {}".format(self._const(key), source or "c[{}]".format(self._const(value[key])))
+                for key, source in items
+            ))
+        if isinstance(value, list):
+            items = [self._emit(child) for child in value]
+            if all(source is None for source in items):
+                return None
+            return "[{}]".format(", ".join(
+                source or "c[{}]".format(self._const(child)) for child, source in zip(value, items)
+            ))
+        return None
+
+    def _expr(self, expr):
+        """
+        变量直接变成常量，生成器在每次渲染时求值一次
+        """
+        name, args = parseExpression(expr)
+        if args is None:
+            return "c[{}]".format(self._const(self._variable(name)))
+        key = (name, json.dumps(args))
+        if key not in self.exprs:
+            self.exprs[key] = len(self.funcs)
+            self.funcs.append(self._generator(name, args))
+        return "v[{}]".format(self.exprs[key])
+
+    def _variable(self, name):
+        if name in self.env:
+            return self.env[name]
+        value = self.env
+        for key in name.split("."):
+            if not isinstance(value, dict) or key not in value:
+                raise TemplateError("Unknown variable: {}".format(name))
+            value = value[key]
+        return value
+
+    def _generator(self, name, args):
+        try:
+            if name == "seq":
+                start, step = (list(args) + [1, 1][len(args):])[:2]
+                index, count = self.shard
+                return itertools.count(start + index * step, step * count).__next__
+            if name == "uuid":
+                return lambda: str(uuid.uuid4())
+            if name == "randint":
+                low, high = args
+                return lambda: self.random.randint(low, high)
+            if name in ("csv", "jsonl"):
+                path, key = (list(args) + [None])[:2]
+                source = self._source(name, path)
+                if key is None:
+                    return lambda: source.current
+                if not isinstance(source.first, dict) or key not in source.first:
+                    raise TemplateError("{} has no {!r}".format(path, key))
+                return lambda: source.current[key]
+        except TemplateError:
+            raise
+        except Exception as e:
+            raise TemplateError("Invalid arguments of {}: {!r}".format(name, e))
+        raise TemplateError("Unknown generator: {}".format(name))
+
+    def _source(self, kind, path):
+        fullPath = os.path.join(self.baseDir, path)
+        if fullPath not in self.sources:
+            try:
+                rows = readCsv(fullPath) if kind == "csv" else readJsonl(fullPath)
+            except (OSError, ValueError) as e:
+                raise TemplateError("Can't read {}: {!r}".format(path, e))
+            self.sources[fullPath] = RowSource(rows, self.shard)
+        return self.sources[fullPath]
+
+
+def compileTemplate(params, env=None, baseDir="", shard=(0, 1)) -> Template:
+    return Template(params, env, baseDir, shard)
+
+
+def renderOnce(params, env=None, baseDir=""):
+    """
+    只发送一次的params：不是模板时直接返回，不需要编译
+    """
+    if not isTemplate(params):
+        return params
+    return compileTemplate(params, env, baseDir).render()
+
+
+def parseVariables(items):
+    """
+    命令行的KEY=VALUE，VALUE是json时按json解析，否则作为字符串
+    """
+    env = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise TemplateError("Invalid variable {!r}, expected KEY=VALUE".format(item))
+        try:
+            env[key] = json.loads(value)
+        except ValueError:
+            env[key] = value
+    return env
+
+
+def getBaseDir(workspacePath):
+    """
+    模板里的文件相对workspace所在的目录
+    """
+    return os.path.dirname(os.path.abspath(workspacePath))
+
@@ -0,0 +1,205 @@
+# -*- coding:utf-8 -*-
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from nameko.exceptions import RpcTimeout
+
+import utils
+import constants as const
+from dispatcher import RpcTask, RpcCancelled
+
+
+class PipelineDispatcher(object):
+    """
+    流水线请求分发：一个线程，一个rpc客户端，一个连接。
+    请求用call_async发送，不等待回复，回复按correlation_id对应到请求，最多同时等待size个回复。
+    nameko的客户端每次等待回复都会新建一次消费者连接，这里一直保持同一个消费者，
+    接口与Dispatcher相同，可以互相替换
+    """
+    def __init__(self, clientFactory, size=const.PIPELINE_SIZE, timeout=None):
+        # clientFactory返回未启动的RpcClient，timeout为None时使用客户端的timeout
+        self.clientFactory = clientFactory
+        self.size = size
+        self.timeout = timeout
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        # correlation_id -> (task, rpcCall, start)
+        self.inflight = {}
+        self.handle = None
+        self.client = None
+        self.stopped = False
+        self.wakeup = threading.Event()
+        # 与Dispatcher相同，用事件代替Thread.join
+        self.finished = threading.Event()
+        # 格式化和保存结果在这里执行，不阻塞接收回复
+        self.finisher = ThreadPoolExecutor(const.PIPELINE_FINISH_WORKERS, thread_name_prefix="RpcFinish")
+        self.thread = threading.Thread(target=self._work, name="RpcPipeline", daemon=True)
+        self.thread.start()
+
+    def submit(self, task: RpcTask) -> Future:
+        if self.stopped:
+            raise RuntimeError("Dispatcher is stopped")
+        self.tasks.put(task)
+        self.wakeup.set()
+        return task.future
+
+    def _work(self):
+        while not self.stopped or not self.tasks.empty():
+            if self.tasks.empty():
+                self.wakeup.wait(const.PIPELINE_POLL_INTERVAL)
+                self.wakeup.clear()
+                continue
+            try:
+                self._start()
+            except Exception as e:
+                logging.exception(e)
+                self._stopClient()
+                self._failQueued(e)
+                continue
+            try:
+                # 每收到一个回复返回一次，没有回复时在on_iteration中发送请求
+                for _ in self.handle.reply_listener.consumer.consume(safety_interval=const.PIPELINE_POLL_INTERVAL):
+                    self._pump()
+            except Exception as e:
+                logging.exception(e)
+                self._failInflight(e)
+            finally:
+                self._stopClient()
+        self._stopClient()
+        self.finisher.shutdown(wait=True)
+        self.finished.set()
+
+    def _start(self):
+        handle = self.clientFactory()
+        self.client = handle.start()
+        handle.reply_listener.consumer.onIteration = self._pump
+        if self.timeout is None:
+            self.timeout = handle.reply_listener.timeout
+        with self.lock:
+            self.handle = handle
+
+    def _stopClient(self):
+        with self.lock:
+            handle, self.handle, self.client = self.handle, None, None
+        if handle is None:
+            return
+        try:
+            handle.stop()
+        except Exception as e:
+            logging.exception(e)
+
+    def _pump(self):
+        """
+        在消费者线程中执行：发送排队的请求，处理收到的回复，丢弃超时和取消的请求
+        """
+        listener = self.handle.reply_listener
+        while len(self.inflight) < self.size:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task.isCancelled():
+                task.future.set_result(task.finishCancelled())
+                continue
+            start = time.time()
+            rpcCall = task.capture(
+                getattr(getattr(self.client.proxy, task.service), task.method).call_async, **task.params
+            )
+            if task.error is not None:
+                self._finish(task, rpcCall, start)
+                continue
+            with self.lock:
+                self.inflight[rpcCall.correlation_id] = (task, rpcCall, start)
+
+        now = time.time()
+        for correlationId, (task, rpcCall, start) in list(self.inflight.items()):
+            if listener.pending.get(correlationId):
+                # 回复已经收到，result()不会再等待
+                result = task.capture(rpcCall.result)
+            elif task.cancelled:
+                # 从pending中删除，迟到的回复会被ReplyListener直接丢弃
+                listener.pending.pop(correlationId, None)
+                result = task.capture(self._raise, RpcCancelled())
+            elif self._isTimeout(task, now - start):
+                listener.pending.pop(correlationId, None)
+                result = task.capture(self._raise, RpcTimeout())
+            else:
+                continue
+            with self.lock:
+                del self.inflight[correlationId]
+            self._finish(task, result, start)
+
+        if self.stopped and self.tasks.empty() and not self.inflight:
+            listener.consumer.should_stop = True
+
+    def _isTimeout(self, task, elapsed):
+        timeout = self.timeout if task.timeout is None else task.timeout
+        return bool(timeout) and elapsed > timeout
+
+    def _raise(self, error):
+        raise error
+
+    def _finish(self, task, result, start):
+        def finish():
+            try:
+                task.future.set_result(task.finish(result, start))
+            except Exception as e:
+                logging.exception(e)
+                task.future.set_exception(e)
+        self.finisher.submit(finish)
+
+    def _failInflight(self, error):
+        """
+        连接出错，等待中的请求都返回错误，下次有请求时重新连接
+        """
+        with self.lock:
+            inflight, self.inflight = self.inflight, {}
+        for task, rpcCall, start in inflight.values():
+            task.error = error
+            self._finish(task, utils.errorToDict(repr(error)), start)
+
+    def _failQueued(self, error):
+        """
+        连接失败，排队中的请求都返回错误
+        """
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            task.error = error
+            self._finish(task, utils.errorToDict(repr(error)), time.time())
+
+    def stop(self):
+        """
+        不再接受新请求，已经提交的请求完成后关闭连接，不阻塞调用方
+        """
+        self.stopped = True
+        self.wakeup.set()
+
+    def cancel(self):
+        """
+        丢弃排队中还没有发送的请求
+        """
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            task.future.cancel()
+
+    def join(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "busy": len(self.inflight),
+                "queued": self.tasks.qsize(),
+                "clients": 1 if self.handle is not None else 0,
+            }
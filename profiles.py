@@ -0,0 +1,181 @@
+# -*- coding:utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+import collections
+
+import utils
+import constants as const
+from dispatcher import Dispatcher
+
+
+def getProfilesPath(workspacePath):
+    """
+    broker配置保存在workspace旁边，例如namekoman.json对应namekoman.profiles.json
+    """
+    return os.path.splitext(workspacePath)[0] + const.PROFILES_SUFFIX
+
+
+class ProfileStore(object):
+    """
+    命名的broker配置：{"profiles": {name: broker}, "envs": {name: {变量: 值}}, "current": name}，
+    envs是每个配置的params模板变量
+    """
+    def __init__(self, path):
+        self.path = path
+        self.profiles = collections.OrderedDict([(const.PROFILE_DEFAULT, const.BROKER)])
+        self.envs = dict()
+        self.current = const.PROFILE_DEFAULT
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.loads(f.read())
+            self.profiles = collections.OrderedDict(data[const.PROFILES]) or self.profiles
+            self.envs = data.get(const.PROFILE_ENVS) or dict()
+            self.current = data.get(const.PROFILE_CURRENT) if data.get(const.PROFILE_CURRENT) in self.profiles \
+                else next(iter(self.profiles))
+        except Exception as e:
+            logging.exception(e)
+        return self
+
+    def save(self):
+        data = {const.PROFILES: self.profiles, const.PROFILE_ENVS: self.envs, const.PROFILE_CURRENT: self.current}
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            f.write(utils.objectToJsonStr(data))
+        os.replace(tmpPath, self.path)
+
+    def names(self):
+        return list(self.profiles)
+
+    def getBroker(self, name):
+        return self.profiles.get(name)
+
+    def setProfile(self, name, broker):
+        self.profiles[name] = broker
+        self.save()
+
+    def getEnv(self, name):
+        return self.envs.get(name) or dict()
+
+    def setEnv(self, name, env):
+        if env:
+            self.envs[name] = env
+        else:
+            self.envs.pop(name, None)
+        self.save()
+
+    def deleteProfile(self, name):
+        """
+        至少保留一个配置
+        """
+        if name not in self.profiles or len(self.profiles) == 1:
+            return False
+        del self.profiles[name]
+        self.envs.pop(name, None)
+        if self.current == name:
+            self.current = next(iter(self.profiles))
+        self.save()
+        return True
+
+    def setCurrent(self, name):
+        if name in self.profiles and name != self.current:
+            self.current = name
+            self.save()
+
+
+class PoolEntry(object):
+    __slots__ = ("dispatcher", "lastUsed", "state", "error")
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.lastUsed = time.time()
+        self.state = "connecting..."
+        self.error = None
+
+
+class DispatcherPool(object):
+    """
+    每个broker一个请求分发，第一次使用时才创建，之后一直保持连接，切换broker时不需要重新连接。
+    定期用ping检查连接，长时间没有使用的broker停止请求分发，释放连接
+    """
+    def __init__(self, createClientFactory, size=const.RPC_POOL_SIZE, idleTimeout=const.PROFILE_IDLE_TIMEOUT):
+        # createClientFactory(broker)返回这个broker的clientFactory
+        self.createClientFactory = createClientFactory
+        self.size = size
+        self.idleTimeout = idleTimeout
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, broker):
+        """
+        返回(请求分发, 是否新建)，新建的请求分发需要调用方调用connect在后台连接
+        """
+        with self.lock:
+            entry = self.entries.get(broker)
+            created = entry is None
+            if created:
+                entry = self.entries[broker] = PoolEntry(Dispatcher(self.createClientFactory(broker), self.size))
+            entry.lastUsed = time.time()
+            return entry.dispatcher, created
+
+    def getEntry(self, broker) -> PoolEntry:
+        with self.lock:
+            return self.entries.get(broker)
+
+    def setState(self, dispatcher, error):
+        """
+        记录连接或者ping的结果，请求分发已经被淘汰时返回None
+        """
+        with self.lock:
+            for broker, entry in self.entries.items():
+                if entry.dispatcher is dispatcher:
+                    entry.state = "connected" if error is None else "disconnected"
+                    entry.error = error
+                    return broker
+        return None
+
+    def ping(self, callback):
+        """
+        在每个请求分发的工作线程里检查连接，完成后在工作线程里调用callback(dispatcher, error)
+        """
+        with self.lock:
+            dispatchers = [entry.dispatcher for entry in self.entries.values()]
+        for dispatcher in dispatchers:
+            try:
+                dispatcher.ping().add_done_callback(
+                    lambda future, dispatcher=dispatcher: future.cancelled() or callback(dispatcher, future.result())
+                )
+            except RuntimeError:
+                # 已经停止
+                pass
+
+    def evictIdle(self, keep=None):
+        """
+        停止超过idleTimeout没有使用，也没有请求在执行的请求分发，keep是当前使用的broker，不淘汰，
+        返回淘汰的broker
+        """
+        now = time.time()
+        evicted = []
+        with self.lock:
+            for broker, entry in list(self.entries.items()):
+                stats = entry.dispatcher.getStats()
+                if broker == keep or now - entry.lastUsed < self.idleTimeout or stats["busy"] or stats["queued"]:
+                    continue
+                entry.dispatcher.stop()
+                del self.entries[broker]
+                evicted.append(broker)
+        return evicted
+
+    def stopAll(self):
+        with self.lock:
+            entries, self.entries = list(self.entries.values()), collections.OrderedDict()
+        for entry in entries:
+            entry.dispatcher.stop()
+        return [entry.dispatcher for entry in entries]
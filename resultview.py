@@ -0,0 +1,467 @@
+# -*- coding:utf-8 -*-
+
+import json
+import time
+import logging
+
+from PyQt5.QtCore import Qt as QtCoreQt, pyqtSignal, QThread, QAbstractItemModel, QModelIndex
+from PyQt5.QtWidgets import (
+    QWidget, QTreeView, QLineEdit, QLabel, QPlainTextEdit, QStackedWidget,
+    QBoxLayout, QHeaderView, QApplication, QMenu, QPushButton, QComboBox
+)
+from PyQt5.QtGui import QCursor, QColor
+
+import utils
+import constants as const
+from jsondiff import ADDED, REMOVED, diff, changedPaths, formatCount, formatValue
+
+
+def isContainer(value):
+    return isinstance(value, (dict, list))
+
+
+def preview(value) -> str:
+    """
+    value列显示的内容，容器只显示元素个数，过长的字符串截断
+    """
+    if isinstance(value, dict):
+        return "{{{}}}".format(len(value))
+    if isinstance(value, list):
+        return "[{}]".format(len(value))
+    text = json.dumps(value, ensure_ascii=False)
+    if len(text) > const.RESULT_PREVIEW_LENGTH:
+        text = text[:const.RESULT_PREVIEW_LENGTH] + "..."
+    return text
+
+
+def iterItems(value):
+    if isinstance(value, dict):
+        return ((key, value[key]) for key in sorted(value))
+    if isinstance(value, list):
+        return enumerate(value)
+    return iter(())
+
+
+def findPaths(obj, text, limit=const.RESULT_SEARCH_LIMIT):
+    """
+    在解析后的结果中查找key或者值包含text的节点，按显示顺序（先序）返回路径，不区分大小写
+    """
+    text = text.lower()
+    paths = []
+    stack = [((), iterItems(obj))]
+    while stack and len(paths) < limit:
+        path, items = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            continue
+        key, child = item
+        childPath = path + (key,)
+        if isinstance(key, str) and text in key.lower():
+            paths.append(childPath)
+        elif isinstance(child, str):
+            if text in child.lower():
+                paths.append(childPath)
+        elif not isContainer(child):
+            if text in json.dumps(child):
+                paths.append(childPath)
+        if isContainer(child):
+            stack.append((childPath, iterItems(child)))
+    return paths
+
+
+class JsonNode(object):
+    """
+    结果树的节点，子节点按需分批创建
+    """
+    __slots__ = ("key", "value", "parent", "row", "children", "keys", "path")
+
+    def __init__(self, key, value, parent, row):
+        self.key = key
+        self.value = value
+        self.parent = parent
+        self.row = row
+        self.path = () if parent is None else parent.path + (key,)
+        self.children = []
+        # dict按key排序显示，和objectToJsonStr的sort_keys一致
+        self.keys = sorted(value) if isinstance(value, dict) else None
+
+    def total(self):
+        return len(self.value) if isContainer(self.value) else 0
+
+    def childAt(self, row):
+        key = self.keys[row] if self.keys is not None else row
+        return JsonNode(key, self.value[key], self, row)
+
+    def rowOf(self, key):
+        return self.keys.index(key) if self.keys is not None else key
+
+
+class JsonTreeModel(QAbstractItemModel):
+    """
+    只为展开并且可见的部分创建节点，大数组每次只创建RESULT_FETCH_SIZE个子节点，滚动到底部时再继续创建
+    """
+    HEADERS = ("key", "value")
+
+    def __init__(self):
+        super().__init__()
+        self.root = JsonNode(None, {}, None, 0)
+        # 有变化的节点和它们的祖先，路径 -> 提示
+        self.changes = set()
+        self.changeTips = {}
+
+    def setRoot(self, value):
+        self.beginResetModel()
+        self.root = JsonNode(None, value, None, 0)
+        self.changes, self.changeTips = set(), {}
+        self.endResetModel()
+
+    def setChanges(self, differences):
+        """
+        标记和基准结果的差异：有变化的节点用DIFF_CHANGED_COLOR，包含变化的父节点用DIFF_PARENT_COLOR
+        """
+        self.changes = changedPaths(differences)
+        self.changeTips = {}
+        for path, kind, old, new in differences:
+            if kind == REMOVED:
+                path, tip = path[:-1], "removed {}: {}".format(path[-1], formatValue(old))
+            elif kind == ADDED:
+                tip = "added"
+            else:
+                tip = "was: {}".format(formatValue(old))
+            self.changeTips.setdefault(path, []).append(tip)
+
+    def _node(self, index: QModelIndex) -> JsonNode:
+        return index.internalPointer() if index.isValid() else self.root
+
+    def indexFromNode(self, node: JsonNode) -> QModelIndex:
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if row < 0 or row >= len(node.children) or column >= len(self.HEADERS):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+        return self.indexFromNode(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        return self._node(parent).total() > 0
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return len(node.children) < node.total()
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        start = len(node.children)
+        end = min(node.total(), start + const.RESULT_FETCH_SIZE)
+        if start >= end:
+            return
+        self.beginInsertRows(parent, start, end - 1)
+        node.children.extend(node.childAt(row) for row in range(start, end))
+        self.endInsertRows()
+
+    def data(self, index, role=QtCoreQt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == QtCoreQt.DisplayRole:
+            if index.column() == 0:
+                return node.key if isinstance(node.key, str) else "[{}]".format(node.key)
+            return preview(node.value)
+        if role == QtCoreQt.BackgroundRole and node.path in self.changes:
+            return QColor(const.DIFF_CHANGED_COLOR if node.path in self.changeTips else const.DIFF_PARENT_COLOR)
+        if role == QtCoreQt.ToolTipRole:
+            tips = list(self.changeTips.get(node.path, ()))
+            if index.column() == 1 and not isContainer(node.value):
+                tips.append(json.dumps(node.value, ensure_ascii=False)[:const.RESULT_TOOLTIP_LENGTH])
+            return "\n".join(tips) if tips else None
+        return None
+
+    def headerData(self, section, orientation, role=QtCoreQt.DisplayRole):
+        if orientation == QtCoreQt.Horizontal and role == QtCoreQt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def indexFromPath(self, path) -> QModelIndex:
+        """
+        按路径找到节点，沿途分批创建子节点直到路径上的节点出现
+        """
+        node, index = self.root, QModelIndex()
+        for key in path:
+            row = node.rowOf(key)
+            while len(node.children) <= row:
+                self.fetchMore(index)
+            node = node.children[row]
+            index = self.createIndex(row, 0, node)
+        return index
+
+
+class SearchThread(QThread):
+    """
+    在解析后的结果对象上查找，大结果不阻塞界面
+    """
+    finishSignal = pyqtSignal(object, str, list)
+
+    def __init__(self, obj, text):
+        super().__init__()
+        self.obj, self.text = obj, text
+
+    def run(self):
+        try:
+            paths = findPaths(self.obj, self.text)
+        except Exception as e:
+            logging.exception(e)
+            paths = []
+        self.finishSignal.emit(self.obj, self.text, paths)
+
+
+class DiffThread(QThread):
+    """
+    读取历史结果并和显示的结果比较
+    """
+    finishSignal = pyqtSignal(object, object, object)
+
+    def __init__(self, load, ref, obj):
+        super().__init__()
+        self.load, self.ref, self.obj = load, ref, obj
+
+    def run(self):
+        try:
+            differences = diff(self.load(self.ref), self.obj)
+        except Exception as e:
+            logging.exception(e)
+            differences = None
+        self.finishSignal.emit(self.obj, self.ref, differences)
+
+
+class LoadThread(QThread):
+    """
+    读取并解析保存的结果，大结果不阻塞界面，失败时结果为None
+    """
+    finishSignal = pyqtSignal(object, object)
+
+    def __init__(self, load, key):
+        super().__init__()
+        self.load, self.key = load, key
+
+    def run(self):
+        try:
+            entry = self.load()
+        except Exception as e:
+            logging.exception(e)
+            entry = None
+        self.finishSignal.emit(self.key, entry)
+
+
+class ResultViewer(QWidget):
+    """
+    结果显示控件：dict和list用按需展开的树显示，不再截断；其它内容（说明，错误信息）用文本显示。
+    搜索框回车开始查找，再次回车跳到下一个匹配。
+    和之前的结果有差异时标记变化的节点，点击changes按钮依次跳到每个变化，也可以选择一个历史结果比较
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.result = None
+        self.matches = []
+        self.matchIndex = -1
+        self.searchText = ""
+        # 运行中的查找和比较线程，结束前需保持引用
+        self.searchThreads = set()
+        self.differences = None
+        self.changeIndex = -1
+        # 按引用读取历史结果，在比较线程中调用
+        self.loadResult = None
+
+        self.searchEdit = QLineEdit()
+        self.searchEdit.setPlaceholderText("Search result, press enter for next match")
+        self.searchEdit.returnPressed.connect(self.onSearch)
+        self.searchLabel = QLabel("")
+        self.statusLabel = QLabel("")
+        self.changesButton = QPushButton("")
+        self.changesButton.setToolTip("Differences from the previous result, click for the next change")
+        self.changesButton.clicked.connect(lambda: self.gotoChange(self.changeIndex + 1))
+        self.changesButton.hide()
+        self.baselineCombo = QComboBox()
+        self.baselineCombo.setToolTip("Compare with a previous result")
+        self.baselineCombo.currentIndexChanged.connect(self.onBaselineSelected)
+        self.baselineCombo.hide()
+
+        self.model = JsonTreeModel()
+        self.treeView = QTreeView()
+        self.treeView.setModel(self.model)
+        self.treeView.setUniformRowHeights(True)
+        self.treeView.header().setSectionResizeMode(0, QHeaderView.Interactive)
+        self.treeView.header().resizeSection(0, 250)
+        self.treeView.setContextMenuPolicy(QtCoreQt.CustomContextMenu)
+        self.treeView.customContextMenuRequested.connect(self.showContextMenu)
+
+        self.textEdit = QPlainTextEdit()
+        self.textEdit.setReadOnly(True)
+
+        self.stack = QStackedWidget()
+        self.stack.addWidget(self.textEdit)
+        self.stack.addWidget(self.treeView)
+
+        searchLayout = QBoxLayout(QBoxLayout.LeftToRight)
+        searchLayout.addWidget(self.searchEdit)
+        searchLayout.addWidget(self.searchLabel)
+        searchLayout.addWidget(self.statusLabel)
+        searchLayout.addWidget(self.changesButton)
+        searchLayout.addWidget(self.baselineCombo)
+        layout = QBoxLayout(QBoxLayout.TopToBottom)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(searchLayout)
+        layout.addWidget(self.stack)
+        self.setLayout(layout)
+
+    def showResult(self, result, differences=None, baselines=()):
+        """
+        differences是和之前的结果的差异，baselines是可以比较的历史结果的引用，从旧到新
+        """
+        self.result = result
+        self.matches, self.matchIndex, self.searchText = [], -1, ""
+        self.searchLabel.setText("")
+        self.statusLabel.setText("")
+        if isContainer(result):
+            self.model.setRoot(result)
+            self.stack.setCurrentWidget(self.treeView)
+        else:
+            self.model.setRoot({})
+            text = result if isinstance(result, str) else utils.objectToJsonStr(result)
+            self.textEdit.setPlainText(text)
+            self.stack.setCurrentWidget(self.textEdit)
+        self.setBaselines(baselines)
+        self.showDifferences(differences)
+
+    def setResultLoader(self, load):
+        self.loadResult = load
+
+    def setBaselines(self, refs):
+        self.baselineCombo.blockSignals(True)
+        self.baselineCombo.clear()
+        if refs and self.loadResult is not None:
+            self.baselineCombo.addItem("compare with...")
+            for i, ref in enumerate(reversed(refs), 1):
+                self.baselineCombo.addItem("-{}: {}, {} bytes".format(
+                    i, time.strftime("%m-%d %H:%M:%S", time.localtime(ref[const.BLOB_TIME])), ref[const.BLOB_SIZE]
+                ), ref)
+        self.baselineCombo.setVisible(self.baselineCombo.count() > 0)
+        self.baselineCombo.blockSignals(False)
+
+    def onBaselineSelected(self, i):
+        ref = self.baselineCombo.itemData(i)
+        if not ref:
+            self.showDifferences(None)
+            return
+        self.changesButton.setText("comparing...")
+        self.changesButton.show()
+        thread = DiffThread(self.loadResult, ref, self.result)
+        thread.finishSignal.connect(self.onDiffFinished)
+        thread.finished.connect(lambda: self.searchThreads.discard(thread))
+        self.searchThreads.add(thread)
+        thread.start()
+
+    def onDiffFinished(self, obj, ref, differences):
+        # 比较期间结果或者选择的历史结果已经变化，丢弃
+        if obj is not self.result or ref != self.baselineCombo.currentData():
+            return
+        self.showDifferences(differences)
+
+    def showDifferences(self, differences):
+        """
+        标记差异，differences为None时清除标记
+        """
+        self.differences, self.changeIndex = differences, -1
+        self.model.setChanges(differences or [])
+        self.treeView.viewport().update()
+        if differences is None:
+            self.changesButton.hide()
+            return
+        self.changesButton.setText("{} changes".format(formatCount(differences)) if differences else "no changes")
+        self.changesButton.setEnabled(bool(differences) and isContainer(self.result))
+        self.changesButton.show()
+
+    def gotoChange(self, i):
+        if not self.differences:
+            return
+        self.changeIndex = i % len(self.differences)
+        path, kind, _, _ = self.differences[self.changeIndex]
+        # 删除的节点不在结果里，跳到它的父节点
+        self.gotoPath(path[:-1] if kind == REMOVED else path)
+        self.changesButton.setText("{}/{} changes".format(self.changeIndex + 1, formatCount(self.differences)))
+
+    def setStatus(self, text):
+        """
+        显示在查找框右边的状态，例如各阶段耗时
+        """
+        self.statusLabel.setText(text)
+
+    def onSearch(self):
+        text = self.searchEdit.text()
+        if not text or not isContainer(self.result):
+            return
+        if text == self.searchText and self.matches:
+            self.gotoMatch(self.matchIndex + 1)
+            return
+        self.searchText = text
+        self.searchLabel.setText("searching...")
+        thread = SearchThread(self.result, text)
+        thread.finishSignal.connect(self.onSearchFinished)
+        thread.finished.connect(lambda: self.searchThreads.discard(thread))
+        self.searchThreads.add(thread)
+        thread.start()
+
+    def onSearchFinished(self, obj, text, paths):
+        # 查找期间结果或者查找内容已经变化，丢弃
+        if obj is not self.result or text != self.searchText:
+            return
+        self.matches = paths
+        if not paths:
+            self.searchLabel.setText("0 matches")
+            return
+        self.gotoMatch(0)
+
+    def gotoMatch(self, i):
+        if not self.matches:
+            return
+        self.matchIndex = i % len(self.matches)
+        self.gotoPath(self.matches[self.matchIndex])
+        suffix = "+" if len(self.matches) >= const.RESULT_SEARCH_LIMIT else ""
+        self.searchLabel.setText("{}/{}{}".format(self.matchIndex + 1, len(self.matches), suffix))
+
+    def gotoPath(self, path):
+        index = self.model.indexFromPath(path)
+        parent = index.parent()
+        while parent.isValid():
+            self.treeView.expand(parent)
+            parent = parent.parent()
+        self.treeView.setCurrentIndex(index)
+        self.treeView.scrollTo(index)
+
+    def showContextMenu(self, pos):
+        index = self.treeView.indexAt(pos)
+        if not index.isValid():
+            return
+        node = index.internalPointer()
+        menu = QMenu(self)
+        action = menu.addAction("copy value")
+        action.triggered.connect(lambda: QApplication.clipboard().setText(utils.objectToJsonStr(node.value)))
+        menu.exec_(QCursor.pos())
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+
+import time
+
+from nameko.rpc import get_rpc_exchange
+from nameko.exceptions import RpcTimeout
+from nameko.amqp.publish import get_connection
+from nameko.standalone.rpc import ClusterRpcClient, ReplyListener
+
+import constants as const
+from dispatcher import RpcCancelled
+
+
+class ReplyConsumer(ReplyListener.ReplyConsumer):
+    """
+    回复队列的消费者，每次等待消息超时（safety_interval）时调用onIteration，
+    用来检查超时和取消，或者在同一个线程里发送新请求
+    """
+    onIteration = None
+
+    def on_iteration(self):
+        if self.onIteration is not None:
+            self.onIteration()
+
+
+class RpcClient(object):
+    """
+    ClusterRpcClient的包装，连接建立后每次调用可以有自己的超时，也可以中途取消，
+    修改超时不需要重建客户端。
+    超时或者取消的请求从等待列表中删除，迟到的回复由ReplyListener直接确认丢弃
+    """
+    def __init__(self, broker, timeout):
+        self.timeout = timeout
+        self.cluster = ClusterRpcClient(timeout=timeout, uri=broker)
+        self.reply_listener = self.cluster.reply_listener
+        # 回复队列和发送请求使用同一个broker，不读取nameko的全局配置
+        self.reply_listener.amqp_uri = self.cluster.amqp_uri
+        self.reply_listener.ssl = self.cluster.ssl
+        self.reply_listener.consumer_cls = ReplyConsumer
+        self.proxy = None
+        self.check = None
+
+    def start(self):
+        self.proxy = self.cluster.start()
+        self.reply_listener.consumer.onIteration = self._onIteration
+        return self
+
+    def stop(self):
+        self.cluster.stop()
+
+    def ping(self):
+        """
+        用连接池里的连接确认rpc交换机存在，检查broker是否可用，同时让空闲的连接保持活跃
+        """
+        listener = self.reply_listener
+        with get_connection(listener.amqp_uri, ssl=listener.ssl) as connection:
+            connection.ensure_connection(max_retries=1)
+            get_rpc_exchange()(connection.default_channel).declare(passive=True)
+
+    def _onIteration(self):
+        if self.check is not None:
+            self.check()
+
+    def call(self, service, method, params, timeout=None, isCancelled=None):
+        """
+        发送请求并等待结果，timeout为None时使用客户端的超时，
+        isCancelled()返回True时放弃等待，抛出RpcCancelled
+        """
+        if isCancelled is not None and isCancelled():
+            raise RpcCancelled()
+        rpcCall = getattr(getattr(self.proxy, service), method).call_async(**params)
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout if timeout else None
+        listener = self.reply_listener
+
+        def check():
+            if isCancelled is not None and isCancelled():
+                raise RpcCancelled()
+            if deadline is not None and time.time() > deadline:
+                raise RpcTimeout()
+
+        self.check = check
+        replies = listener.consumer.consume(safety_interval=const.RPC_WAIT_INTERVAL)
+        try:
+            while not listener.pending.get(rpcCall.correlation_id):
+                if next(replies, StopIteration) is StopIteration:
+                    raise RuntimeError("Stopped and can no longer be used")
+        except BaseException:
+            listener.pending.pop(rpcCall.correlation_id, None)
+            raise
+        finally:
+            self.check = None
+            replies.close()
+        # 回复已经收到，result()不会再等待
+        return rpcCall.result()
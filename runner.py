@@ -0,0 +1,318 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import time
+import fnmatch
+import argparse
+import logging
+import threading
+import functools
+
+import utils
+import constants as const
+from storage import NODE_COLUMNS, createStorage, collectGarbage
+from history import toSample
+from dispatcher import RpcTask, createDispatcher, createRpcClient
+from profiles import ProfileStore, getProfilesPath
+from paramtemplate import TemplateError, renderOnce, parseVariables, getBaseDir
+from jsondiff import diffResult, compileIgnore, formatPath
+
+
+def iterMethods(storage, *path):
+    """
+    按树的顺序遍历path下所有method的路径，path可以是project，service，module或者method
+    """
+    if len(path) == len(NODE_COLUMNS):
+        yield tuple(path)
+        return
+    for name in storage.listChildren(*path):
+        yield from iterMethods(storage, *path, name)
+
+
+def matchPath(path, pattern):
+    """
+    pattern按/分隔，依次匹配project，service，module，method，支持*?[]通配符，
+    少于4段时匹配前缀下的所有method，例如order/*_service
+    """
+    names = pattern.strip("/").split("/")
+    if len(names) > len(NODE_COLUMNS):
+        return False
+    return all(fnmatch.fnmatchcase(name, glob) for name, glob in zip(path, names))
+
+
+def selectMethods(storage, patterns):
+    return [path for path in iterMethods(storage) if any(matchPath(path, pattern) for pattern in patterns)]
+
+
+class TemplateErrorTask(RpcTask):
+    """
+    params模板有错误的method，不发送请求，直接返回错误
+    """
+    def __init__(self, project, service, module, method, params, error):
+        super().__init__(project, service, module, method, params)
+        self.templateError = error
+
+    def run(self, client):
+        self.error = self.templateError
+        return self.finish(utils.errorToDict(str(self.error)), time.time())
+
+
+def createTask(storage, path, store=True, env=None, baseDir="", compare=False, ignore=None):
+    """
+    用method保存的params创建请求，params是模板时用env渲染。
+    compare为True时和发送前保存的结果比较，ignore是compileIgnore的返回值
+    """
+    params = storage.getParam(*path)
+    try:
+        params = renderOnce(params, env, baseDir)
+    except TemplateError as e:
+        return TemplateErrorTask(*path, params, e)
+    return RpcTask(
+        *path, params, store=storage.storeResultText if store else None,
+        compare=functools.partial(
+            diffResult, storage.getResultRef(*path), storage.loadResult, ignore=ignore
+        ) if compare else None
+    )
+
+
+class BatchRun(object):
+    """
+    批量执行：用每个method保存的params发送请求，最多parallelism个请求同时执行，
+    每个请求完成时调用callback(data)，data和发送单个请求的结果相同，callback在工作线程中调用。
+    pipelined为True时所有请求通过一个连接发送。params是模板时用env渲染，模板有错误的method直接返回错误。
+    compare为True时每个结果和保存的结果比较，差异在data[RESULT_DIFF]中，ignore是忽略的路径
+    """
+    def __init__(self, clientFactory, storage, paths, parallelism=const.BATCH_PARALLELISM, callback=None,
+                 pipelined=False, store=True, env=None, baseDir="", compare=False, ignore=()):
+        self.clientFactory = clientFactory
+        ignore = compileIgnore(ignore)
+        self.tasks = [createTask(storage, path, store, env, baseDir, compare, ignore) for path in paths]
+        self.parallelism = max(1, min(parallelism, len(self.tasks)))
+        self.callback = callback
+        self.pipelined = pipelined
+        self.lock = threading.Lock()
+        self.done = 0
+        self.errors = 0
+        self.cancelled = 0
+        # 结果和保存的结果不同的method数
+        self.changed = 0
+        self.startTime = 0.0
+        self.endTime = 0.0
+        self.dispatcher = None
+
+    def start(self):
+        self.startTime = time.time()
+        self.dispatcher = createDispatcher(self.clientFactory, self.parallelism, self.pipelined)
+        for task in self.tasks:
+            task.future.add_done_callback(self._onDone)
+            self.dispatcher.submit(task)
+        self.dispatcher.stop()
+
+    def _onDone(self, future):
+        data = None if future.cancelled() else future.result()
+        with self.lock:
+            self.done += 1
+            if data is None:
+                self.cancelled += 1
+            elif not data[const.RESULT_OK]:
+                self.errors += 1
+            elif data[const.RESULT_DIFF]:
+                self.changed += 1
+            if self.done == len(self.tasks):
+                self.endTime = time.time()
+        if data is not None and self.callback:
+            self.callback(data)
+
+    def stop(self):
+        """
+        排队中的请求不再发送，正在执行的请求执行完
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+
+    def wait(self, timeout=None):
+        self.dispatcher.join(timeout)
+
+    def isFinished(self):
+        return self.done == len(self.tasks)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "total": len(self.tasks),
+                "done": self.done,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "changed": self.changed,
+                "elapsed": (self.endTime or time.time()) - self.startTime if self.startTime else 0.0,
+            }
+
+
+def getDefaultWorkspace():
+    """
+    与界面相同：namekoman.py所在目录下存在namekoman.db时使用它，否则使用namekoman.json
+    """
+    base = os.path.dirname(os.path.abspath(sys.argv[0]))
+    db = os.path.join(base, "namekoman.db")
+    return db if os.path.exists(db) else os.path.join(base, "namekoman.json")
+
+
+def toRecord(data, withResult=False):
+    """
+    一个请求结果对应的一行JSON Lines输出
+    """
+    record = {
+        const.NODE_PROJECT: data[const.NODE_PROJECT],
+        const.NODE_SERVICE: data[const.NODE_SERVICE],
+        const.NODE_MODULE: data[const.NODE_MODULE],
+        const.NODE_METHOD: data[const.NODE_METHOD],
+        const.RESULT_OK: data[const.RESULT_OK],
+        "latency": data[const.RESULT_TIMINGS][const.TIMING_RPC],
+        "size": len(data[const.RESULT_TEXT]),
+    }
+    if withResult or not data[const.RESULT_OK]:
+        record[const.RESULT] = data[const.RESULT]
+    if data[const.RESULT_DIFF]:
+        record[const.RESULT_DIFF] = [
+            {"path": formatPath(path), "kind": kind, "old": old, "new": new}
+            for path, kind, old, new in data[const.RESULT_DIFF]
+        ]
+    return record
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m namekoman run",
+        description="Run stored requests without the ui and print JSON Lines results"
+    )
+    parser.add_argument(
+        "patterns", nargs="*", default=["*"],
+        help="project/service/module/method globs, fewer parts select everything below, default: all methods"
+    )
+    parser.add_argument("-w", "--workspace", default=None, help="namekoman.json or namekoman.db")
+    parser.add_argument("-b", "--broker", default=None, help="default: the profile's broker or {}".format(const.BROKER))
+    parser.add_argument("-p", "--profile", default=None, help="broker profile, its env is used by params templates")
+    parser.add_argument(
+        "-e", "--env", action="append", default=[], metavar="KEY=VALUE",
+        help="params template variable, overrides the profile's env, VALUE is parsed as JSON when possible"
+    )
+    parser.add_argument("-t", "--timeout", type=int, default=const.TIMEOUT, help="rpc timeout in seconds")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=const.BATCH_PARALLELISM, help="max requests at the same time"
+    )
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file, default: stdout")
+    parser.add_argument("--pipeline", action="store_true", help="send all requests through one connection")
+    parser.add_argument("--results", action="store_true", help="include results of successful requests")
+    parser.add_argument("--store", action="store_true", help="save results and latencies into the workspace like the ui")
+    parser.add_argument("--list", action="store_true", help="only print the selected methods")
+    parser.add_argument(
+        "--diff", action="store_true",
+        help="compare results with the stored results, fail when they differ; differences are in the output"
+    )
+    parser.add_argument(
+        "--ignore", action="append", default=[], metavar="PATH",
+        help="path skipped by --diff, * matches one key or index, e.g. '$.data[*].update_time'"
+    )
+    return parser.parse_args(argv)
+
+
+def getProfileEnv(workspace, args):
+    """
+    返回(broker, 模板变量)：--profile的broker和env，命令行的--broker和--env优先
+    """
+    broker, env = args.broker, dict()
+    if args.profile:
+        profileStore = ProfileStore(getProfilesPath(workspace)).load()
+        if args.profile not in profileStore.profiles:
+            raise ValueError("No profile named {}".format(args.profile))
+        broker = broker or profileStore.getBroker(args.profile)
+        env.update(profileStore.getEnv(args.profile))
+    env.update(parseVariables(args.env))
+    return broker or const.BROKER, env
+
+
+def main(argv):
+    """
+    命令行入口，不导入PyQt5。所有请求成功返回0，有失败（--diff时包括结果和保存的不同）返回1，
+    参数错误或者没有选中method返回2
+    """
+    args = parseArgs(argv)
+    logging.basicConfig(level=logging.WARNING, format=const.LOG_FORMAT, stream=sys.stderr)
+    workspace = args.workspace or getDefaultWorkspace()
+    try:
+        broker, env = getProfileEnv(workspace, args)
+    except (ValueError, TemplateError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    storage = createStorage(workspace)
+    # 没有--store时只读取，不修改workspace（包括移动旧版本的结果和合并操作日志）
+    storage.loadData(readOnly=not args.store)
+    try:
+        paths = selectMethods(storage, args.patterns)
+        if args.list or not paths:
+            for path in paths:
+                print("/".join(path))
+            if not paths:
+                print("No method matches {}".format(" ".join(args.patterns)), file=sys.stderr)
+            return 0 if paths else 2
+
+        output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        outputLock = threading.Lock()
+
+        def onResult(data):
+            line = utils.objectToCompactJsonStr(toRecord(data, args.results))
+            with outputLock:
+                output.write(line + "\n")
+                output.flush()
+            if args.store:
+                path = (
+                    data[const.NODE_PROJECT], data[const.NODE_SERVICE], data[const.NODE_MODULE], data[const.NODE_METHOD]
+                )
+                storage.addLatencySample(*path, toSample(data))
+                if data[const.RESULT_REF]:
+                    storage.updateResultRef(*path, data[const.RESULT_REF])
+
+        batchRun = BatchRun(
+            lambda: createRpcClient(broker, args.timeout), storage, paths, args.workers,
+            callback=onResult, pipelined=args.pipeline, store=args.store, env=env, baseDir=getBaseDir(workspace),
+            compare=args.diff, ignore=args.ignore
+        )
+        batchRun.start()
+        try:
+            batchRun.wait()
+        except KeyboardInterrupt:
+            batchRun.stop()
+            batchRun.wait()
+        if output is not sys.stdout:
+            output.close()
+        stats = batchRun.getStats()
+        summary = "{total} methods, {errors} failed, {cancelled} cancelled".format(**stats)
+        if args.diff:
+            summary += ", {changed} changed".format(**stats)
+        print("{}, elapsed: {:.2f}s".format(summary, stats["elapsed"]), file=sys.stderr)
+        return 1 if stats["errors"] or stats["cancelled"] or stats["changed"] else 0
+    finally:
+        storage.close()
+
+
+def gcMain(argv):
+    """
+    命令行入口：删除结果目录里没有被任何method（包括历史结果）引用的结果文件，json存储合并时也会自动清理
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m namekoman gc", description="Remove stored results that no method references any more"
+    )
+    parser.add_argument("-w", "--workspace", default=None, help="namekoman.json or namekoman.db")
+    parser.add_argument(
+        "--grace", type=int, default=const.BLOB_GC_GRACE, help="keep results written in the last GRACE seconds"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format=const.LOG_FORMAT, stream=sys.stderr)
+    storage = createStorage(args.workspace or getDefaultWorkspace())
+    try:
+        storage.loadData(readOnly=True)
+        print("Removed {} unreferenced results".format(collectGarbage(storage, args.grace)))
+    finally:
+        storage.close()
+    return 0
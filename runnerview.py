@@ -0,0 +1,141 @@
+# -*- coding:utf-8 -*-
+
+import logging
+
+from PyQt5.QtCore import pyqtSignal, QTimer
+from PyQt5.QtGui import QIntValidator
+from PyQt5.QtWidgets import (
+    QDialog, QLabel, QLineEdit, QPushButton, QCheckBox, QTableWidget, QTableWidgetItem, QBoxLayout, QHeaderView
+)
+
+import constants as const
+from runner import BatchRun, iterMethods
+from jsondiff import formatCount, formatDiff
+
+
+class BatchRunDialog(QDialog):
+    """
+    批量执行窗口：执行project，service或者module下所有method，结果到达时更新表格，
+    params模板用env渲染。勾选diff时和保存的结果比较，changes列显示差异的条数
+    """
+    COLUMNS = ("method", "status", "latency", "size", "changes")
+    resultSignal = pyqtSignal(object)
+
+    def __init__(self, parent, storage, clientFactory, path, onResult=None, env=None, baseDir=""):
+        super().__init__(parent)
+        self.storage = storage
+        self.clientFactory = clientFactory
+        self.path = tuple(path)
+        self.env = env
+        self.baseDir = baseDir
+        # 每个结果在ui线程中的处理，例如保存结果引用
+        self.onResult = onResult
+        self.batchRun = None
+        self.paths = list(iterMethods(storage, *self.path))
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.setWindowTitle("Run all: {}".format("/".join(self.path)))
+        self.resize(800, 600)
+
+        self.parallelismEdit = QLineEdit(str(const.BATCH_PARALLELISM))
+        self.parallelismEdit.setValidator(QIntValidator(1, const.PIPELINE_SIZE * 4))
+        self.parallelismEdit.setMaximumWidth(100)
+        self.parallelismEdit.setToolTip("Max requests running at the same time")
+        self.pipelineCheck = QCheckBox("pipeline")
+        self.pipelineCheck.setToolTip("Send all requests through one client and one connection")
+        self.diffCheck = QCheckBox("diff")
+        self.diffCheck.setChecked(True)
+        self.diffCheck.setToolTip("Compare results with the stored results")
+        self.startButton = QPushButton("Start")
+        self.startButton.clicked.connect(self.onStartOrStop)
+        self.summaryLabel = QLabel("{} methods".format(len(self.paths)))
+
+        self.table = QTableWidget(len(self.paths), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        prefix = len(self.path) - 1
+        for row, path in enumerate(self.paths):
+            self.table.setItem(row, 0, QTableWidgetItem("/".join(path[prefix:])))
+
+        toolLayout = QBoxLayout(QBoxLayout.LeftToRight)
+        toolLayout.addWidget(QLabel("parallelism"))
+        toolLayout.addWidget(self.parallelismEdit)
+        toolLayout.addWidget(self.pipelineCheck)
+        toolLayout.addWidget(self.diffCheck)
+        toolLayout.addWidget(self.startButton)
+        toolLayout.addWidget(self.summaryLabel)
+        toolLayout.addStretch()
+        layout = QBoxLayout(QBoxLayout.TopToBottom)
+        layout.addLayout(toolLayout)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        self.resultSignal.connect(self.onResultArrived)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.updateSummary)
+
+    def onStartOrStop(self):
+        if self.batchRun is not None:
+            self.batchRun.stop()
+            return
+        if not self.paths:
+            return
+        try:
+            parallelism = int(self.parallelismEdit.text())
+        except Exception as e:
+            logging.exception(e)
+            parallelism = const.BATCH_PARALLELISM
+        for row in range(len(self.paths)):
+            for column in range(1, len(self.COLUMNS)):
+                self.table.setItem(row, column, QTableWidgetItem("queued" if column == 1 else ""))
+        self.batchRun = BatchRun(
+            self.clientFactory, self.storage, self.paths, parallelism, callback=self.resultSignal.emit,
+            pipelined=self.pipelineCheck.isChecked(), env=self.env, baseDir=self.baseDir,
+            compare=self.diffCheck.isChecked()
+        )
+        logging.info("Run all start, path: {}, methods: {}, parallelism: {}".format(
+            "/".join(self.path), len(self.paths), self.batchRun.parallelism
+        ))
+        self.batchRun.start()
+        self.startButton.setText("Stop")
+        self.timer.start(const.LOAD_TEST_REFRESH_INTERVAL)
+
+    def onResultArrived(self, data: dict):
+        path = (data[const.NODE_PROJECT], data[const.NODE_SERVICE], data[const.NODE_MODULE], data[const.NODE_METHOD])
+        if self.onResult:
+            self.onResult(data)
+        row = self.rows.get(path)
+        if row is None:
+            return
+        timings = data[const.RESULT_TIMINGS]
+        status = QTableWidgetItem("ok" if data[const.RESULT_OK] else "error")
+        if not data[const.RESULT_OK]:
+            status.setToolTip(data[const.RESULT_TEXT][:const.RESULT_TOOLTIP_LENGTH])
+        self.table.setItem(row, 1, status)
+        self.table.setItem(row, 2, QTableWidgetItem("{:.1f}ms".format(timings[const.TIMING_RPC] * 1000)))
+        self.table.setItem(row, 3, QTableWidgetItem(str(len(data[const.RESULT_TEXT]))))
+        differences = data[const.RESULT_DIFF]
+        if differences is not None:
+            changes = QTableWidgetItem(formatCount(differences))
+            changes.setToolTip(formatDiff(differences)[:const.RESULT_TOOLTIP_LENGTH])
+            self.table.setItem(row, 4, changes)
+
+    def updateSummary(self):
+        stats = self.batchRun.getStats()
+        self.summaryLabel.setText(
+            "done: {done}/{total}, errors: {errors}, changed: {changed}, elapsed: {elapsed:.1f}s".format(**stats)
+        )
+        if self.batchRun.isFinished():
+            self.timer.stop()
+            for row in range(len(self.paths)):
+                if self.table.item(row, 1).text() == "queued":
+                    self.table.setItem(row, 1, QTableWidgetItem("cancelled"))
+            logging.info("Run all end, path: {}, stats: {}".format("/".join(self.path), stats))
+            self.batchRun = None
+            self.startButton.setText("Start")
+
+    def closeEvent(self, event):
+        if self.batchRun is not None:
+            self.batchRun.stop()
+        self.timer.stop()
+        super().closeEvent(event)
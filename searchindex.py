@@ -0,0 +1,301 @@
+# -*- coding:utf-8 -*-
+
+import collections
+
+import constants as const
+
+ROOT = 0
+# method节点的路径长度：project，service，module，method
+METHOD_DEPTH = 4
+# 节点记录的下标：名字，小写的词条，父节点id，{子节点名字: id}
+NAME, TERM, PARENT, CHILDREN = range(4)
+
+
+class SearchIndex(object):
+    """
+    project，service，module，method名字（可选params的key）的内存索引，支持增量修改。
+    每个节点有不变的id，名字统一小写作为词条：
+    shortGrams：词条中任意位置不超过SEARCH_SHORT_LENGTH个字符的子串 -> 词条，trigrams：三个字符 -> 词条，
+    descendants：节点id -> {下面所有节点的词条: 数量}，paramDescendants：节点id -> {下面所有method的params的key: 数量}，
+    用来判断一个节点下面有没有匹配的节点。
+    搜索只查词条，不展开成节点集合，匹配很多节点的查询也一样快；重命名只修改一个节点的词条，子节点的id不变
+    """
+    def __init__(self):
+        self.nodes = {ROOT: ["", "", None, {}]}
+        self.nextId = ROOT + 1
+        # 词条被多少个名字和params的key使用，为0时从短子串和三元组索引中删除
+        self.termCounts = collections.Counter()
+        self.descendants = collections.defaultdict(collections.Counter)
+        self.paramDescendants = collections.defaultdict(collections.Counter)
+        # method id -> params里的key
+        self.paramKeys = {}
+        self.shortGrams = collections.defaultdict(set)
+        self.trigrams = collections.defaultdict(set)
+
+    def __len__(self):
+        return len(self.nodes) - 1
+
+    @classmethod
+    def fromData(cls, data):
+        """
+        从Storage的数据树创建索引，method的params也加入索引
+        """
+        index = cls()
+        for project, projectDict in data.items():
+            index.add((project,))
+            for service, serviceDict in projectDict.items():
+                index.add((project, service))
+                for module, moduleDict in serviceDict.items():
+                    index.add((project, service, module))
+                    for method, methodDict in moduleDict.items():
+                        index.add((project, service, module, method), methodDict.get(const.PARAMS))
+        return index
+
+    def find(self, path):
+        """
+        路径对应的节点id，不存在时返回None
+        """
+        nodeId = ROOT
+        for name in path:
+            nodeId = self.nodes[nodeId][CHILDREN].get(name)
+            if nodeId is None:
+                return None
+        return nodeId
+
+    def ancestors(self, nodeId):
+        parentId = self.nodes[nodeId][PARENT]
+        while parentId != ROOT:
+            yield parentId
+            parentId = self.nodes[parentId][PARENT]
+
+    def add(self, path, params=None):
+        """
+        添加节点，父节点不存在时一起添加
+        """
+        nodeId = ROOT
+        for name in path:
+            children = self.nodes[nodeId][CHILDREN]
+            childId = children.get(name)
+            if childId is None:
+                childId = children[name] = self.nextId
+                self.nextId += 1
+                self.nodes[childId] = [name, name.lower(), nodeId, {}]
+                self._addTerm(childId, self.descendants, name.lower())
+            nodeId = childId
+        if params is not None and len(path) == METHOD_DEPTH:
+            self.setParams(path, params)
+        return nodeId
+
+    def rename(self, path, name):
+        nodeId = self.find(path)
+        if nodeId is None:
+            return
+        node = self.nodes[nodeId]
+        siblings = self.nodes[node[PARENT]][CHILDREN]
+        siblings[name] = siblings.pop(node[NAME])
+        self._removeTerm(nodeId, self.descendants, node[TERM])
+        node[NAME], node[TERM] = name, name.lower()
+        self._addTerm(nodeId, self.descendants, node[TERM])
+
+    def delete(self, path):
+        """
+        删除节点和它下面的所有节点
+        """
+        nodeId = self.find(path)
+        if nodeId is None:
+            return
+        ids = []
+        stack = [nodeId]
+        while stack:
+            current = stack.pop()
+            ids.append(current)
+            stack.extend(self.nodes[current][CHILDREN].values())
+        # 先删词条再删节点，删词条时还要用到祖先
+        for current in ids:
+            self._setParamKeys(current, set())
+            self._removeTerm(current, self.descendants, self.nodes[current][TERM])
+        node = self.nodes[nodeId]
+        del self.nodes[node[PARENT]][CHILDREN][node[NAME]]
+        for current in ids:
+            del self.nodes[current]
+            self.descendants.pop(current, None)
+            self.paramDescendants.pop(current, None)
+
+    def setParams(self, path, params):
+        nodeId = self.find(path)
+        if nodeId is not None:
+            self._setParamKeys(nodeId, set(iterKeys(params)))
+
+    def _setParamKeys(self, nodeId, keys):
+        old = self.paramKeys.pop(nodeId, set())
+        for key in old - keys:
+            self._removeTerm(nodeId, self.paramDescendants, key)
+        for key in keys - old:
+            self._addTerm(nodeId, self.paramDescendants, key)
+        if keys:
+            self.paramKeys[nodeId] = keys
+
+    def _addTerm(self, nodeId, descendants, term):
+        if not self.termCounts[term]:
+            for gram in getShortGrams(term):
+                self.shortGrams[gram].add(term)
+            for trigram in getTrigrams(term):
+                self.trigrams[trigram].add(term)
+        self.termCounts[term] += 1
+        for ancestorId in self.ancestors(nodeId):
+            descendants[ancestorId][term] += 1
+
+    def _removeTerm(self, nodeId, descendants, term):
+        for ancestorId in self.ancestors(nodeId):
+            counter = descendants[ancestorId]
+            counter[term] -= 1
+            if counter[term] <= 0:
+                del counter[term]
+        self.termCounts[term] -= 1
+        if self.termCounts[term] > 0:
+            return
+        # 没有节点使用的词条从短子串和三元组索引中删除
+        del self.termCounts[term]
+        for gram in getShortGrams(term):
+            self._discard(self.shortGrams, gram, term)
+        for trigram in getTrigrams(term):
+            self._discard(self.trigrams, trigram, term)
+
+    @staticmethod
+    def _discard(index, key, term):
+        terms = index.get(key)
+        if terms is not None:
+            terms.discard(term)
+            if not terms:
+                del index[key]
+
+    def matchTerms(self, token):
+        """
+        token匹配词条中的任意位置，和长度无关：例如or匹配get_order。
+        短于3个字符的token直接查短子串索引，更长的token用三元组找候选词条
+        """
+        if len(token) < 3:
+            return self.shortGrams.get(token, set())
+        sets = sorted((self.trigrams.get(trigram, set()) for trigram in getTrigrams(token)), key=len)
+        candidates = sets[0].intersection(*sets[1:])
+        if len(token) == 3:
+            return candidates
+        return {term for term in candidates if token in term}
+
+    def search(self, text, withParams=False):
+        """
+        空格分隔的每个token都要匹配一个method路径上的某个名字（或者params的key），不区分大小写
+        """
+        tokens = list(dict.fromkeys(text.lower().split()))
+        return SearchResult(self, tokens, [self.matchTerms(token) for token in tokens], withParams)
+
+
+class SearchResult(object):
+    """
+    一次搜索的结果，只保存每个token匹配的词条，树展开时逐层过滤，不需要一次算出所有匹配的method。
+    remaining是路径上还没有匹配的token下标，为空时整个子树都显示
+    """
+    def __init__(self, index, tokens, terms, withParams):
+        self.index = index
+        self.tokens = tokens
+        self.terms = terms
+        self.withParams = withParams
+
+    def rootRemaining(self):
+        return tuple(range(len(self.tokens)))
+
+    def filterChildren(self, path, remaining, names):
+        """
+        返回path下显示的子节点[(名字, remaining)]：子节点自己匹配的token去掉，
+        剩下的token都要在子节点下面有匹配
+        """
+        if not remaining:
+            return [(name, ()) for name in names]
+        parentId = self.index.find(path)
+        if parentId is None:
+            return []
+        children = self.index.nodes[parentId][CHILDREN]
+        visible = []
+        for name in names:
+            childId = children.get(name)
+            if childId is None:
+                continue
+            left = self._left(childId, remaining)
+            if self._hasMatch(childId, left):
+                visible.append((name, left))
+        return visible
+
+    def _left(self, nodeId, remaining):
+        """
+        节点自己的名字（或者params的key）没有匹配的token
+        """
+        term = self.index.nodes[nodeId][TERM]
+        keys = self.index.paramKeys.get(nodeId) if self.withParams else None
+        return tuple(
+            i for i in remaining
+            if term not in self.terms[i] and not (keys and intersects(self.terms[i], keys))
+        )
+
+    def _covers(self, nodeId, i):
+        """
+        节点下面有没有匹配第i个token的节点
+        """
+        descendants = self.index.descendants.get(nodeId)
+        if descendants and intersects(self.terms[i], descendants):
+            return True
+        if self.withParams:
+            descendants = self.index.paramDescendants.get(nodeId)
+            return bool(descendants) and intersects(self.terms[i], descendants)
+        return False
+
+    def _hasMatch(self, nodeId, left):
+        """
+        节点下面有没有一条路径匹配所有剩下的token。
+        只剩一个token时直接判断，剩多个时可能分别匹配在不同的路径上，需要向下找到一条同时匹配的路径
+        """
+        if not all(self._covers(nodeId, i) for i in left):
+            return False
+        if len(left) <= 1:
+            return True
+        for childId in self.index.nodes[nodeId][CHILDREN].values():
+            childLeft = self._left(childId, left)
+            if not childLeft or self._hasMatch(childId, childLeft):
+                return True
+        return False
+
+
+def intersects(terms, keys):
+    """
+    terms和keys有没有相同的元素，遍历较小的一个
+    """
+    if len(terms) < len(keys):
+        return any(term in keys for term in terms)
+    return any(key in terms for key in keys)
+
+
+def getTrigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def getShortGrams(term):
+    """
+    词条中所有1到SEARCH_SHORT_LENGTH个字符的子串
+    """
+    return {
+        term[i:i + length] for length in range(1, const.SEARCH_SHORT_LENGTH + 1) for i in range(len(term) - length + 1)
+    }
+
+
+def iterKeys(params, depth=0):
+    """
+    params里所有dict的key，包括嵌套的，最多SEARCH_PARAM_KEY_DEPTH层
+    """
+    if depth >= const.SEARCH_PARAM_KEY_DEPTH:
+        return
+    if isinstance(params, dict):
+        for key, value in params.items():
+            yield str(key).lower()
+            yield from iterKeys(value, depth + 1)
+    elif isinstance(params, list):
+        for value in params:
+            yield from iterKeys(value, depth + 1)
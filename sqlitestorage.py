@@ -0,0 +1,472 @@
+# -*- coding:utf-8 -*-
+
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+import collections
+import utils
+import constants as const
+from storage import Storage, NODE_COLUMNS
+from blobstore import BlobStore, getBlobRoot
+from history import LatencyHistory
+from searchindex import SearchIndex
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    project TEXT NOT NULL,
+    service TEXT NOT NULL DEFAULT '',
+    module TEXT NOT NULL DEFAULT '',
+    method TEXT NOT NULL DEFAULT '',
+    params TEXT,
+    result TEXT,
+    result_ref TEXT,
+    load_tests TEXT,
+    latency_history TEXT,
+    result_history TEXT,
+    PRIMARY KEY (project, service, module, method)
+)
+"""
+# method行除了名字以外的列，顺序和getData返回的method字典的key相同
+METHOD_COLUMNS = (
+    const.PARAMS, const.RESULT, const.RESULT_REF, const.RESULT_HISTORY, const.LOAD_TESTS, const.LATENCY_HISTORY
+)
+
+
+class SqliteStorage(object):
+    """
+    SQLite数据存储类，接口与Storage相同
+    每个project，service，module，method各占一行，空字符串表示该层级不存在，
+    例如service行为(project, service, '', '')。params和result单独存列，用到时才读取，
+    重命名是一条走主键索引的UPDATE。
+    新结果存在BlobStore中，result_ref列保存引用，result列只用于旧数据
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(nodes)")]
+        for column in (const.RESULT_REF, const.LOAD_TESTS, const.LATENCY_HISTORY, const.RESULT_HISTORY):
+            if column not in columns:
+                self.conn.execute("ALTER TABLE nodes ADD COLUMN {} TEXT".format(column))
+        self.conn.commit()
+        self.blobs = BlobStore(getBlobRoot(path))
+        # 第一次搜索时才创建，之后随修改增量更新
+        self.searchIndex = None
+
+        # 统计信息
+        self.writes = 0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self.totalLatency = 0.0
+
+    def _query(self, sql, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def _exists(self, project, service="", module="", method=""):
+        """
+        节点是否存在，空字符串表示匹配该层级下的任意节点
+        """
+        sql, args = "SELECT 1 FROM nodes WHERE project=?", [project]
+        for column, value in (("service", service), ("module", module), ("method", method)):
+            if value:
+                sql += " AND {}=?".format(column)
+                args.append(value)
+        return bool(self._query(sql + " LIMIT 1", args))
+
+    def _execute(self, sql, args=()):
+        start = time.time()
+        with self.lock:
+            cursor = self.conn.execute(sql, args)
+            self.conn.commit()
+        latency = time.time() - start
+        self.writes += 1
+        self.lastLatency = latency
+        self.maxLatency = max(self.maxLatency, latency)
+        self.totalLatency += latency
+        return cursor.rowcount
+
+    def loadData(self, readOnly=False):
+        """
+        数据都按需从数据库读取，不需要预先加载；和Storage.loadData一样返回整棵数据树，
+        数据库不会被修改，readOnly只是为了接口相同
+        """
+        return self.getData()
+
+    def save(self):
+        pass
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+        logging.info("Storage writer stats: {}".format(self.getWriteStats()))
+
+    def getWriteStats(self):
+        return {
+            "requests": self.writes,
+            "writes": self.writes,
+            "coalesced": 0,
+            "last_latency": self.lastLatency,
+            "max_latency": self.maxLatency,
+            "avg_latency": self.totalLatency / self.writes if self.writes else 0.0,
+        }
+
+    def getData(self):
+        """
+        和Storage的数据树相同：method下是params，结果的引用，历史结果的引用，压测结果和延迟记录
+        """
+        data = collections.OrderedDict()
+        rows = self._query(
+            "SELECT project, service, module, method, {} FROM nodes ORDER BY rowid".format(", ".join(METHOD_COLUMNS))
+        )
+        for row in rows:
+            node = data.setdefault(row[0], dict())
+            for name in row[1:len(NODE_COLUMNS)]:
+                if not name:
+                    break
+                node = node.setdefault(name, dict())
+            if row[len(NODE_COLUMNS) - 1]:
+                node.update(self._methodDict(row[len(NODE_COLUMNS):]))
+        return data
+
+    def _methodDict(self, values):
+        methodDict = {const.PARAMS: json.loads(values[0] or "{}")}
+        for column, value in zip(METHOD_COLUMNS[1:], values[1:]):
+            if value is not None:
+                methodDict[column] = value if column == const.LATENCY_HISTORY else json.loads(value)
+        # 和Storage相同，有结果的引用时没有result，否则是旧数据的结果或者空的result
+        if const.RESULT_REF in methodDict:
+            methodDict.pop(const.RESULT, None)
+        else:
+            methodDict.setdefault(const.RESULT, dict())
+        return methodDict
+
+    def listChildren(self, *path):
+        """
+        返回path下一级节点的名字，path为空时返回所有project，method没有子节点
+        """
+        depth = len(path)
+        if depth >= len(NODE_COLUMNS):
+            return []
+        child = NODE_COLUMNS[depth]
+        conditions = ["{}=?".format(column) for column in NODE_COLUMNS[:depth]]
+        conditions.append("{}!=''".format(child))
+        if depth + 1 < len(NODE_COLUMNS):
+            conditions.append("{}=''".format(NODE_COLUMNS[depth + 1]))
+        rows = self._query(
+            "SELECT {} FROM nodes WHERE {} ORDER BY rowid".format(child, " AND ".join(conditions)), path
+        )
+        return [row[0] for row in rows]
+
+    def loggingData(self):
+        logging.info("Storage data: {}".format(utils.objectToJsonStr(self.getData())))
+
+    def updateProjectName(self, old, new):
+        if old != new:
+            if self._exists(new):
+                return False
+            self._execute("UPDATE nodes SET project=? WHERE project=?", (new, old))
+            self._updateSearchIndex("rename", (old,), new)
+        return True
+
+    def updateServiceName(self, project, old, new):
+        if old != new:
+            if self._exists(project, new) or not self._exists(project, old):
+                return False
+            self._execute("UPDATE nodes SET service=? WHERE project=? AND service=?", (new, project, old))
+            self._updateSearchIndex("rename", (project, old), new)
+        return True
+
+    def updateModuleName(self, project, service, old, new):
+        if old != new:
+            if self._exists(project, service, new) or not self._exists(project, service, old):
+                return False
+            self._execute(
+                "UPDATE nodes SET module=? WHERE project=? AND service=? AND module=?",
+                (new, project, service, old)
+            )
+            self._updateSearchIndex("rename", (project, service, old), new)
+        return True
+
+    def updateMethodName(self, project, service, module, old, new):
+        if old != new:
+            if self._exists(project, service, module, new) or not self._exists(project, service, module, old):
+                return False
+            self._execute(
+                "UPDATE nodes SET method=? WHERE project=? AND service=? AND module=? AND method=?",
+                (new, project, service, module, old)
+            )
+            self._updateSearchIndex("rename", (project, service, module, old), new)
+        return True
+
+    def _has_method(self, project, service, module, method):
+        return bool(method) and self._exists(project, service, module, method)
+
+    def updateParams(self, project, service, module, method, params):
+        self._updateSearchIndex("setParams", (project, service, module, method), params)
+        self._execute(
+            "UPDATE nodes SET params=? WHERE project=? AND service=? AND module=? AND method=?",
+            (
+                utils.objectToCompactJsonStr(params if isinstance(params, dict) else dict()),
+                project, service, module, method
+            )
+        )
+
+    def updateResut(self, project, service, module, method, result):
+        if isinstance(result, list) or isinstance(result, dict):
+            self.updateResultRef(project, service, module, method, self.blobs.put(result))
+
+    def storeResultText(self, text):
+        """
+        保存格式化好的结果文本，返回引用，可以在非ui线程中调用
+        """
+        return self.blobs.putText(text)
+
+    def updateResultRef(self, project, service, module, method, ref):
+        """
+        之前的结果引用移到result_history，只保留最近RESULT_HISTORY_SIZE个
+        """
+        with self.lock:
+            refs = self.getResultHistory(project, service, module, method)
+            previous = self.getResultRef(project, service, module, method)
+            if previous and previous[const.BLOB_REF] != ref[const.BLOB_REF]:
+                refs.append(previous)
+            self._execute(
+                "UPDATE nodes SET result=NULL, result_ref=?, result_history=? "
+                "WHERE project=? AND service=? AND module=? AND method=?",
+                (
+                    utils.objectToCompactJsonStr(ref),
+                    utils.objectToCompactJsonStr(refs[-const.RESULT_HISTORY_SIZE:]) if refs else None,
+                    project, service, module, method
+                )
+            )
+
+    def getResultHistory(self, project, service, module, method):
+        """
+        之前保存的结果的引用，从旧到新，不包括当前的结果
+        """
+        return list(self._getColumn(const.RESULT_HISTORY, project, service, module, method) or [])
+
+    def getLiveRefs(self) -> set:
+        """
+        所有method当前的结果和历史结果引用的sha256
+        """
+        refs = set()
+        rows = self._query("SELECT result_ref, result_history FROM nodes WHERE method!=''")
+        for ref, history in rows:
+            if ref:
+                refs.add(json.loads(ref)[const.BLOB_REF])
+            if history:
+                refs.update(item[const.BLOB_REF] for item in json.loads(history))
+        return refs
+
+    def loadResult(self, ref):
+        """
+        按引用读取保存的结果，可以在非ui线程中调用
+        """
+        return self.blobs.get(ref[const.BLOB_REF])
+
+    def addLoadTestResult(self, project, service, module, method, summary):
+        """
+        保存一次压测结果，每个method只保留最近LOAD_TEST_HISTORY_SIZE次
+        """
+        with self.lock:
+            runs = self.getLoadTestResults(project, service, module, method)
+            runs.append(summary)
+            self._execute(
+                "UPDATE nodes SET load_tests=? WHERE project=? AND service=? AND module=? AND method=?",
+                (
+                    utils.objectToCompactJsonStr(runs[-const.LOAD_TEST_HISTORY_SIZE:]),
+                    project, service, module, method
+                )
+            )
+
+    def getLoadTestResults(self, project, service, module, method):
+        return list(self._getColumn(const.LOAD_TESTS, project, service, module, method) or [])
+
+    def addLatencySample(self, project, service, module, method, sample):
+        """
+        记录一次调用：[时间, 延迟, 结果大小, 是否成功]
+        """
+        with self.lock:
+            history = self.getLatencyHistory(project, service, module, method)
+            history.append(*sample)
+            self._execute(
+                "UPDATE nodes SET latency_history=? WHERE project=? AND service=? AND module=? AND method=?",
+                (history.toText(), project, service, module, method)
+            )
+
+    def getLatencyHistory(self, project, service, module, method) -> LatencyHistory:
+        try:
+            rows = self._query(
+                "SELECT latency_history FROM nodes WHERE project=? AND service=? AND module=? AND method=?",
+                (project, service, module, method)
+            )
+            return LatencyHistory.fromText(rows[0][0] if rows else None)
+        except Exception as e:
+            logging.exception(e)
+            return LatencyHistory()
+
+    def _insert(self, project, service="", module="", method="", params=None):
+        try:
+            self._execute(
+                "INSERT INTO nodes (project, service, module, method, params) VALUES (?, ?, ?, ?, ?)",
+                (project, service, module, method, params)
+            )
+        except sqlite3.IntegrityError:
+            return False
+        path = tuple(name for name in (project, service, module, method) if name)
+        self._updateSearchIndex("add", path, json.loads(params) if method and params else None)
+        return True
+
+    def addProject(self, project):
+        return self._insert(project)
+
+    def addService(self, project, service):
+        return self._insert(project, service)
+
+    def addModule(self, project, service, module):
+        return self._insert(project, service, module)
+
+    def addMethod(self, project, service, module, method, params):
+        return self._insert(project, service, module, method, utils.objectToCompactJsonStr(params or dict()))
+
+    def deleteMethod(self, project, service, module, method):
+        if method:
+            self._execute(
+                "DELETE FROM nodes WHERE project=? AND service=? AND module=? AND method=?",
+                (project, service, module, method)
+            )
+            self._updateSearchIndex("delete", (project, service, module, method))
+
+    def _updateSearchIndex(self, action, *args):
+        """
+        索引已经创建时跟着修改，action是SearchIndex的方法名
+        """
+        with self.lock:
+            if self.searchIndex is not None:
+                getattr(self.searchIndex, action)(*args)
+
+    def getSearchIndex(self) -> SearchIndex:
+        """
+        名字和params的key的搜索索引，第一次调用时创建
+        """
+        with self.lock:
+            if self.searchIndex is None:
+                index = SearchIndex()
+                rows = self._query("SELECT project, service, module, method, params FROM nodes ORDER BY rowid")
+                for project, service, module, method, params in rows:
+                    path = (project, service, module, method)
+                    path = path[:path.index("")] if "" in path else path
+                    index.add(path, json.loads(params) if method and params else None)
+                self.searchIndex = index
+            return self.searchIndex
+
+    def _getColumn(self, column, project, service, module, method):
+        try:
+            rows = self._query(
+                "SELECT {} FROM nodes WHERE project=? AND service=? AND module=? AND method=?".format(column),
+                (project, service, module, method)
+            )
+            return json.loads(rows[0][0] or "{}")
+        except Exception as e:
+            logging.exception(e)
+            return collections.OrderedDict()
+
+    def getParam(self, project, service, module, method):
+        return self._getColumn(const.PARAMS, project, service, module, method)
+
+    def getResultRef(self, project, service, module, method):
+        """
+        结果的引用，没有保存过结果时返回None
+        """
+        return self._getColumn(const.RESULT_REF, project, service, module, method) or None
+
+    def getResultText(self, project, service, module, method):
+        ref = self.getResultRef(project, service, module, method)
+        if ref:
+            try:
+                return self.blobs.getText(ref[const.BLOB_REF])
+            except Exception as e:
+                logging.exception(e)
+        return utils.objectToJsonStr(self.getResult(project, service, module, method))
+
+    def getResult(self, project, service, module, method):
+        ref = self.getResultRef(project, service, module, method)
+        if ref:
+            try:
+                return self.blobs.get(ref[const.BLOB_REF])
+            except Exception as e:
+                logging.exception(e)
+                return collections.OrderedDict()
+        return self._getColumn(const.RESULT, project, service, module, method)
+
+
+def migrateFromJson(jsonPath, dbPath):
+    """
+    把namekoman.json（包括未合并的操作日志）导入SQLite数据库，返回导入的method数。
+    源数据只读取，namekoman.json，操作日志和已有的结果文件都不会被修改；
+    旧版本保存在数据树里的结果直接写进数据库的结果目录
+    """
+    source = Storage(jsonPath)
+    data = source.loadData(readOnly=True)
+    source.close()
+    target = SqliteStorage(dbPath)
+
+    rows = []
+    for project, projectDict in data.items():
+        rows.append((project, "", "", "", None, None, None, None, None))
+        for service, serviceDict in projectDict.items():
+            rows.append((project, service, "", "", None, None, None, None, None))
+            for module, moduleDict in serviceDict.items():
+                rows.append((project, service, module, "", None, None, None, None, None))
+                for method, methodDict in moduleDict.items():
+                    ref = methodDict.get(const.RESULT_REF)
+                    refs = methodDict.get(const.RESULT_HISTORY, [])
+                    for blob in ([ref] if ref else []) + refs:
+                        if not target.blobs.has(blob[const.BLOB_REF]):
+                            target.blobs.putText(source.blobs.getText(blob[const.BLOB_REF]))
+                    if methodDict.get(const.RESULT):
+                        ref = target.blobs.put(methodDict[const.RESULT])
+                    rows.append((
+                        project, service, module, method,
+                        utils.objectToCompactJsonStr(methodDict.get(const.PARAMS, dict())),
+                        utils.objectToCompactJsonStr(ref) if ref else None,
+                        utils.objectToCompactJsonStr(methodDict[const.LOAD_TESTS])
+                        if const.LOAD_TESTS in methodDict else None,
+                        methodDict.get(const.LATENCY_HISTORY),
+                        utils.objectToCompactJsonStr(refs) if refs else None,
+                    ))
+
+    with target.lock:
+        target.conn.executemany(
+            "INSERT OR REPLACE INTO nodes "
+            "(project, service, module, method, params, result_ref, load_tests, latency_history, result_history) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        target.conn.commit()
+    target.close()
+    return sum(1 for row in rows if row[3])
+
+
+if __name__ == "__main__":
+    # 用法：python sqlitestorage.py namekoman.json namekoman.db
+    if len(sys.argv) != 3:
+        print("Usage: python sqlitestorage.py <namekoman.json> <namekoman.db>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    count = migrateFromJson(sys.argv[1], sys.argv[2])
+    print("Migrated {} methods from {} to {}".format(count, sys.argv[1], sys.argv[2]))
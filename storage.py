@@ -1,36 +1,384 @@
 # -*- coding:utf-8 -*-
 
+import os
 import json
+import time
 import logging
+import threading
 import collections
 import utils
 import constants as const
+from blobstore import BlobStore, getBlobRoot
+from history import LatencyHistory
+from searchindex import SearchIndex
+
+
+NODE_COLUMNS = (const.NODE_PROJECT, const.NODE_SERVICE, const.NODE_MODULE, const.NODE_METHOD)
+
+
+class StorageWriter(threading.Thread):
+    """
+    后台写线程，修改只标记dirty，防抖窗口内的多次修改合并成一次写入，不阻塞ui线程
+    """
+    def __init__(self, storage, delay=const.WRITE_DEBOUNCE):
+        super().__init__(name="StorageWriter", daemon=True)
+        self.storage = storage
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.writeLock = threading.Lock()
+        self.dirty = False
+        self.stopped = False
+
+        # 统计信息
+        self.requests = 0
+        self.writes = 0
+        self.lastLatency = 0.0
+        self.maxLatency = 0.0
+        self.totalLatency = 0.0
+
+    def markDirty(self):
+        with self.condition:
+            self.dirty = True
+            self.requests += 1
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.dirty or self.stopped)
+                if self.stopped:
+                    return
+                # 等待防抖窗口结束，窗口内的修改一起写入，退出时提前唤醒
+                self.condition.wait_for(lambda: self.stopped, timeout=self.delay)
+            self.flush()
+
+    def flush(self):
+        with self.writeLock:
+            with self.condition:
+                if not self.dirty:
+                    return
+                self.dirty = False
+            start = time.time()
+            try:
+                self.storage._write()
+            except Exception as e:
+                logging.exception(e)
+            latency = time.time() - start
+            self.writes += 1
+            self.lastLatency = latency
+            self.maxLatency = max(self.maxLatency, latency)
+            self.totalLatency += latency
+            logging.debug("Storage write: {}".format(self.getStats()))
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
+        self.flush()
+
+    def getStats(self):
+        return {
+            "requests": self.requests,
+            "writes": self.writes,
+            "coalesced": self.requests - self.writes,
+            "last_latency": self.lastLatency,
+            "max_latency": self.maxLatency,
+            "avg_latency": self.totalLatency / self.writes if self.writes else 0.0,
+        }
 
 
 class Storage(object):
     """
     数据存储类
+    修改不再重写整个namekoman.json，而是向namekoman.json.journal追加一条操作记录，
+    记录数达到阈值后合并（compact）进namekoman.json，启动时先读namekoman.json再重放操作日志。
+    写文件都在后台线程StorageWriter里完成，退出前需调用flush或close。
+    结果不放在数据树里，而是存在BlobStore中，数据树里的method只保存结果的引用
     """
     def __init__(self, path):
         self.path = path
+        self.journalPath = path + const.JOURNAL_SUFFIX
+        self.compactedPath = self.journalPath + const.JOURNAL_COMPACTED_SUFFIX
+        self.tmpPath = path + ".tmp"
+        self.journalSize = 0
         self.data = collections.OrderedDict()
+        self.lock = threading.RLock()
+        self.pending = []
+        # 每次修改数据加1，合并时用来判断锁外序列化期间数据是否被修改
+        self.version = 0
+        self.compactRequested = False
+        self.blobs = BlobStore(getBlobRoot(path))
+        # 第一次搜索时才创建，之后随修改增量更新
+        self.searchIndex = None
+        self.writer = StorageWriter(self)
+        self.writer.start()
 
-    def loadData(self):
-        try:
-            with open(self.path, encoding="utf-8") as f:
-                self.data = collections.OrderedDict(json.loads(f.read()))
-                # return collections.OrderedDict(json.loads(f.read(), object_hook=collections.OrderedDict))
-        except Exception as e:
-            logging.exception(e)
+    def loadData(self, readOnly=False):
+        """
+        读取namekoman.json并重放操作日志。readOnly时只读取，不移动旧版本的结果，也不合并，
+        不修改namekoman.json，操作日志和结果目录，例如迁移时读取源数据
+        """
+        with self.lock:
+            try:
+                with open(self._recoverCompaction(readOnly), encoding="utf-8") as f:
+                    self.data = collections.OrderedDict(json.loads(f.read()))
+                    # return collections.OrderedDict(json.loads(f.read(), object_hook=collections.OrderedDict))
+            except Exception as e:
+                logging.exception(e)
+            intact = self._replayJournal()
+            moved = 0 if readOnly else self._externalizeResults()
+            self.version += 1
+            self.searchIndex = None
+        if readOnly:
+            return self.data
+        if not intact:
+            # 日志末尾可能是写了一半的记录，立即合并，避免后续记录追加在坏行后面
+            self.save()
+            self.flush()
+        elif moved:
+            self.save()
         return self.data
 
+    def _recoverCompaction(self, readOnly):
+        """
+        处理合并中途退出留下的文件，返回要读取的namekoman.json。
+        合并的顺序是：写完临时文件，把操作日志改名，替换namekoman.json，删除改名的操作日志。
+        改名的操作日志存在时，它的记录都已经在临时文件或者新的namekoman.json里，不能再重放；
+        临时文件还在说明没有替换，继续替换。没有改名的操作日志时临时文件是写了一半的，丢弃。
+        readOnly时不修改文件，直接读取临时文件
+        """
+        if not os.path.exists(self.compactedPath):
+            if not readOnly and os.path.exists(self.tmpPath):
+                os.remove(self.tmpPath)
+            return self.path
+        if readOnly:
+            return self.tmpPath if os.path.exists(self.tmpPath) else self.path
+        if os.path.exists(self.tmpPath):
+            os.replace(self.tmpPath, self.path)
+        os.remove(self.compactedPath)
+        return self.path
+
+    def _externalizeResults(self):
+        """
+        把旧版本保存在数据树里的结果移到BlobStore，返回移动的结果数
+        """
+        moved = 0
+        for projectDict in self.data.values():
+            for serviceDict in projectDict.values():
+                for moduleDict in serviceDict.values():
+                    for methodDict in moduleDict.values():
+                        if methodDict.get(const.RESULT):
+                            methodDict[const.RESULT_REF] = self.blobs.put(methodDict.pop(const.RESULT))
+                            moved += 1
+        return moved
+
+    def _replayJournal(self):
+        """
+        重放操作日志，返回日志是否完好
+        """
+        self.journalSize = 0
+        if not os.path.exists(self.journalPath):
+            return True
+        ok = True
+        with open(self.journalPath, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._apply(json.loads(line))
+                    self.journalSize += 1
+                except Exception as e:
+                    logging.exception(e)
+                    ok = False
+        return ok
+
+    def _apply(self, record):
+        """
+        在内存数据上执行一条操作记录，path是从project到目标节点的名字列表
+        """
+        op, path, value = record[const.JOURNAL_OP], record[const.JOURNAL_PATH], record.get(const.JOURNAL_VALUE)
+        parent = self.data
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if op == const.JOURNAL_OP_ADD:
+            parent[key] = value
+        elif op == const.JOURNAL_OP_RENAME:
+            parent[value] = parent.pop(key)
+        elif op == const.JOURNAL_OP_DELETE:
+            del parent[key]
+        elif op == const.JOURNAL_OP_PARAMS:
+            parent[key][const.PARAMS] = value
+        elif op == const.JOURNAL_OP_RESULT_REF:
+            previous = parent[key].get(const.RESULT_REF)
+            if previous and previous[const.BLOB_REF] != value[const.BLOB_REF]:
+                refs = parent[key].setdefault(const.RESULT_HISTORY, [])
+                refs.append(previous)
+                del refs[:-const.RESULT_HISTORY_SIZE]
+            parent[key][const.RESULT_REF] = value
+            parent[key].pop(const.RESULT, None)
+        elif op == const.JOURNAL_OP_LATENCY:
+            history = LatencyHistory.fromText(parent[key].get(const.LATENCY_HISTORY))
+            history.append(*value)
+            parent[key][const.LATENCY_HISTORY] = history.toText()
+        elif op == const.JOURNAL_OP_LOAD_TEST:
+            runs = parent[key].setdefault(const.LOAD_TESTS, [])
+            runs.append(value)
+            del runs[:-const.LOAD_TEST_HISTORY_SIZE]
+        elif op == const.JOURNAL_OP_RESULT:
+            # 旧版本的操作日志，结果直接保存在记录里
+            parent[key][const.RESULT] = value
+            parent[key].pop(const.RESULT_REF, None)
+        else:
+            raise ValueError("Unknown journal op: {}".format(op))
+
+    def _commit(self, op, path, value=None):
+        """
+        修改内存数据并把操作记录交给后台写线程，修改失败时抛出异常，不会写日志
+        """
+        record = {const.JOURNAL_OP: op, const.JOURNAL_PATH: path, const.JOURNAL_VALUE: value}
+        with self.lock:
+            self._apply(record)
+            self.version += 1
+            self.pending.append(utils.objectToCompactJsonStr(record))
+            if self.searchIndex is not None:
+                self._updateSearchIndex(op, path, value)
+        self.writer.markDirty()
+
+    def _updateSearchIndex(self, op, path, value):
+        if op == const.JOURNAL_OP_ADD:
+            self.searchIndex.add(path, value.get(const.PARAMS) if len(path) == len(NODE_COLUMNS) else None)
+        elif op == const.JOURNAL_OP_RENAME:
+            self.searchIndex.rename(path, value)
+        elif op == const.JOURNAL_OP_DELETE:
+            self.searchIndex.delete(path)
+        elif op == const.JOURNAL_OP_PARAMS:
+            self.searchIndex.setParams(path, value)
+
+    def getSearchIndex(self) -> SearchIndex:
+        """
+        名字和params的key的搜索索引，第一次调用时创建
+        """
+        with self.lock:
+            if self.searchIndex is None:
+                self.searchIndex = SearchIndex.fromData(self.data)
+            return self.searchIndex
+
+    def _write(self):
+        """
+        在写线程中执行：追加待写的操作记录，或者合并成新的namekoman.json。
+        合并时先写临时文件再原子替换，中途退出不会留下半个namekoman.json；
+        替换前把操作日志改名，中途退出时已经合并的记录不会被重放，见_recoverCompaction
+        """
+        with self.lock:
+            records, self.pending = self.pending, []
+            compact = self.compactRequested or self.journalSize + len(records) >= const.JOURNAL_COMPACT_THRESHOLD
+            self.compactRequested = False
+
+        if compact:
+            with open(self.tmpPath, "w", encoding="utf-8") as f:
+                f.write(self._snapshot())
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.journalPath):
+                os.replace(self.journalPath, self.compactedPath)
+            os.replace(self.tmpPath, self.path)
+            if os.path.exists(self.compactedPath):
+                os.remove(self.compactedPath)
+            self.journalSize = 0
+            try:
+                collectGarbage(self)
+            except Exception as e:
+                logging.exception(e)
+        elif records:
+            with open(self.journalPath, "a", encoding="utf-8") as f:
+                f.write("\n".join(records) + "\n")
+            self.journalSize += len(records)
+
+    def _snapshot(self) -> str:
+        """
+        序列化完整数据。锁内只记下版本号，在锁外序列化，不阻塞ui线程的修改；
+        之后版本号没有变化说明序列化期间数据没有被修改，结果是一致的，否则重新序列化。
+        已经包含在数据里的待写记录不再追加到操作日志
+        """
+        for _ in range(const.JOURNAL_COMPACT_RETRIES):
+            with self.lock:
+                self.pending = []
+                version = self.version
+            try:
+                snapshot = utils.objectToJsonStr(self.data)
+            except RuntimeError:
+                # 序列化期间dict的大小变化
+                continue
+            with self.lock:
+                if version == self.version:
+                    return snapshot
+        with self.lock:
+            self.pending = []
+            return utils.objectToJsonStr(self.data)
+
+    def getLiveRefs(self) -> set:
+        """
+        所有method当前的结果和历史结果引用的sha256。和_snapshot一样在锁外遍历，数据被修改时重新遍历
+        """
+        for _ in range(const.JOURNAL_COMPACT_RETRIES):
+            with self.lock:
+                version = self.version
+            try:
+                refs = getTreeRefs(self.data)
+            except RuntimeError:
+                continue
+            with self.lock:
+                if version == self.version:
+                    return refs
+        with self.lock:
+            return getTreeRefs(self.data)
+
     def save(self):
-        with open(self.path, "w", encoding="utf-8") as f:
-            f.write(utils.objectToJsonStr(self.data))
+        """
+        请求合并：由写线程把完整数据写回namekoman.json，然后清空操作日志
+        """
+        with self.lock:
+            self.compactRequested = True
+        self.writer.markDirty()
+
+    def flush(self):
+        """
+        立即写入所有待写修改
+        """
+        self.writer.flush()
+
+    def close(self):
+        """
+        退出前调用，停止写线程并写入所有待写修改
+        """
+        self.writer.stop()
+        logging.info("Storage writer stats: {}".format(self.getWriteStats()))
+
+    def getWriteStats(self):
+        """
+        写入统计：修改次数，实际写入次数，合并省掉的写入次数，写入耗时
+        """
+        return self.writer.getStats()
 
     def getData(self):
         return self.data
 
+    def listChildren(self, *path):
+        """
+        返回path下一级节点的名字，path为空时返回所有project，method没有子节点
+        """
+        node = self.data
+        try:
+            for key in path:
+                node = node[key]
+        except KeyError:
+            return []
+        return list(node.keys()) if len(path) < len(NODE_COLUMNS) else []
+
     def loggingData(self):
         logging.info("Storage data: {}".format(utils.objectToJsonStr(self.getData())))
 
@@ -39,9 +387,7 @@ class Storage(object):
             if new in self.data:
                 return False
             if old in self.data:
-                self.data[new] = self.data[old]
-                del self.data[old]
-                self.save()
+                self._commit(const.JOURNAL_OP_RENAME, [old], new)
         return True
 
     def updateServiceName(self, project, old, new):
@@ -49,9 +395,7 @@ class Storage(object):
             try:
                 if new in self.data[project]:
                     return False
-                self.data[project][new] = self.data[project][old]
-                del self.data[project][old]
-                self.save()
+                self._commit(const.JOURNAL_OP_RENAME, [project, old], new)
             except Exception as e:
                 logging.exception(e)
                 return False
@@ -62,9 +406,7 @@ class Storage(object):
             try:
                 if new in self.data[project][service]:
                     return False
-                self.data[project][service][new] = self.data[project][service][old]
-                del self.data[project][service][old]
-                self.save()
+                self._commit(const.JOURNAL_OP_RENAME, [project, service, old], new)
             except Exception as e:
                 logging.exception(e)
                 return False
@@ -75,9 +417,7 @@ class Storage(object):
             try:
                 if new in self.data[project][service][module]:
                     return False
-                self.data[project][service][module][new] = self.data[project][service][module][old]
-                del self.data[project][service][module][old]
-                self.save()
+                self._commit(const.JOURNAL_OP_RENAME, [project, service, module, old], new)
             except Exception as e:
                 logging.exception(e)
                 return False
@@ -93,35 +433,81 @@ class Storage(object):
 
     def updateParams(self, project, service, module, method, params):
         if self._has_method(project, service, module, method):
-            self.data[project][service][module][method][const.PARAMS] = params if isinstance(params, dict) else dict()
-            # self.data[service][module][method][CONST_RESULT] = result if isinstance(result, dict) else dict()
-            self.save()
+            self._commit(
+                const.JOURNAL_OP_PARAMS,
+                [project, service, module, method],
+                params if isinstance(params, dict) else dict()
+            )
 
     def updateResut(self, project, service, module, method, result):
         if self._has_method(project, service, module, method):
             if isinstance(result, list) or isinstance(result, dict):
-                self.data[project][service][module][method][const.RESULT] = result
-                self.save()
+                self.updateResultRef(project, service, module, method, self.blobs.put(result))
+
+    def storeResultText(self, text):
+        """
+        保存格式化好的结果文本，返回引用，可以在非ui线程中调用
+        """
+        return self.blobs.putText(text)
+
+    def updateResultRef(self, project, service, module, method, ref):
+        if self._has_method(project, service, module, method):
+            self._commit(const.JOURNAL_OP_RESULT_REF, [project, service, module, method], ref)
+
+    def getResultHistory(self, project, service, module, method):
+        """
+        之前保存的结果的引用，从旧到新，最多RESULT_HISTORY_SIZE个，不包括当前的结果
+        """
+        if self._has_method(project, service, module, method):
+            return list(self.data[project][service][module][method].get(const.RESULT_HISTORY, []))
+        return []
+
+    def loadResult(self, ref):
+        """
+        按引用读取保存的结果，可以在非ui线程中调用
+        """
+        return self.blobs.get(ref[const.BLOB_REF])
+
+    def addLoadTestResult(self, project, service, module, method, summary):
+        """
+        保存一次压测结果，每个method只保留最近LOAD_TEST_HISTORY_SIZE次
+        """
+        if self._has_method(project, service, module, method):
+            self._commit(const.JOURNAL_OP_LOAD_TEST, [project, service, module, method], summary)
+
+    def getLoadTestResults(self, project, service, module, method):
+        if self._has_method(project, service, module, method):
+            return list(self.data[project][service][module][method].get(const.LOAD_TESTS, []))
+        return []
+
+    def addLatencySample(self, project, service, module, method, sample):
+        """
+        记录一次调用：[时间, 延迟, 结果大小, 是否成功]，操作日志里只有这一条记录
+        """
+        if self._has_method(project, service, module, method):
+            self._commit(const.JOURNAL_OP_LATENCY, [project, service, module, method], list(sample))
+
+    def getLatencyHistory(self, project, service, module, method) -> LatencyHistory:
+        if self._has_method(project, service, module, method):
+            return LatencyHistory.fromText(self.data[project][service][module][method].get(const.LATENCY_HISTORY))
+        return LatencyHistory()
 
     def addProject(self, project):
         if project in self.data:
             return False
-        self.data[project] = dict()
-        self.save()
+        self._commit(const.JOURNAL_OP_ADD, [project], dict())
         return True
 
     def addService(self, project, service):
         if service in self.data[project]:
             return False
-        self.data[project][service] = dict()
-        self.save()
+        self._commit(const.JOURNAL_OP_ADD, [project, service], dict())
         return True
 
     def addModule(self, project, service, module):
         if project in self.data and service in self.data[project] and module in self.data[project][service]:
             return False
-        self.data[project][service][module] = dict()
-        self.save()
+        self._commit(const.JOURNAL_OP_ADD, [project, service, module], dict())
         return True
 
     def _convert_params(self, params):
@@ -133,14 +519,12 @@ class Storage(object):
     def addMethod(self, project, service, module, method, params):
         if self._has_method(project, service, module, method):
             return False
-        self.data[project][service][module][method] = self._convert_params(params)
-        self.save()
+        self._commit(const.JOURNAL_OP_ADD, [project, service, module, method], self._convert_params(params))
         return True
 
     def deleteMethod(self, project, service, module, method):
         if self._has_method(project, service, module, method):
-            del self.data[project][service][module][method]
-            self.save()
+            self._commit(const.JOURNAL_OP_DELETE, [project, service, module, method])
 
     def getParam(self, project, service, module, method):
         try:
@@ -149,9 +533,77 @@ class Storage(object):
             logging.exception(e)
             return collections.OrderedDict()
 
+    def getResultRef(self, project, service, module, method):
+        """
+        结果的引用，没有保存过结果时返回None
+        """
+        if self._has_method(project, service, module, method):
+            return self.data[project][service][module][method].get(const.RESULT_REF)
+        return None
+
+    def getResultText(self, project, service, module, method):
+        ref = self.getResultRef(project, service, module, method)
+        if ref:
+            try:
+                return self.blobs.getText(ref[const.BLOB_REF])
+            except Exception as e:
+                logging.exception(e)
+        return utils.objectToJsonStr(self.getResult(project, service, module, method))
+
     def getResult(self, project, service, module, method):
         try:
-            return self.data[project][service][module][method][const.RESULT]
+            methodDict = self.data[project][service][module][method]
+            if const.RESULT_REF in methodDict:
+                return self.blobs.get(methodDict[const.RESULT_REF][const.BLOB_REF])
+            return methodDict[const.RESULT]
         except Exception as e:
             logging.exception(e)
             return collections.OrderedDict()
+
+
+def getTreeRefs(data) -> set:
+    """
+    数据树里所有结果引用的sha256，包括历史结果
+    """
+    refs = set()
+    for projectDict in data.values():
+        for serviceDict in projectDict.values():
+            for moduleDict in serviceDict.values():
+                for methodDict in moduleDict.values():
+                    ref = methodDict.get(const.RESULT_REF)
+                    if ref:
+                        refs.add(ref[const.BLOB_REF])
+                    refs.update(ref[const.BLOB_REF] for ref in methodDict.get(const.RESULT_HISTORY, ()))
+    return refs
+
+
+def collectGarbage(storage, grace=const.BLOB_GC_GRACE) -> int:
+    """
+    标记清除结果目录：删除没有被引用的结果文件，返回删除的文件数。
+    namekoman.json和namekoman.db共用结果目录，另一个存在时它引用的结果也保留；
+    grace秒内写入的结果不删除，它们的引用可能还没有提交
+    """
+    before = time.time() - grace
+    live = storage.getLiveRefs()
+    base = os.path.splitext(storage.path)[0]
+    for path in (base + ".json", base + const.SQLITE_SUFFIX):
+        if path != storage.path and os.path.exists(path):
+            other = createStorage(path)
+            try:
+                other.loadData(readOnly=True)
+                live |= other.getLiveRefs()
+            finally:
+                other.close()
+    return storage.blobs.sweep(live, before)
+
+
+def createStorage(path):
+    """
+    根据文件后缀选择存储后端，.db使用SQLite，其它使用json。
+    两种后端的接口相同：loadData(readOnly=False)和getData()都返回同样结构的数据树
+    {project: {service: {module: {method: {params, result或result_ref, ...}}}}}
+    """
+    if path.endswith(const.SQLITE_SUFFIX):
+        from sqlitestorage import SqliteStorage
+        return SqliteStorage(path)
+    return Storage(path)
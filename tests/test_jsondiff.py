@@ -0,0 +1,63 @@
+# -*- coding:utf-8 -*-
+
+import unittest
+
+from jsondiff import ADDED, REMOVED, CHANGED, Digests, diff, compileIgnore
+
+
+class DigestsTest(unittest.TestCase):
+
+    def test_key_order(self):
+        old = {"a": [1, {"x": 1, "y": [2, 3]}], "b": {"c": None}}
+        new = {"b": {"c": None}, "a": [1, {"y": [2, 3], "x": 1}]}
+        digests = Digests()
+        self.assertEqual(digests.digest(old), digests.digest(new))
+        self.assertEqual(diff(old, new), [])
+
+    def test_types(self):
+        # json里1，1.0和True不同，结构相同的dict和list也不同
+        for old, new in (({"a": 1}, {"a": 1.0}), ([1], [True]), ({"a": {}}, {"a": []}), ([[]], [{}])):
+            self.assertNotEqual(Digests().digest(old), Digests().digest(new))
+            self.assertEqual(len(diff(old, new)), 1)
+
+    def test_each_node_once(self):
+        records = [{"id": i, "tags": ["a"], "address": {"city": "c", "lines": ["l"]}} for i in range(100)]
+        digests = Digests()
+        digests.digest({"data": records})
+        # 只有标量的节点不缓存，其它节点都已经计算
+        self.assertIn(id(records), digests.digests)
+        self.assertTrue(all(id(record) in digests.digests for record in records))
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_changes(self):
+        old = {"data": [{"id": i, "name": "n{}".format(i)} for i in range(100)], "code": 0}
+        new = {"msg": "ok", "data": [{"id": i, "name": "n{}".format(i)} for i in range(100)]}
+        new["data"][50]["name"] = "changed"
+        self.assertEqual(diff(old, new), [
+            (("data", 50, "name"), CHANGED, "n50", "changed"),
+            (("code",), REMOVED, 0, None),
+            (("msg",), ADDED, None, "ok"),
+        ])
+
+    def test_insert(self):
+        old = [{"id": i} for i in range(100)]
+        new = [{"id": i} for i in range(100)]
+        new.insert(10, {"id": -1})
+        self.assertEqual(diff(old, new), [((10,), ADDED, None, {"id": -1})])
+
+    def test_mixed_values(self):
+        old = [{"a": 1}, {"b": [1, {"c": 2}]}, [1, 2], "x", 3]
+        new = [{"a": 1}, {"b": [1, {"c": 3}]}, [1, 2], "x", 3]
+        self.assertEqual(diff(old, new), [((1, "b", 1, "c"), CHANGED, 2, 3)])
+
+    def test_limit_and_ignore(self):
+        old = {"data": [{"id": i, "time": i} for i in range(10)]}
+        new = {"data": [{"id": i, "time": i + 1} for i in range(10)]}
+        self.assertEqual(len(diff(old, new, limit=3)), 3)
+        self.assertEqual(diff(old, new, ignore=compileIgnore(["$.data[*].time"])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+
+import threading
+import unittest
+
+from dispatcher import createRpcClient
+
+
+class CreateRpcClientTest(unittest.TestCase):
+
+    def test_concurrent_brokers(self):
+        """
+        两个配置同时在不同线程创建客户端，每个客户端发送和接收回复都使用自己的broker
+        """
+        brokers = ["amqp://a:a@broker-a:5672//", "amqp://b:b@broker-b:5672//"]
+        clients = {}
+        barrier = threading.Barrier(len(brokers))
+
+        def create(broker):
+            barrier.wait()
+            for _ in range(20):
+                clients.setdefault(broker, []).append(createRpcClient(broker, 10))
+
+        threads = [threading.Thread(target=create, args=(broker,)) for broker in brokers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for broker in brokers:
+            self.assertEqual(len(clients[broker]), 20)
+            for client in clients[broker]:
+                self.assertEqual(client.cluster.amqp_uri, broker)
+                self.assertEqual(client.reply_listener.amqp_uri, broker)
+
+    def test_global_config_unchanged(self):
+        from nameko import config
+        before = dict(config)
+        createRpcClient("amqp://c:c@broker-c:5672//", 10)
+        self.assertEqual(dict(config), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
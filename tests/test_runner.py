@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import utils
+import runner
+import constants as const
+from storage import Storage
+
+
+class FakeClient(object):
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def call(self, service, method, params, timeout=None, isCancelled=None):
+        return {"service": service, "params": params}
+
+
+class RunnerWorkspaceTest(unittest.TestCase):
+    """
+    没有--store时不修改workspace
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "namekoman.json")
+        # 旧版本的结果保存在数据树里，正常加载时会移到结果目录并重写namekoman.json
+        data = {"p": {"s": {"m": {
+            "get": {const.PARAMS: {"id": 1}, const.RESULT: {"name": "old"}},
+        }}}}
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(utils.objectToJsonStr(data))
+        record = {const.JOURNAL_OP: const.JOURNAL_OP_PARAMS, const.JOURNAL_PATH: ["p", "s", "m", "get"],
+                  const.JOURNAL_VALUE: {"id": 2}}
+        with open(self.path + const.JOURNAL_SUFFIX, "w", encoding="utf-8") as f:
+            f.write(utils.objectToCompactJsonStr(record) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def workspaceState(self):
+        state = {}
+        for name in sorted(os.listdir(self.tmp)):
+            path = os.path.join(self.tmp, name)
+            with open(path, "rb") as f:
+                state[name] = (f.read(), os.stat(path).st_mtime_ns)
+        return state
+
+    def runMain(self, *args):
+        with mock.patch.object(runner, "createRpcClient", return_value=FakeClient()), \
+                mock.patch("sys.stdout"), mock.patch("sys.stderr"):
+            return runner.main(["-w", self.path] + list(args))
+
+    def test_list_unchanged(self):
+        before = self.workspaceState()
+        self.assertEqual(self.runMain("--list"), 0)
+        self.assertEqual(self.workspaceState(), before)
+
+    def test_run_unchanged(self):
+        before = self.workspaceState()
+        self.assertEqual(self.runMain("--results"), 0)
+        self.assertEqual(self.runMain(), 0)
+        self.assertEqual(self.workspaceState(), before)
+
+    def test_store(self):
+        self.assertEqual(self.runMain("--store"), 0)
+        s = Storage(self.path)
+        s.loadData(readOnly=True)
+        self.assertEqual(s.getResult("p", "s", "m", "get"), {"service": "s", "params": {"id": 2}})
+        self.assertEqual(len(s.getLatencyHistory("p", "s", "m", "get")), 1)
+        s.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
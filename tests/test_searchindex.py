@@ -0,0 +1,59 @@
+# -*- coding:utf-8 -*-
+
+import unittest
+
+from searchindex import SearchIndex
+
+DATA = {
+    "shop": {
+        "sales": {"api": {"get_order": {"params": {"id": 1}}, "list_users": {"params": {}}}},
+        "accounts": {"api": {"Login": {"params": {"name": "x"}}}},
+    },
+}
+
+
+def matchedMethods(index, text, withParams=False):
+    """
+    展开整个树，返回显示的method路径
+    """
+    result = index.search(text, withParams)
+    methods = []
+    stack = [((), result.rootRemaining())]
+    while stack:
+        path, remaining = stack.pop()
+        node = index.nodes[index.find(path)] if path else index.nodes[0]
+        for name, left in result.filterChildren(path, remaining, list(node[3])):
+            if len(path) == 3:
+                methods.append("/".join(path + (name,)))
+            else:
+                stack.append((path + (name,), left))
+    return sorted(methods)
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex.fromData(DATA)
+
+    def test_short_query_matches_substring(self):
+        # 一两个字符的token也匹配名字中的任意位置
+        self.assertEqual(matchedMethods(self.index, "or"), ["shop/sales/api/get_order"])
+        self.assertEqual(matchedMethods(self.index, "ord"), ["shop/sales/api/get_order"])
+        self.assertEqual(matchedMethods(self.index, "gi"), ["shop/accounts/api/Login"])
+        self.assertIn("get_order", self.index.matchTerms("r"))
+        self.assertEqual(self.index.matchTerms("zz"), set())
+
+    def test_tokens_and_params(self):
+        self.assertEqual(matchedMethods(self.index, "US li"), ["shop/sales/api/list_users"])
+        self.assertEqual(matchedMethods(self.index, "me", withParams=True), ["shop/accounts/api/Login"])
+
+    def test_incremental_update(self):
+        self.index.rename(("shop", "sales", "api", "get_order"), "fetch")
+        self.assertEqual(matchedMethods(self.index, "or"), [])
+        self.assertEqual(matchedMethods(self.index, "tc"), ["shop/sales/api/fetch"])
+        self.index.delete(("shop", "sales", "api", "fetch"))
+        self.assertEqual(self.index.matchTerms("tc"), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
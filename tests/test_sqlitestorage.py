@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import utils
+import constants as const
+from storage import createStorage
+from sqlitestorage import SqliteStorage, migrateFromJson
+
+
+class MigrateFromJsonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.jsonPath = os.path.join(self.tmp, "namekoman.json")
+        self.dbPath = os.path.join(self.tmp, "namekoman.db")
+        # 旧版本的结果直接保存在数据树里，操作日志里还有没合并的修改，最后一行写了一半
+        data = {"p": {"s": {"m": {
+            "get": {const.PARAMS: {"id": 1}, const.RESULT: {"name": "old"}},
+        }}}}
+        with open(self.jsonPath, "w", encoding="utf-8") as f:
+            f.write(utils.objectToJsonStr(data))
+        records = [
+            {const.JOURNAL_OP: const.JOURNAL_OP_PARAMS, const.JOURNAL_PATH: ["p", "s", "m", "get"],
+             const.JOURNAL_VALUE: {"id": 2}},
+            {const.JOURNAL_OP: const.JOURNAL_OP_ADD, const.JOURNAL_PATH: ["p", "s", "m", "list"],
+             const.JOURNAL_VALUE: {const.PARAMS: {"page": 1}}},
+        ]
+        with open(self.jsonPath + const.JOURNAL_SUFFIX, "w", encoding="utf-8") as f:
+            f.write("\n".join(utils.objectToCompactJsonStr(record) for record in records) + "\n{\"op\": ")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def fileState(self, path):
+        with open(path, "rb") as f:
+            return f.read(), os.stat(path).st_mtime_ns
+
+    def test_source_unchanged(self):
+        paths = [self.jsonPath, self.jsonPath + const.JOURNAL_SUFFIX]
+        before = [self.fileState(path) for path in paths]
+
+        self.assertEqual(migrateFromJson(self.jsonPath, self.dbPath), 2)
+
+        self.assertEqual([self.fileState(path) for path in paths], before)
+        self.assertFalse(os.path.exists(self.jsonPath + ".tmp"))
+        target = SqliteStorage(self.dbPath)
+        target.loadData()
+        self.assertEqual(target.getParam("p", "s", "m", "get"), {"id": 2})
+        self.assertEqual(target.getParam("p", "s", "m", "list"), {"page": 1})
+        self.assertEqual(target.getResult("p", "s", "m", "get"), {"name": "old"})
+        target.close()
+
+
+class LoadDataTest(unittest.TestCase):
+    """
+    两种后端的loadData返回同样结构的数据树
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def createData(self, name):
+        path = os.path.join(self.tmp, name)
+        if not path.endswith(const.SQLITE_SUFFIX):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("{}")
+        s = createStorage(path)
+        s.loadData()
+        s.addProject("p")
+        s.addService("p", "s")
+        s.addModule("p", "s", "m")
+        s.addMethod("p", "s", "m", "get", {"id": 1})
+        s.addMethod("p", "s", "m", "list", None)
+        s.updateParams("p", "s", "m", "list", {"page": 2})
+        for value in ("a", "b"):
+            ref = {const.BLOB_REF: value * 64, const.BLOB_SIZE: 1, const.BLOB_TIME: 1.0}
+            s.updateResultRef("p", "s", "m", "get", ref)
+        s.addLatencySample("p", "s", "m", "get", [1.0, 0.1, 10, True])
+        s.addLoadTestResult("p", "s", "m", "get", {"requests": 10})
+        s.close()
+
+        s = createStorage(path)
+        data = s.loadData()
+        self.assertEqual(s.getData(), data)
+        s.close()
+        return data
+
+    def test_same_shape(self):
+        data = self.createData("namekoman.json")
+        self.assertEqual(self.createData("namekoman.db"), data)
+        self.assertEqual(data["p"]["s"]["m"]["list"], {const.PARAMS: {"page": 2}, const.RESULT: {}})
+        self.assertEqual(len(data["p"]["s"]["m"]["get"][const.RESULT_HISTORY]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
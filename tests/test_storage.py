@@ -0,0 +1,277 @@
+# -*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import utils
+import runner
+import storage
+import constants as const
+from storage import Storage
+from sqlitestorage import SqliteStorage
+
+
+class StorageCompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "namekoman.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("{}")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_commit_not_blocked_by_compaction(self):
+        """
+        合并在锁外序列化，序列化期间ui线程的修改不需要等待
+        """
+        s = Storage(self.path)
+        s.loadData()
+        s.addProject("p")
+        s.flush()
+        started, release = threading.Event(), threading.Event()
+        dumps = utils.objectToJsonStr
+
+        def slowDumps(obj):
+            started.set()
+            release.wait(5)
+            return dumps(obj)
+
+        with mock.patch.object(storage.utils, "objectToJsonStr", side_effect=slowDumps):
+            s.save()
+            self.assertTrue(started.wait(5))
+            committed = threading.Event()
+            threading.Thread(target=lambda: (s.addService("p", "s"), committed.set())).start()
+            self.assertTrue(committed.wait(1))
+            release.set()
+            s.flush()
+        s.close()
+
+        # 序列化期间的修改使快照作废，重新序列化后包含这次修改，也不会重复写进操作日志
+        reloaded = Storage(self.path)
+        self.assertEqual(reloaded.loadData(), {"p": {"s": {}}})
+        self.assertFalse(os.path.exists(reloaded.journalPath))
+        reloaded.close()
+
+    def test_concurrent_commits_and_compaction(self):
+        s = Storage(self.path)
+        s.loadData()
+        s.addProject("p")
+        s.addService("p", "s")
+
+        def commit(module):
+            for i in range(200):
+                s.addModule("p", "s", "{}_{}".format(module, i))
+
+        threads = [threading.Thread(target=commit, args=(name,)) for name in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for _ in range(20):
+            s.save()
+            s.flush()
+        for thread in threads:
+            thread.join()
+        expected = utils.objectToJsonStr(s.getData())
+        s.close()
+
+        reloaded = Storage(self.path)
+        self.assertEqual(utils.objectToJsonStr(reloaded.loadData()), expected)
+        self.assertEqual(len(reloaded.getData()["p"]["s"]), 400)
+        reloaded.close()
+
+
+class StorageCompactCrashTest(unittest.TestCase):
+    """
+    合并中途退出后重新打开：已经合并的操作日志不能再重放，例如先把A改名为B再新建A，
+    重放时会用空的A覆盖，再把它改名为B，B原来的子节点丢失
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "namekoman.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(utils.objectToJsonStr({"A": {"svc": {}}}))
+        s = Storage(self.path)
+        s.loadData()
+        s.updateProjectName("A", "B")
+        s.addProject("A")
+        s.flush()
+        s.close()
+        self.expected = {"B": {"svc": {}}, "A": {}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def compactAndCrash(self, name):
+        """
+        合并时调用os.<name>时退出
+        """
+        s = Storage(self.path)
+        s.loadData()
+        # 直接在当前线程合并，不唤醒写线程
+        s.compactRequested = True
+        with mock.patch.object(storage.os, name, side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                s._write()
+        s.writer.stop()
+
+    def reload(self):
+        s = Storage(self.path)
+        data = s.loadData()
+        s.close()
+        return data
+
+    def test_crash_before_journal_removed(self):
+        self.compactAndCrash("remove")
+        self.assertEqual(self.reload(), self.expected)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        self.assertEqual(self.reload(), self.expected)
+
+    def test_crash_before_snapshot_replaced(self):
+        # 第一次os.replace是把操作日志改名
+        replace = os.replace
+        calls = []
+
+        def replaceOnce(src, dst):
+            calls.append(src)
+            if len(calls) > 1:
+                raise SystemExit
+            replace(src, dst)
+
+        s = Storage(self.path)
+        s.loadData()
+        s.compactRequested = True
+        with mock.patch.object(storage.os, "replace", side_effect=replaceOnce):
+            with self.assertRaises(SystemExit):
+                s._write()
+        s.writer.stop()
+        self.assertTrue(os.path.exists(self.path + ".tmp"))
+        self.assertEqual(self.reload(), self.expected)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_crash_before_journal_renamed(self):
+        # 临时文件写完，操作日志改名前退出
+        s = Storage(self.path)
+        s.loadData()
+        s.compactRequested = True
+        with mock.patch.object(storage.os, "replace", side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                s._write()
+        s.writer.stop()
+        self.assertTrue(os.path.exists(self.path + ".tmp"))
+        self.assertEqual(self.reload(), self.expected)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_read_only_after_crash(self):
+        self.compactAndCrash("remove")
+        s = Storage(self.path)
+        self.assertEqual(s.loadData(readOnly=True), self.expected)
+        s.close()
+        self.assertTrue(os.path.exists(s.compactedPath))
+
+
+class CollectGarbageTest(unittest.TestCase):
+    """
+    合并时删除没有被引用的结果文件：被覆盖后移出历史的结果，删除的method的结果
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "namekoman.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("{}")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def store(self, s, method, value):
+        ref = s.storeResultText(utils.objectToJsonStr({"value": value}))
+        s.updateResultRef("p", "s", "m", method, ref)
+        return ref[const.BLOB_REF]
+
+    def age(self, s, refs):
+        for ref in refs:
+            os.utime(s.blobs._path(ref), (0, 0))
+
+    def createStorage(self):
+        s = Storage(self.path)
+        s.loadData()
+        s.addProject("p")
+        s.addService("p", "s")
+        s.addModule("p", "s", "m")
+        s.addMethod("p", "s", "m", "get", None)
+        s.addMethod("p", "s", "m", "old", None)
+        return s
+
+    def test_compaction_removes_unreferenced_results(self):
+        s = self.createStorage()
+        refs = [self.store(s, "get", i) for i in range(const.RESULT_HISTORY_SIZE + 2)]
+        deleted = self.store(s, "old", "deleted")
+        s.deleteMethod("p", "s", "m", "old")
+        self.age(s, refs + [deleted])
+        recent = self.store(s, "get", 0)
+        self.store(s, "get", "recent")
+        # 写入后还没有提交引用的结果
+        pending = s.storeResultText("pending")[const.BLOB_REF]
+        s.save()
+        s.flush()
+
+        # 前三个结果先后移出了历史，第一个又被重新保存，不删除
+        self.assertEqual(recent, refs[0])
+        self.assertTrue(s.blobs.has(refs[0]))
+        self.assertEqual([s.blobs.has(ref) for ref in refs[1:3]], [False, False])
+        self.assertFalse(s.blobs.has(deleted))
+        self.assertTrue(s.blobs.has(pending))
+        self.assertTrue(all(s.blobs.has(ref) for ref in refs[3:]))
+        self.assertTrue(all(s.blobs.has(ref[const.BLOB_REF]) for ref in s.getResultHistory("p", "s", "m", "get")))
+        s.close()
+
+    def test_keep_results_of_sqlite_workspace(self):
+        """
+        namekoman.db和namekoman.json共用结果目录
+        """
+        db = SqliteStorage(os.path.join(self.tmp, "namekoman.db"))
+        db.addProject("p")
+        db.addService("p", "s")
+        db.addModule("p", "s", "m")
+        db.addMethod("p", "s", "m", "get", None)
+        shared = self.store(db, "get", "db")
+        db.close()
+
+        s = self.createStorage()
+        own = self.store(s, "get", "json")
+        self.store(s, "get", "json changed")
+        self.age(s, [shared, own])
+        self.assertEqual(storage.collectGarbage(s), 0)
+        s.deleteMethod("p", "s", "m", "get")
+        self.assertEqual(storage.collectGarbage(s), 1)
+        self.assertTrue(s.blobs.has(shared))
+        self.assertFalse(s.blobs.has(own))
+        s.close()
+
+    def test_gc_command(self):
+        dbPath = os.path.join(self.tmp, "namekoman.db")
+        db = SqliteStorage(dbPath)
+        db.addProject("p")
+        db.addService("p", "s")
+        db.addModule("p", "s", "m")
+        db.addMethod("p", "s", "m", "get", None)
+        refs = [self.store(db, "get", i) for i in range(const.RESULT_HISTORY_SIZE + 2)]
+        self.age(db, refs)
+        db.close()
+
+        with mock.patch("sys.stdout"):
+            self.assertEqual(runner.gcMain(["-w", dbPath]), 0)
+        db = SqliteStorage(dbPath)
+        self.assertFalse(db.blobs.has(refs[0]))
+        self.assertTrue(all(db.blobs.has(ref) for ref in refs[1:]))
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import json
+import collections
 
 
 def objectToJsonStr(obj) -> str:
@@ -10,13 +11,24 @@ def objectToJsonStr(obj) -> str:
                       )
 
 
+def objectToCompactJsonStr(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
 def strToJsonStr(s: str) -> str:
     try:
         return objectToJsonStr(json.loads(s))
     except:
-        return s.replace("'", '"').replace("：", ":")\
-            .replace("“", '"').replace("”", '"').replace("，", ",")\
-            .replace("【", "[").replace("】", "]")
+        return fixJsonPunctuation(s)
+
+
+def fixJsonPunctuation(s: str) -> str:
+    """
+    把单引号和中文标点替换成json的标点
+    """
+    return s.replace("'", '"').replace("：", ":")\
+        .replace("“", '"').replace("”", '"').replace("，", ",")\
+        .replace("【", "[").replace("】", "]")
 
 
 def errorToDict(errorStr: str) -> dict:
@@ -25,3 +37,24 @@ def errorToDict(errorStr: str) -> dict:
 
 def errorToJsonStr(errorStr: str) -> str:
     return objectToJsonStr(errorToDict(errorStr))
+
+
+class LRUCache(object):
+    """
+    最近最少使用缓存，超过容量时淘汰最久没有访问的数据
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.capacity:
+            self.data.popitem(last=False)